@@ -0,0 +1,82 @@
+"""
+Prebuilt knowledge artifacts for a fast cold start.
+
+Building the BM25 index and the signature index from the records is the bulk
+of the backend's warm-up. `python artifacts.py` builds both once (the
+Dockerfile runs it at image build time) and pickles them next to the knowledge
+base as `ecomet_kb.artifacts.pkl`; at startup they are unpickled instead of
+rebuilt. The file records the knowledge base version and a hash of the code
+that builds the indexes, and is ignored (and the indexes rebuilt) when either
+no longer matches.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+
+from knowledge import KnowledgeSource, write_atomic
+from retrieval import Retriever
+from signatures import SignatureIndex
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_SCHEMA = 1
+
+# The modules whose code shapes the pickled indexes
+BUILDERS = ("knowledge.py", "retrieval.py", "signatures.py")
+
+
+def artifacts_path(source):
+    base = source.records_path or source.text_path
+    return os.path.splitext(base)[0] + ".artifacts.pkl" if base else None
+
+
+def code_version():
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in BUILDERS:
+        with open(os.path.join(here, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def build(kb):
+    return Retriever.from_records(kb.records()), SignatureIndex.from_records(kb.records())
+
+
+def load(path, kb):
+    """(retriever, signatures) for this knowledge base version, or None if there is no usable artifact."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            artifact = pickle.load(f)
+    except Exception:
+        logger.warning("Ignoring unreadable knowledge artifact %s", path, exc_info=True)
+        return None
+    if (artifact.get("schema"), artifact.get("version"), artifact.get("code")) != (ARTIFACT_SCHEMA, kb.version, code_version()):
+        return None
+    return artifact["retriever"], artifact["signatures"]
+
+
+def save(path, kb, retriever, signatures):
+    artifact = {
+        "schema": ARTIFACT_SCHEMA,
+        "version": kb.version,
+        "code": code_version(),
+        "retriever": retriever,
+        "signatures": signatures,
+    }
+    write_atomic(path, lambda f: pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+if __name__ == "__main__":
+    source = KnowledgeSource()
+    path = artifacts_path(source)
+    if path is None:
+        raise SystemExit("No knowledge base found")
+    kb = source.load()
+    retriever, signatures = build(kb)
+    save(path, kb, retriever, signatures)
+    print(f"Wrote {path}: version {kb.version}, {len(retriever.chunks)} chunks, {len(signatures)} signatures")
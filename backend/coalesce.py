@@ -0,0 +1,139 @@
+"""
+Sharing work between concurrent requests.
+
+`SingleFlight` lets identical requests that arrive while one is already being
+answered wait for that answer instead of making their own upstream call.
+`MicroBatcher` holds calls for a short window and runs them together in a
+worker thread, computing each distinct input once.
+"""
+
+import asyncio
+import time
+
+from metrics import BATCH_SIZE, BATCH_WAIT_SECONDS, COALESCE_WAIT_SECONDS, COALESCED
+
+
+def _consume(future):
+    # Followers may all have gone away; don't warn about an unread exception
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._calls = {}
+
+    def follow(self, key):
+        """The in-flight call for `key`, or None if there is none to join."""
+        call = self._calls.get(key)
+        if call is not None:
+            self.followers += 1
+            COALESCED.inc()
+        return call
+
+    def lead(self, key):
+        """Register a call whose result the caller will publish with `finish`."""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume)
+        self._calls[key] = future
+        self.leaders += 1
+        return future
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def finish(self, key, future, result=None, error=None):
+        self._forget(key, future)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def wait(self, call):
+        start = time.perf_counter()
+        try:
+            # Shielded so one waiter giving up doesn't cancel the shared call
+            return await asyncio.shield(call)
+        finally:
+            COALESCE_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    async def run(self, key, fn):
+        """Await `fn()`, or the identical call already in flight for `key`."""
+        call = self.follow(key)
+        if call is not None:
+            return await self.wait(call)
+
+        # Run as its own task so the result still reaches followers if the leader is cancelled
+        task = asyncio.ensure_future(fn())
+        task.add_done_callback(_consume)
+        self._calls[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    def stats(self):
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_rate": round(self.followers / total, 3) if total else 0.0,
+        }
+
+
+class MicroBatcher:
+    """
+    Collect `submit(item)` calls for up to `window` seconds (or `max_batch`
+    items) and run `fn` on each distinct item in one worker-thread hop.
+    With `window=0` calls run inline with no added wait.
+    """
+
+    def __init__(self, fn, window=0.0, max_batch=32):
+        self.fn = fn
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, item):
+        if self.window <= 0:
+            return self.fn(item)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        now = time.perf_counter()
+        BATCH_SIZE.observe(len(batch))
+        for _, _, queued in batch:
+            BATCH_WAIT_SECONDS.observe(now - queued)
+
+        distinct = list(dict.fromkeys(item for item, _, _ in batch))
+        try:
+            results = await asyncio.to_thread(lambda: {item: self.fn(item) for item in distinct})
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for item, future, _ in batch:
+            if not future.done():
+                future.set_result(results[item])
@@ -0,0 +1,95 @@
+"""
+Provider-side context caching of the static prompt prefix.
+
+The persona and the full knowledge base are registered once with Gemini as a
+CachedContent with a TTL; later requests only send the user turn. The cache is
+re-created when the system prompt or knowledge base version changes, or when
+it is about to expire. A request that took the knowledge base before a hot
+reload is served from the current version's cache (given by `current`)
+instead of switching the cache back to its own version.
+"""
+
+import asyncio
+import hashlib
+import time
+from datetime import timedelta
+
+
+class ContextCache:
+    def __init__(self, ttl_seconds=3600, refresh_margin=60, current=None):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.current = current  # returns the knowledge base now being served
+        self.stale = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.cached_tokens = 0
+        self._key = None
+        self._expires_at = 0.0
+        self._cached = None
+        self._model = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self, key):
+        return self._model is not None and key == self._key and time.time() < self._expires_at - self.refresh_margin
+
+    async def model(self, model_name, system_prompt, knowledge):
+        """Return a model bound to the cached prefix, creating the cache on a miss."""
+        latest = self.current() if self.current is not None else knowledge
+        if latest.version != knowledge.version:
+            self.stale += 1
+            knowledge = latest
+        key = (model_name, hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(), knowledge.version)
+        if self._fresh(key):
+            self.hits += 1
+            return self._model
+
+        # Only one request re-creates the cache; the rest wait and then hit it
+        async with self._lock:
+            if self._fresh(key):
+                self.hits += 1
+                return self._model
+            self.misses += 1
+            import google.generativeai as genai
+            from google.generativeai import caching
+
+            try:
+                cached = await asyncio.to_thread(
+                    caching.CachedContent.create,
+                    model=model_name,
+                    display_name=f"ecomet-{knowledge.version}",
+                    system_instruction=system_prompt,
+                    contents=[knowledge.text],
+                    ttl=timedelta(seconds=self.ttl_seconds),
+                )
+            except Exception:
+                self.errors += 1
+                raise
+
+            previous = self._cached
+            self._cached = cached
+            self._model = genai.GenerativeModel.from_cached_content(cached)
+            self._key = key
+            self._expires_at = time.time() + self.ttl_seconds
+            self.cached_tokens = getattr(cached.usage_metadata, "total_token_count", 0)
+            if previous is not None:
+                # Best effort: an old cache would otherwise linger (and bill) until its TTL
+                try:
+                    await asyncio.to_thread(previous.delete)
+                except Exception:
+                    pass
+            return self._model
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "cached_tokens": self.cached_tokens,
+            "input_tokens_saved": self.hits * self.cached_tokens,
+            "ttl_seconds": self.ttl_seconds,
+            "stale_version_requests": self.stale,
+        }
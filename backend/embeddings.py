@@ -0,0 +1,272 @@
+"""
+Semantic search over the knowledge base chunks.
+
+Users often describe what they want ("compare diversity between treatments")
+instead of naming the function (GetBetaDiversity), and BM25 only matches the
+words they share. Here every retrieval chunk is embedded once, offline, as a
+unit vector. A query is embedded the same way and scored against all chunks
+with one matrix-vector product (cosine similarity), and the Retriever fuses
+that ranking with BM25's.
+
+There are two embedders:
+- "hashing": signed feature hashing of word tokens and their character
+  n-grams. It needs nothing but NumPy and has no model to download. It
+  catches shared stems and identifier parts ("diversity" in GetBetaDiversity)
+  but not synonyms.
+- a sentence-transformers model name, e.g.
+  `sentence-transformers/all-MiniLM-L6-v2`. It runs on CPU and needs
+  `pip install sentence-transformers` plus the model in the local cache.
+  If the package is missing, the hashing embedder is used instead.
+
+The vectors are stored next to the knowledge base. The float32 matrix goes in
+`ecomet_kb.vectors-<digest>.npy`, which is opened memory-mapped. Alongside it,
+`ecomet_kb.vectors.json` records the embedder, the matrix file and the
+content hash of the chunk each row embeds. When the knowledge base changes
+(the weekly scrape), only chunks with a new hash are embedded; the other rows
+are copied from the previous matrix. `python embeddings.py` builds the
+vectors ahead of time (the Dockerfile runs it).
+
+NumPy is imported on first use rather than at module load, so it is paid for
+during warm-up instead of in the server's import time.
+"""
+
+import glob
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import threading
+import zlib
+
+from knowledge import write_atomic
+from retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+VECTORS_SCHEMA = 1
+HASHING_DIM = 1024
+NGRAM = 4
+
+
+def chunk_text(chunk):
+    return f"{chunk.title}\n{chunk.text}"
+
+
+def chunk_hash(chunk):
+    return hashlib.sha256(chunk_text(chunk).encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize(matrix):
+    import numpy as np
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+class HashingEmbedder:
+    """Word tokens and their character n-grams hashed into a fixed-size signed vector."""
+
+    def __init__(self, dim=HASHING_DIM, ngram=NGRAM):
+        self.dim = dim
+        self.ngram = ngram
+        self.name = f"hashing-{dim}-{ngram}"
+
+    def _features(self, text):
+        for token in tokenize(text):
+            yield token, 1.0
+            # N-grams of the padded token, so "diverse" and "diversity" share most features
+            padded = f"<{token}>"
+            for i in range(len(padded) - self.ngram + 1):
+                yield padded[i:i + self.ngram], 0.5
+
+    def embed(self, texts):
+        import numpy as np
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in zip(matrix, texts):
+            for feature, weight in self._features(text):
+                # crc32, not hash(): vectors are stored and must match across processes
+                h = zlib.crc32(feature.encode("utf-8"))
+                row[h % self.dim] += weight if h & 0x80000000 else -weight
+        # Dampen repeated terms so long chunks aren't dominated by their most frequent words
+        return _normalize(np.sign(matrix) * np.log1p(np.abs(matrix)))
+
+    def query_weights(self, matrix):
+        """IDF of each hash bucket over the stored chunks, applied to queries only so stored rows stay reusable."""
+        import numpy as np
+
+        df = np.count_nonzero(matrix, axis=0)
+        return (np.log((len(matrix) + 1) / (df + 1)) + 1).astype(np.float32)
+
+
+class SentenceEmbedder:
+    """A sentence-transformers model on CPU, loaded on first use."""
+
+    def __init__(self, model_name):
+        self.name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    self._model = SentenceTransformer(self.name, device="cpu")
+        vectors = self._model.encode(list(texts), batch_size=32, convert_to_numpy=True, normalize_embeddings=True)
+        return vectors.astype("float32")
+
+    def query_weights(self, matrix):
+        return None
+
+
+def get_embedder(spec=None):
+    """Embedder named by EMBEDDINGS: "hashing" (default), "off", or a sentence-transformers model name."""
+    spec = (spec if spec is not None else os.getenv("EMBEDDINGS", "hashing")).strip()
+    if spec in ("", "off", "0"):
+        return None
+    if spec == "hashing":
+        return HashingEmbedder()
+    if importlib.util.find_spec("sentence_transformers") is None:
+        logger.warning("EMBEDDINGS=%s needs `pip install sentence-transformers`; using the hashing embedder", spec)
+        return HashingEmbedder()
+    return SentenceEmbedder(spec)
+
+
+class SemanticIndex:
+    """Unit vectors for a retriever's chunks, row i embedding chunk i."""
+
+    def __init__(self, embedder, matrix, hashes, embedded=0):
+        self.embedder = embedder
+        self.matrix = matrix
+        self.hashes = hashes
+        self.embedded = embedded  # rows embedded when this index was built; the rest were reused
+        self._weights = None
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @classmethod
+    def build(cls, embedder, chunks, previous=None):
+        """Embed `chunks`, copying rows for unchanged chunks from `previous` (same embedder) instead of re-embedding them."""
+        import numpy as np
+
+        hashes = [chunk_hash(c) for c in chunks]
+        reusable = {}
+        if previous is not None and previous.embedder.name == embedder.name:
+            if previous.hashes == hashes:
+                return previous
+            reusable = {h: row for row, h in enumerate(previous.hashes)}
+        missing = [i for i, h in enumerate(hashes) if h not in reusable]
+        fresh = embedder.embed([chunk_text(chunks[i]) for i in missing]) if missing else None
+        dim = fresh.shape[1] if fresh is not None else (previous.matrix.shape[1] if previous is not None else 0)
+        matrix = np.empty((len(chunks), dim), dtype=np.float32)
+        for row, h in enumerate(hashes):
+            if h in reusable:
+                matrix[row] = previous.matrix[reusable[h]]
+        if missing:
+            matrix[missing] = fresh
+        return cls(embedder, matrix, hashes, embedded=len(missing))
+
+    def search(self, query, top_k=5):
+        """(chunk id, score) of the top_k chunks by cosine similarity, best first."""
+        import numpy as np
+
+        if not self.hashes or top_k <= 0:
+            return []
+        if self._weights is None:
+            self._weights = self.embedder.query_weights(self.matrix)
+        vector = self.embedder.embed([query])[0]
+        if self._weights is not None:
+            vector = vector * self._weights
+        # Rows are unit vectors, so ranking by dot product is ranking by cosine similarity
+        scores = self.matrix @ vector
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        # Best first, ties by chunk id so results are deterministic
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def digest(self):
+        return hashlib.sha256("\n".join([self.embedder.name, *self.hashes]).encode()).hexdigest()[:12]
+
+    def save(self, path):
+        """Write the matrix under a content-named file, then point the metadata at it."""
+        import numpy as np
+
+        stem = path[: -len(".json")]
+        matrix_path = f"{stem}-{self.digest()}.npy"
+        if not os.path.exists(matrix_path):
+            write_atomic(matrix_path, lambda f: np.save(f, np.ascontiguousarray(self.matrix)))
+        meta = {
+            "schema": VECTORS_SCHEMA,
+            "embedder": self.embedder.name,
+            "matrix": os.path.basename(matrix_path),
+            "hashes": self.hashes,
+        }
+        write_atomic(path, lambda f: f.write(json.dumps(meta).encode("utf-8")))
+        # Other workers may still have an old matrix mapped; unlinking it doesn't disturb them
+        for old in glob.glob(glob.escape(stem) + "-*.npy"):
+            if old != matrix_path:
+                try:
+                    os.unlink(old)
+                except OSError:
+                    pass
+
+
+def vectors_path(source):
+    base = source.records_path or source.text_path
+    return os.path.splitext(base)[0] + ".vectors.json" if base else None
+
+
+def load(path, embedder):
+    """The stored index if it was built by this embedder, memory-mapped; None otherwise."""
+    import numpy as np
+
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta.get("schema"), meta.get("embedder")) != (VECTORS_SCHEMA, embedder.name):
+            return None
+        hashes = meta["hashes"]
+        matrix = np.load(os.path.join(os.path.dirname(path), meta["matrix"]), mmap_mode="r")
+    except (OSError, ValueError, KeyError):
+        logger.warning("Ignoring unreadable vectors %s", path, exc_info=True)
+        return None
+    if matrix.ndim != 2 or matrix.shape[0] != len(hashes):
+        return None
+    return SemanticIndex(embedder, matrix, hashes)
+
+
+def load_or_build(path, embedder, chunks):
+    """Index for `chunks`, embedding only what changed since the stored vectors and saving the result."""
+    previous = load(path, embedder)
+    index = SemanticIndex.build(embedder, chunks, previous)
+    if path is not None and index is not previous:
+        try:
+            index.save(path)
+        except OSError:
+            # Search works from the matrix in memory; only the next start pays for embedding again
+            logger.warning("Could not write vectors %s", path, exc_info=True)
+    return index
+
+
+if __name__ == "__main__":
+    from knowledge import KnowledgeSource
+    from retrieval import Retriever
+
+    embedder = get_embedder()
+    if embedder is None:
+        raise SystemExit("EMBEDDINGS is off")
+    source = KnowledgeSource()
+    path = vectors_path(source)
+    if path is None:
+        raise SystemExit("No knowledge base found")
+    chunks = Retriever.from_records(source.load().records()).chunks
+    index = load_or_build(path, embedder, chunks)
+    print(f"{path}: {embedder.name}, {len(index)} chunks ({index.embedded} embedded, "
+          f"{len(index) - index.embedded} reused)")
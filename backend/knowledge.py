@@ -0,0 +1,431 @@
+"""
+The eCOMET knowledge base.
+
+The scrapers emit a structured, versioned artifact: `ecomet_kb.jsonl` holds one
+JSON record per reference page, article or R function, and
+`ecomet_kb.index.json` holds the schema version, a content version and, per
+record, its metadata plus the byte offset of its line in the JSONL file. The
+backend loads only the index at startup and reads records on demand through a
+memory map. The older flat `ecomet_reference_full.txt` is still understood as a
+fallback.
+"""
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import tempfile
+from datetime import datetime
+
+SCHEMA_VERSION = 1
+
+KB_FILENAME = "ecomet_reference_full.txt"
+KB_RECORDS_FILENAME = "ecomet_kb.jsonl"
+
+# The Dockerfile copies the knowledge base next to main.py; locally it sits in the repo root
+KB_DIRS = ["..", "."]
+
+# Rough chars-per-token ratio for Gemini models on English text / R code
+CHARS_PER_TOKEN = 4
+
+GITHUB_BLOB_URL = "https://github.com/Phytoecia/eCOMET/blob/main"
+
+RULE_RE = re.compile(r"^[=#]{10,}$")
+SOURCE_RE = re.compile(r"^(?:Source|URL):\s*(\S+)")
+R_FUNCTION_RE = re.compile(r"^([A-Za-z_.][A-Za-z0-9_.]*)\s*(?:<-|=)\s*function\b")
+ROXYGEN_TAG_RE = re.compile(r"^#'\s*@(\w+)\s*(.*)")
+
+RECORD_FIELDS = ("description", "usage", "arguments", "examples", "content")
+
+
+def estimate_tokens(text):
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def find_file(filename):
+    for directory in KB_DIRS:
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def index_path(records_path):
+    return os.path.splitext(records_path)[0] + ".index.json"
+
+
+# ---------------------------------------------------------------------------
+# Records
+# ---------------------------------------------------------------------------
+
+def content_hash(record):
+    """Hash of the record body only, so the same function scraped twice dedups."""
+    body = "\x00".join(record.get(field, "") for field in RECORD_FIELDS)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+
+
+def make_record(kind, title, source_url, record_id=None, origin="", **fields):
+    """Build a record; `fields` are any of RECORD_FIELDS."""
+    record = {
+        "id": record_id or source_url or title,
+        "kind": kind,  # "reference", "article" or "source"
+        "title": title,
+        "source_url": source_url,
+        "origin": origin,
+    }
+    for field in RECORD_FIELDS:
+        record[field] = (fields.get(field) or "").strip()
+    record["tokens"] = estimate_tokens(record_body(record))
+    record["content_hash"] = content_hash(record)
+    return record
+
+
+def record_body(record):
+    """Render a record's fields as prompt text (without its title header)."""
+    if record.get("kind") == "source":
+        # The code block already carries the roxygen docs the fields were parsed from
+        return record.get("content", "")
+    parts = []
+    if record.get("description"):
+        parts.append(record["description"])
+    if record.get("usage"):
+        parts.append(f"Usage:\n```r\n{record['usage']}\n```")
+    if record.get("arguments"):
+        parts.append(f"Arguments:\n{record['arguments']}")
+    if record.get("examples"):
+        parts.append(f"Examples:\n```r\n{record['examples']}\n```")
+    if record.get("content"):
+        parts.append(record["content"])
+    return "\n\n".join(parts)
+
+
+def render_record(record):
+    header = f"## {record['title']}"
+    if record.get("source_url"):
+        header += f"\nSource: {record['source_url']}"
+    return f"{header}\n{record_body(record)}"
+
+
+def doc_kind(url):
+    return "reference" if "/reference/" in url and not url.endswith("/reference/index.html") else "article"
+
+
+# ---------------------------------------------------------------------------
+# Parsing the flat text format and R source
+# ---------------------------------------------------------------------------
+
+def split_sections(text):
+    """Split the flat knowledge base into (title, source, body lines) on its `## ` headers."""
+    sections = []
+    title, source, body = None, "", []
+    prev = ""
+    for line in text.splitlines():
+        stripped = line.strip()
+        # A real section header follows a blank line or a ==== rule; a `## ` line
+        # inside page content (e.g. an R comment in an example) does not.
+        if line.startswith("## ") and (not prev or RULE_RE.match(prev)):
+            if title is not None:
+                sections.append((title, source, body))
+            title, source, body = line[3:].strip(), "", []
+        elif title is not None:
+            match = SOURCE_RE.match(stripped)
+            if match and not source and not any(b.strip() for b in body):
+                source = match.group(1)
+            elif not RULE_RE.match(stripped):
+                body.append(line)
+        prev = stripped
+    if title is not None:
+        sections.append((title, source, body))
+    return sections
+
+
+def split_r_source(lines):
+    """Split an R file into blocks that each start at a roxygen comment or function definition."""
+    blocks, current = [], []
+    in_roxygen = False
+    for line in lines:
+        starts_roxygen = line.startswith("#'") and not in_roxygen
+        starts_function = R_FUNCTION_RE.match(line) and not in_roxygen
+        if (starts_roxygen or starts_function) and any(l.strip() for l in current):
+            blocks.append(current)
+            current = []
+        current.append(line)
+        in_roxygen = line.startswith("#'")
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def _signature(lines, start):
+    """The function definition from `start` up to its opening brace, with balanced parentheses."""
+    depth, out = 0, []
+    for line in lines[start:]:
+        out.append(line)
+        depth += line.count("(") - line.count(")")
+        if depth <= 0:
+            break
+    signature = "\n".join(out).rstrip()
+    return re.sub(r"\s*\{\s*$", "", signature)
+
+
+def parse_r_block(lines):
+    """Pull name, description, usage, @param arguments and examples out of one roxygen+function block."""
+    name, usage = None, ""
+    for i, line in enumerate(lines):
+        match = R_FUNCTION_RE.match(line)
+        if match:
+            name = match.group(1)
+            usage = _signature(lines, i)
+            break
+
+    description, params, examples = [], [], []
+    tag = None
+    for line in lines:
+        if not line.startswith("#'"):
+            continue
+        match = ROXYGEN_TAG_RE.match(line)
+        if match:
+            tag, rest = match.group(1), match.group(2)
+            if tag == "param":
+                params.append(rest)
+            elif tag == "description" and rest:
+                description.append(rest)
+            continue
+        text = line[2:].strip()
+        if tag is None or tag == "description":
+            if text:
+                description.append(text)
+        elif tag == "param" and text:
+            params[-1] += " " + text
+        elif tag in ("examples", "examplesIf"):
+            examples.append(line[3:] if line.startswith("#' ") else line[2:])
+
+    return {
+        "name": name,
+        "description": " ".join(description),
+        "usage": usage,
+        "arguments": "\n".join(f"- {p}" for p in params),
+        "examples": "\n".join(examples).strip(),
+    }
+
+
+def r_source_records(path, lines, origin=""):
+    """One record per function (with its roxygen docs) in an R file."""
+    records, seen = [], {}
+    lines = [l for l in lines if not l.startswith("```")]
+    for block in split_r_source(lines):
+        code = "\n".join(block).strip()
+        if not code:
+            continue
+        parsed = parse_r_block(block)
+        name = parsed["name"] or "top-level code"
+        seen[name] = seen.get(name, 0) + 1
+        suffix = f"-{seen[name]}" if seen[name] > 1 else ""
+        records.append(make_record(
+            "source", name, f"{GITHUB_BLOB_URL}/{path}",
+            record_id=f"{path}#{name}{suffix}", origin=origin,
+            description=parsed["description"], usage=parsed["usage"],
+            arguments=parsed["arguments"], examples=parsed["examples"],
+            content=code,
+        ))
+    return records
+
+
+def records_from_text(text, origin="scrape_ecomet"):
+    """Convert the flat knowledge base text into records."""
+    records = []
+    for title, source, body in split_sections(text):
+        if title.startswith("R/"):
+            records.extend(r_source_records(title, body, origin))
+        elif title in ("DESCRIPTION", "NAMESPACE"):
+            content = "\n".join(l for l in body if not l.startswith("```"))
+            records.append(make_record("source", title, f"{GITHUB_BLOB_URL}/{title}", origin=origin, content=content))
+        else:
+            records.append(make_record(doc_kind(source), title, source, origin=origin, content="\n".join(body)))
+    return records
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def _read_records(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_atomic(path, dump, binary=True):
+    """
+    Write `path` through `dump(file)` into a temporary file, then rename it
+    into place, so a concurrent reader (another worker) sees the old file or
+    the new one, never a partial one.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") if binary else os.fdopen(fd, "w", encoding="utf-8") as f:
+            dump(f)
+        # mkstemp creates the file owner-only; the server may run as another user than the build
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_knowledge_base(records, path=KB_RECORDS_FILENAME, origin=None):
+    """
+    Write records and their index, replacing whatever `origin` wrote before.
+
+    Records from other origins (the other scraper) are kept, except where a
+    new record has the same id or content hash: the new one wins, so a page
+    both scrapers cover follows whichever ran last. Returns the new version.
+    """
+    records = list(records)
+    kept = [r for r in _read_records(path) if r.get("origin") != origin] if origin is not None else []
+
+    winners, hashes, ids = set(), set(), set()
+    for record in records + kept:
+        if record["content_hash"] in hashes or record["id"] in ids:
+            continue
+        hashes.add(record["content_hash"])
+        ids.add(record["id"])
+        winners.add(id(record))
+    # Kept records stay ahead of the new ones, so rewriting the same content keeps the same version
+    unique = [r for r in kept + records if id(r) in winners]
+
+    entries, offset = [], 0
+    lines = []
+    for record in unique:
+        line = (json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n").encode("utf-8")
+        entries.append({
+            "id": record["id"],
+            "kind": record["kind"],
+            "title": record["title"],
+            "source_url": record["source_url"],
+            "tokens": record["tokens"],
+            "content_hash": record["content_hash"],
+            "offset": offset,
+            "length": len(line),
+        })
+        lines.append(line)
+        offset += len(line)
+
+    version = hashlib.sha256("".join(e["content_hash"] for e in entries).encode()).hexdigest()[:12]
+    index = {
+        "schema": SCHEMA_VERSION,
+        "version": version,
+        "generated_at": datetime.now().isoformat(),
+        "records": entries,
+    }
+
+    # Records first, index last: a reader that sees the new index also sees the new records
+    write_atomic(path, lambda f: f.writelines(lines))
+    write_atomic(index_path(path), lambda f: json.dump(index, f, ensure_ascii=False, indent=1), binary=False)
+    return version
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+class KnowledgeBase:
+    """One immutable version of the knowledge base; records are read lazily."""
+
+    def __init__(self, version, entries, mapped=None, records=None):
+        self.version = version
+        self.entries = entries
+        self._by_id = {entry["id"]: i for i, entry in enumerate(entries)}
+        self._mapped = mapped
+        self._records = records
+        self._text = None
+
+    @classmethod
+    def load(cls, records_path):
+        with open(index_path(records_path), encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("schema") != SCHEMA_VERSION:
+            raise ValueError(f"Unsupported knowledge base schema {index.get('schema')}")
+        mapped = None
+        if os.path.getsize(records_path):
+            with open(records_path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(index["version"], index["records"], mapped=mapped)
+
+    @classmethod
+    def from_text(cls, text):
+        records = records_from_text(text)
+        entries = [{k: r[k] for k in ("id", "kind", "title", "source_url", "tokens", "content_hash")} for r in records]
+        version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        return cls(version, entries, records=records)
+
+    @classmethod
+    def empty(cls):
+        return cls("none", [], records=[])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, i):
+        if self._records is not None:
+            return self._records[i]
+        entry = self.entries[i]
+        return json.loads(self._mapped[entry["offset"]:entry["offset"] + entry["length"]])
+
+    def get(self, record_id):
+        i = self._by_id.get(record_id)
+        return None if i is None else self.record(i)
+
+    def records(self, kind=None):
+        for i, entry in enumerate(self.entries):
+            if kind is None or entry["kind"] == kind:
+                yield self.record(i)
+
+    @property
+    def text(self):
+        """The whole knowledge base rendered as one document (only built if asked for)."""
+        if self._text is None:
+            self._text = "\n\n".join(render_record(r) for r in self.records()) or "No eCOMET documentation found."
+        return self._text
+
+
+class KnowledgeSource:
+    """Locates the knowledge base on disk, loads it and tells when it has changed."""
+
+    def __init__(self, records_path=None, text_path=None):
+        self.records_path = records_path or find_file(KB_RECORDS_FILENAME)
+        self.text_path = text_path or find_file(KB_FILENAME)
+        self._mtime = None
+
+    def _watched(self):
+        if self.records_path and os.path.exists(index_path(self.records_path)):
+            return index_path(self.records_path)
+        return self.text_path
+
+    def _stat(self):
+        path = self._watched()
+        try:
+            return path, os.stat(path).st_mtime_ns if path else None
+        except FileNotFoundError:
+            return path, None
+
+    def changed(self):
+        """Cheap check (one stat) for whether the file differs from what was last loaded."""
+        _path, mtime = self._stat()
+        return mtime is not None and mtime != self._mtime
+
+    def load(self):
+        """Read the current knowledge base from disk as a new KnowledgeBase."""
+        path, mtime = self._stat()
+        if mtime is None:
+            return KnowledgeBase.empty()
+        if path == self.text_path:
+            with open(path, "r", encoding="utf-8") as f:
+                kb = KnowledgeBase.from_text(f.read())
+        else:
+            kb = KnowledgeBase.load(self.records_path)
+        self._mtime = mtime
+        return kb
@@ -0,0 +1,254 @@
+"""
+Admission control for /chat.
+
+At most `limit` generations run at once and at most `max_queue` requests wait
+for a slot; anything beyond that is rejected immediately so overload turns into
+fast 503s instead of an unbounded pile-up.
+
+In front of that, `RateLimiter` keeps two kinds of token bucket in the shared
+state, so every worker enforces the same budget: one per client (IP or
+session) for requests, and one for the estimated prompt tokens sent upstream
+per minute. Both are checked before any prompt is assembled. The settings live
+in the shared state too, so a change made through the admin endpoint reaches
+every worker on its next request.
+"""
+
+import asyncio
+import json
+import logging
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, fields, replace
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class RateLimited(Exception):
+    """`scope` is "client" (this client is over its rate) or "upstream" (the shared token budget is spent)."""
+
+    def __init__(self, message, scope, retry_after):
+        super().__init__(message)
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def client_address(peer, forwarded=(), trusted_proxies=0):
+    """
+    The client's address for rate limiting.
+
+    Each reverse proxy appends the address it received the request from to
+    X-Forwarded-For, so behind `trusted_proxies` of them the client is that
+    many entries from the right. Entries further left came from the client
+    and can be forged. `forwarded` is the header's values in order.
+    """
+    if trusted_proxies > 0:
+        hops = [hop.strip() for value in forwarded for hop in value.split(",") if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return peer or "unknown"
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit, max_queue, queue_timeout=30.0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        # Futures of waiting requests, first come first served
+        self._waiters = deque()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("Too many requests in flight")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # asyncio.wait (unlike wait_for) never cancels the waiter, so a slot handed over at the deadline isn't lost
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            self.rejected += 1
+            raise Overloaded("Timed out waiting for a free slot")
+
+    def _abandon(self, waiter):
+        if waiter.done():
+            # The slot was handed over just as the request gave up; pass it on
+            self.release()
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def _wake(self):
+        while self._waiters and self.active < self.limit:
+            self._waiters.popleft().set_result(None)
+            self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def resize(self, limit, max_queue=None):
+        """Change the limits in place; shrinking lets in-flight calls finish."""
+        self.limit = limit
+        if max_queue is not None:
+            self.max_queue = max_queue
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+def _coerce(name, kind, value):
+    """`value` as the field's type (JSON may carry 20 as "20" or 20.0); ValueError if it isn't one."""
+    if kind is str:
+        if not isinstance(value, str):
+            raise ValueError(f"{name} must be a string")
+        return value
+    try:
+        # bool is an int to Python, but never a limit
+        number = float(value) if not isinstance(value, bool) else None
+    except (TypeError, ValueError):
+        number = None
+    if number is None or not math.isfinite(number):
+        raise ValueError(f"{name} must be a number")
+    if kind is int:
+        if not number.is_integer():
+            raise ValueError(f"{name} must be a whole number")
+        return int(number)
+    return number
+
+
+# Enforced by each worker's own ConcurrencyLimiter; every other limit is one budget shared by all workers
+PER_WORKER_LIMITS = ("max_concurrency", "max_queue")
+
+
+@dataclass(frozen=True)
+class LimitSettings:
+    requests_per_minute: float = 20  # per client; 0 disables
+    burst: int = 10  # requests a client may send at once before the rate applies
+    key: str = "ip"  # "ip", or "session" to key on session_id when one is sent
+    upstream_tokens_per_minute: int = 250000  # estimated prompt tokens; 0 disables
+    max_concurrency: int = 8  # model calls in flight per worker
+    max_queue: int = 32  # requests waiting for a slot per worker
+
+    def updated(self, **changes):
+        """A copy with `changes` applied; ValueError if any is unknown, of the wrong type or out of range."""
+        known = {f.name: f.type for f in fields(self)}
+        unknown = set(changes) - set(known)
+        if unknown:
+            raise ValueError(f"Unknown limits: {', '.join(sorted(unknown))}")
+        settings = replace(self, **{name: _coerce(name, known[name], value) for name, value in changes.items()})
+        if settings.key not in ("ip", "session"):
+            raise ValueError("key must be 'ip' or 'session'")
+        if min(settings.requests_per_minute, settings.upstream_tokens_per_minute, settings.max_queue) < 0:
+            raise ValueError("Limits cannot be negative")
+        if settings.burst < 1 or settings.max_concurrency < 1:
+            raise ValueError("burst and max_concurrency must be at least 1")
+        return settings
+
+
+class RateLimiter:
+    def __init__(self, shared, defaults, concurrency):
+        self.shared = shared
+        self.defaults = defaults
+        self.settings = defaults
+        self.concurrency = concurrency
+        self.rejected = {"client": 0, "upstream": 0}
+        # The stored value last read and the settings it parsed to, as one pair so threads read it whole
+        self._last = (None, defaults)
+
+    def read(self):
+        """The limits last set through any worker; a shared-state read, so it may be done off the event loop."""
+        raw = self.shared.get_config("limits")
+        last_raw, settings = self._last
+        if raw != last_raw:
+            try:
+                settings = self.defaults.updated(**json.loads(raw)) if raw else self.defaults
+            except (TypeError, ValueError):
+                # Written by hand or by another version; serving on the defaults beats failing every request
+                logger.warning("Ignoring unreadable limits in the shared state: %r", raw, exc_info=True)
+                settings = self.defaults
+            self._last = (raw, settings)
+        return settings
+
+    def adopt(self, settings):
+        """Apply `settings` (from `read`) here; resizing the chat limiter wakes waiters, so this runs on the event loop."""
+        if settings != self.settings:
+            self.settings = settings
+            self.concurrency.resize(settings.max_concurrency, settings.max_queue)
+        return self.settings
+
+    def sync(self):
+        """Adopt the limits last set through any worker."""
+        return self.adopt(self.read())
+
+    def update(self, **changes):
+        """Store `changes` to the current limits for every worker (a write; `sync()` then applies them here)."""
+        settings = self.settings.updated(**changes)
+        self.shared.set_config("limits", json.dumps(asdict(settings)))
+        return settings
+
+    def check_client(self, key, settings=None):
+        """Take one request from the client's bucket under `settings` (default: the adopted ones)."""
+        settings = settings or self.settings
+        rate = settings.requests_per_minute
+        if rate <= 0:
+            return
+        allowed, wait = self.shared.take(f"client:{key}", rate / 60, settings.burst)
+        if not allowed:
+            self.rejected["client"] += 1
+            raise RateLimited("Too many requests; slow down", "client", wait)
+
+    def charge_upstream(self, tokens):
+        """Take the estimated prompt tokens of a model call from the per-minute budget; returns the tokens taken."""
+        budget = self.settings.upstream_tokens_per_minute
+        if budget <= 0:
+            return 0
+        # A prompt bigger than a whole minute's budget still gets through once the bucket is full
+        charged = min(tokens, budget)
+        allowed, wait = self.shared.take("upstream", budget / 60, budget, charged)
+        if not allowed:
+            self.rejected["upstream"] += 1
+            raise RateLimited("Model token budget exhausted; try again shortly", "upstream", wait)
+        return charged
+
+    def refund_upstream(self, tokens):
+        """Give back tokens charged but not sent (an over-estimate, or a call that never ran)."""
+        budget = self.settings.upstream_tokens_per_minute
+        if budget > 0 and tokens > 0:
+            self.shared.take("upstream", budget / 60, budget, -tokens)
+
+    def stats(self):
+        return dict(asdict(self.settings), per_worker=list(PER_WORKER_LIMITS), rejected=dict(self.rejected))
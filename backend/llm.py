@@ -0,0 +1,418 @@
+"""
+Model providers for /chat.
+
+Every provider is async so a slow generation never blocks the event loop.
+`knowledge`, when given, asks the provider to serve the persona and knowledge
+base from a provider-side context cache; the prompt is then only the user turn.
+`history` is the conversation so far as a list of {"role", "parts"} turns.
+
+`get_backend()` wraps the configured providers in a `ResilientBackend` that
+applies timeouts, retries transient errors with jittered backoff, and keeps a
+circuit breaker per provider so a failing upstream is skipped (and the next
+provider in the chain used) instead of tying up requests.
+
+LLM_BACKEND picks the primary provider and LLM_FALLBACK an optional comma-
+separated chain of fallbacks, each `gemini`, `gemini:<model name>` or `fake`
+(a local stand-in with configurable latency, no network).
+
+The Google client libraries take most of the backend's import time, so they
+are imported on first use rather than at module load.
+"""
+
+import asyncio
+import functools
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from metrics import LLM_CALLS, LLM_FALLBACKS, LLM_RETRIES, record_usage
+
+DEFAULT_MODEL = "models/gemini-2.5-flash"
+
+
+@functools.cache
+def transient_errors():
+    """Errors worth retrying or failing over on; anything else (bad request, missing key) is raised as is."""
+    from google.api_core import exceptions as api_exceptions
+
+    return (
+        asyncio.TimeoutError,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.DeadlineExceeded,
+        api_exceptions.ResourceExhausted,
+        api_exceptions.TooManyRequests,
+        api_exceptions.InternalServerError,
+        api_exceptions.BadGateway,
+        api_exceptions.GatewayTimeout,
+    )
+
+
+class Unavailable(Exception):
+    """No provider could answer: all failed transiently or have their circuit open."""
+
+
+def contents(prompt, history=None):
+    """The request contents: earlier turns, if any, then the new user turn."""
+    if not history:
+        return prompt
+    return list(history) + [{"role": "user", "parts": [prompt]}]
+
+
+class GeminiBackend:
+    """
+    Holds one configured GenerativeModel for the whole process.
+
+    The system prompt is passed as the model's system_instruction and every
+    request is a stateless generate_content call, so the same model (and its
+    underlying gRPC channel) is shared safely by concurrent requests. The model
+    is rebuilt only when the API key, model name or system prompt changes.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model_name=None, context_cache=None):
+        self.model_name = model_name or os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+        self.context_cache = context_cache
+        self.label = f"gemini:{self.model_name}"
+        self._model = None
+        self._config = None
+
+    def configure(self, system_prompt):
+        """Build the model ahead of the first request; a missing key is reported on use instead."""
+        # Pay for the lazy client imports here (at warm-up) rather than on the first request
+        transient_errors()
+        if os.getenv("GEMINI_API_KEY"):
+            self.model(system_prompt)
+
+    def _api_key(self):
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY not set")
+        return api_key
+
+    def model(self, system_prompt):
+        api_key = self._api_key()
+        config = (api_key, self.model_name, system_prompt)
+        if config != self._config:
+            import google.generativeai as genai
+
+            genai.configure(api_key=api_key)
+            self._model = genai.GenerativeModel(self.model_name, system_instruction=system_prompt)
+            self._config = config
+        return self._model
+
+    async def _resolve(self, system_prompt, knowledge):
+        model = self.model(system_prompt)
+        if knowledge is not None and self.context_cache is not None:
+            # Persona + knowledge base come from the provider-side cache
+            return await self.context_cache.model(self.model_name, system_prompt, knowledge)
+        return model
+
+    async def generate(self, system_prompt, prompt, knowledge=None, history=None):
+        model = await self._resolve(system_prompt, knowledge)
+        response = await model.generate_content_async(contents(prompt, history))
+        record_usage(response.usage_metadata)
+        return response.text
+
+    async def stream(self, system_prompt, prompt, knowledge=None, history=None):
+        model = await self._resolve(system_prompt, knowledge)
+        response = await model.generate_content_async(contents(prompt, history), stream=True)
+        usage = None
+        async for chunk in response:
+            # The final chunk may carry only a finish reason and no text parts
+            usage = chunk.usage_metadata or usage
+            text = "".join(part.text for part in chunk.parts)
+            if text:
+                yield text
+        # Usage is cumulative; the last chunk that has it covers the whole answer
+        record_usage(usage)
+
+    async def list_models(self):
+        import google.generativeai as genai
+
+        genai.configure(api_key=self._api_key())
+        models = await asyncio.to_thread(genai.list_models)
+        # supported_generation_methods is a list of strings
+        return [m.name for m in models if "generateContent" in m.supported_generation_methods]
+
+
+class FakeBackend:
+    """
+    Local stand-in that waits FAKE_LLM_LATENCY seconds before the first token,
+    then emits FAKE_LLM_TOKEN_RATE tokens per second. FAKE_LLM_ERROR_RATE makes
+    that fraction of calls fail like an unavailable upstream, to exercise
+    retries, the circuit breaker and fallback without a network.
+    """
+
+    name = "fake"
+    label = "fake"
+
+    def __init__(self, latency=None, token_rate=None, error_rate=None):
+        self.latency = float(os.getenv("FAKE_LLM_LATENCY", "0.5")) if latency is None else latency
+        self.token_rate = float(os.getenv("FAKE_LLM_TOKEN_RATE", "200")) if token_rate is None else token_rate
+        self.error_rate = float(os.getenv("FAKE_LLM_ERROR_RATE", "0")) if error_rate is None else error_rate
+
+    def configure(self, system_prompt):
+        pass
+
+    def _answer(self, system_prompt, prompt, history=None):
+        if random.random() < self.error_rate:
+            from google.api_core import exceptions as api_exceptions
+
+            raise api_exceptions.ServiceUnavailable("fake upstream error")
+        chars = len(system_prompt) + len(prompt) + sum(len(p) for turn in history or [] for p in turn["parts"])
+        words = f"(fake answer; prompt was {chars} chars)".split(" ")
+        # Same shape as Gemini's usage_metadata, at roughly 4 characters per token
+        usage = SimpleNamespace(prompt_token_count=chars // 4, candidates_token_count=len(words))
+        return words, usage
+
+    async def generate(self, system_prompt, prompt, knowledge=None, history=None):
+        words, usage = self._answer(system_prompt, prompt, history)
+        await asyncio.sleep(self.latency + len(words) / self.token_rate)
+        record_usage(usage)
+        return " ".join(words)
+
+    async def stream(self, system_prompt, prompt, knowledge=None, history=None):
+        words, usage = self._answer(system_prompt, prompt, history)
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(1 / self.token_rate)
+            yield word if i == 0 else " " + word
+        record_usage(usage)
+
+    async def list_models(self):
+        return ["fake"]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open, calls are
+    refused; after `reset_timeout` seconds one trial call is let through and
+    closes the circuit again if it succeeds. A trial that ends any other way
+    (a non-transient error, cancellation, a stream closed early) must still be
+    settled with `abandon_trial()`, or no further trial would ever be let through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def abandon_trial(self):
+        """End a trial that got no verdict as a failure: the circuit reopens and a later call gets the next trial."""
+        if self._trial:
+            self.failure()
+
+
+class ResilientBackend:
+    """
+    Calls providers in order with timeouts, retries and a circuit breaker each.
+
+    `connect_timeout` bounds the wait for the first streamed chunk, and
+    `read_timeout` the gap between later chunks; a non-streaming call gets
+    both together as its deadline. Transient errors are retried up to
+    `retries` times with full-jitter exponential backoff; once they are
+    exhausted (or the circuit is open) the next provider is tried. A stream
+    is never retried or failed over once it has yielded text.
+    """
+
+    def __init__(self, providers, connect_timeout=10.0, read_timeout=60.0, retries=2, backoff=0.5,
+                 max_backoff=8.0, failure_threshold=5, reset_timeout=30.0, models_ttl=600):
+        self.providers = providers
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.models_ttl = models_ttl
+        self.breakers = {p.label: CircuitBreaker(failure_threshold, reset_timeout) for p in providers}
+        self._models = None
+        self._models_expires_at = 0.0
+
+    @property
+    def name(self):
+        return self.providers[0].label
+
+    def configure(self, system_prompt):
+        for provider in self.providers:
+            provider.configure(system_prompt)
+
+    def _available(self):
+        """(provider, trial) for providers whose circuit lets a call through, in order; `trial` if this call is the half-open trial."""
+        for i, provider in enumerate(self.providers):
+            breaker = self.breakers[provider.label]
+            trial = breaker.state == "half_open"
+            if not breaker.allow():
+                LLM_CALLS.inc(provider=provider.label, outcome="short_circuit")
+                continue
+            if i:
+                LLM_FALLBACKS.inc(provider=provider.label)
+            yield provider, trial
+
+    async def _backoff(self, provider, attempt):
+        LLM_RETRIES.inc(provider=provider.label)
+        await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    async def generate(self, system_prompt, prompt, knowledge=None, history=None):
+        last_error = None
+        for provider, trial in self._available():
+            breaker = self.breakers[provider.label]
+            try:
+                for attempt in range(self.retries + 1):
+                    try:
+                        answer = await asyncio.wait_for(
+                            provider.generate(system_prompt, prompt, knowledge=knowledge, history=history),
+                            self.connect_timeout + self.read_timeout,
+                        )
+                    except transient_errors() as e:
+                        last_error = e
+                        if attempt < self.retries:
+                            await self._backoff(provider, attempt)
+                            continue
+                        breaker.failure()
+                        LLM_CALLS.inc(provider=provider.label, outcome="transient_error")
+                        break
+                    except Exception:
+                        LLM_CALLS.inc(provider=provider.label, outcome="error")
+                        raise
+                    breaker.success()
+                    LLM_CALLS.inc(provider=provider.label, outcome="ok")
+                    return answer
+            finally:
+                if trial:
+                    breaker.abandon_trial()
+        raise Unavailable(f"No model provider available ({type(last_error).__name__ if last_error else 'circuit open'})")
+
+    async def _timed(self, stream):
+        iterator = stream.__aiter__()
+        timeout = self.connect_timeout
+        try:
+            while True:
+                try:
+                    text = await asyncio.wait_for(iterator.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return
+                timeout = self.read_timeout
+                yield text
+        finally:
+            await iterator.aclose()
+
+    async def stream(self, system_prompt, prompt, knowledge=None, history=None):
+        last_error = None
+        for provider, trial in self._available():
+            breaker = self.breakers[provider.label]
+            try:
+                for attempt in range(self.retries + 1):
+                    started = False
+                    try:
+                        async for text in self._timed(provider.stream(system_prompt, prompt, knowledge=knowledge, history=history)):
+                            started = True
+                            yield text
+                    except transient_errors() as e:
+                        last_error = e
+                        if not started and attempt < self.retries:
+                            await self._backoff(provider, attempt)
+                            continue
+                        breaker.failure()
+                        LLM_CALLS.inc(provider=provider.label, outcome="transient_error")
+                        if started:
+                            raise
+                        break
+                    except Exception:
+                        LLM_CALLS.inc(provider=provider.label, outcome="error")
+                        raise
+                    breaker.success()
+                    LLM_CALLS.inc(provider=provider.label, outcome="ok")
+                    return
+            finally:
+                # Also runs on GeneratorExit (the consumer closed the stream) and on cancellation
+                if trial:
+                    breaker.abandon_trial()
+        raise Unavailable(f"No model provider available ({type(last_error).__name__ if last_error else 'circuit open'})")
+
+    async def list_models(self):
+        """Models per provider, cached for `models_ttl` seconds; returns (models, cached)."""
+        if self._models is not None and time.monotonic() < self._models_expires_at:
+            return self._models, True
+        models, failed = {}, False
+        for provider in self.providers:
+            try:
+                names = await asyncio.wait_for(provider.list_models(), self.connect_timeout + self.read_timeout)
+                models[provider.label] = {"models": names}
+            except Exception as e:
+                models[provider.label] = {"error": f"{type(e).__name__}: {str(e)}"}
+                failed = True
+        # Errors are not cached, so a fixed key or upstream shows up on the next call
+        if not failed:
+            self._models = models
+            self._models_expires_at = time.monotonic() + self.models_ttl
+        return models, False
+
+    def stats(self):
+        return {
+            "providers": {
+                label: {"state": breaker.state, "consecutive_failures": breaker.failures}
+                for label, breaker in self.breakers.items()
+            },
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "retries": self.retries,
+        }
+
+
+def make_provider(spec, context_cache=None):
+    """Build a provider from `fake`, `gemini` or `gemini:<model name>`."""
+    kind, _, model_name = spec.strip().partition(":")
+    kind = kind.lower()
+    if kind == "fake":
+        return FakeBackend()
+    if kind == "gemini":
+        return GeminiBackend(model_name=model_name or None, context_cache=context_cache)
+    raise ValueError(f"Unknown LLM provider {spec!r}")
+
+
+def get_backend(context_cache=None):
+    # The context cache is bound to the primary model, so fallbacks go without it
+    providers = [make_provider(os.getenv("LLM_BACKEND", "gemini"), context_cache)]
+    providers += [make_provider(spec) for spec in os.getenv("LLM_FALLBACK", "").split(",") if spec.strip()]
+    return ResilientBackend(
+        providers,
+        connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+        read_timeout=float(os.getenv("LLM_READ_TIMEOUT", "60")),
+        retries=int(os.getenv("LLM_RETRIES", "2")),
+        failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")),
+        models_ttl=int(os.getenv("LLM_MODELS_CACHE_TTL", "600")),
+    )
@@ -0,0 +1,82 @@
+"""
+Persistent chat log store.
+
+Interactions are appended to an in-memory queue on the request path and
+written to the shared state (see shared_state.py) in batches by a background
+thread, so every worker's logs land in one place. Reads support cursor
+pagination, time-range filters and full-text search, so memory use stays flat
+however long the service runs.
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class LogStore:
+    def __init__(self, backend, batch_size=100, flush_interval=0.5, max_pending=10000):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Flush everything still queued and stop the writer."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def append(self, user, bot):
+        now = datetime.now()
+        try:
+            self._queue.put_nowait((now.timestamp(), str(now), user, bot))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            stopping = item is None
+            if batch:
+                try:
+                    self.backend.write_logs(batch)
+                except Exception:
+                    # Keep the writer alive through a backend outage; these logs are lost
+                    logger.exception("Writing %d chat logs failed", len(batch))
+                    self.dropped += len(batch)
+
+    def query(self, cursor=None, limit=50, since=None, until=None, search=None):
+        """Newest-first page of logs; pass the returned next_cursor to get the following page."""
+        return self.backend.query_logs(cursor=cursor, limit=limit, since=since, until=until, search=search)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {"stored": self.backend.count_logs(), "pending": self.pending(), "dropped": self.dropped}
@@ -1,14 +1,86 @@
 import os
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import math
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import google.generativeai as genai
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from datetime import datetime
+from typing import Optional
+
+from coalesce import MicroBatcher, SingleFlight
+from context_cache import ContextCache
+from embeddings import get_embedder
+from knowledge import KnowledgeSource
+from limits import ConcurrencyLimiter, LimitSettings, Overloaded, RateLimited, RateLimiter, client_address
+from log_store import LogStore
+from metrics import (
+    ERRORS, FIRST_TOKEN_SECONDS, PROMPT_BYTES, PROMPT_COMPONENT_TOKENS, PROMPT_TRIMMED, QUEUE_WAIT_SECONDS,
+    REGISTRY, REJECTED, REQUEST_SECONDS, REQUESTS, SIGNATURE_LOOKUPS, SIGNATURE_SECONDS, STAGE_SECONDS,
+)
+from prompt_builder import Budget, PromptBuilder, PromptTooLarge, count
+from response_cache import ResponseCache, SQLiteResponseStore, normalize
+from session_store import SessionStore
+from shared_state import get_shared_state
+from llm import Unavailable, get_backend
+from reloader import KnowledgeReloader
 
 load_dotenv()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+STARTUP = {"ready": asyncio.Event(), "seconds": None}
+# Seconds a chat request that arrives during warm-up waits for it before getting 503
+STARTUP_WAIT = float(os.getenv("CHAT_STARTUP_WAIT", "10"))
+
+async def warm_up():
+    """Load the knowledge indexes and build the model client before /health reports ready."""
+    started = time.perf_counter()
+    try:
+        await KNOWLEDGE.warm()
+        await asyncio.to_thread(sync_system_prompt)
+        # Create the model client once; it is rebuilt only when its configuration changes
+        await asyncio.to_thread(LLM.configure, SYSTEM_PROMPT)
+    except Exception:
+        # Requests still build what they need on first use, so serve rather than stay unready
+        logger.exception("Warm-up failed")
+    STARTUP["seconds"] = round(time.perf_counter() - started, 3)
+    STARTUP["ready"].set()
+    logger.info("Warm-up finished in %.3fs", STARTUP["seconds"])
+
+async def started(endpoint):
+    """
+    Hold a chat request until warm-up is done. The indexes it needs are being
+    built under a lock in a worker thread; touching them on the event loop
+    would block it (and /health) until the build finishes.
+    """
+    if STARTUP["ready"].is_set():
+        return
+    try:
+        await asyncio.wait_for(STARTUP["ready"].wait(), STARTUP_WAIT)
+    except asyncio.TimeoutError:
+        REQUESTS.inc(endpoint=endpoint, outcome="starting")
+        raise HTTPException(status_code=503, detail="Server is starting; try again shortly",
+                            headers={"Retry-After": "1", "X-Limit-Scope": "starting"})
+
+@asynccontextmanager
+async def lifespan(app):
+    LOG_STORE.start()
+    KNOWLEDGE.start()
+    # Warm up in the background so the server listens (and /health answers) right away
+    warming = asyncio.create_task(warm_up())
+    yield
+    warming.cancel()
+    await KNOWLEDGE.stop()
+    LOG_STORE.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -17,48 +89,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Limit-Scope"],  # so the chat page can say why it was turned away and how long to wait
 )
 
 @app.get("/")
 def read_root():
-    return {"status": "eCOMET Backend is Running", "version": "v2_systematic_fix", "docs_url": "/docs"}
+    return {
+        "status": "eCOMET Backend is Running",
+        "version": "v2_systematic_fix",
+        "knowledge_version": KNOWLEDGE.state.version,
+        "docs_url": "/docs",
+    }
 
 @app.get("/debug/models")
-def list_models():
-    """Debug endpoint to list available Gemini models"""
-    try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            return {"error": "GEMINI_API_KEY not set", "key_length": 0}
-        
-        genai.configure(api_key=api_key)
-        models = genai.list_models()
-        # supported_generation_methods is a list of strings
-        model_names = [m.name for m in models if 'generateContent' in m.supported_generation_methods]
-        return {
-            "api_key_set": True,
-            "api_key_prefix": api_key[:8] + "...",
-            "available_models": model_names[:10]  # First 10
-        }
-    except Exception as e:
-        return {"error": f"{type(e).__name__}: {str(e)}"}
+async def list_models():
+    """Debug endpoint to list the models each configured provider offers (cached)"""
+    api_key = os.getenv("GEMINI_API_KEY")
+    providers, cached = await LLM.list_models()
+    primary = providers[LLM.name]
+    return {
+        "api_key_set": bool(api_key),
+        "api_key_prefix": api_key[:8] + "..." if api_key else None,
+        "provider": LLM.name,
+        "available_models": primary.get("models", [])[:10],  # First 10
+        "error": primary.get("error"),
+        "providers": providers,
+        "cached": cached,
+    }
 
 class ChatRequest(BaseModel):
     message: str
+    # Omit to start a new conversation; the response carries the id to send next time
+    session_id: Optional[str] = None
+
+# Only the knowledge base index is read at startup; records are loaded on demand.
+# A background task picks up a new knowledge base (e.g. after the weekly scrape)
+# every KB_RELOAD_INTERVAL seconds without a restart.
+KNOWLEDGE = KnowledgeReloader(
+    KnowledgeSource(),
+    interval=float(os.getenv("KB_RELOAD_INTERVAL", "30")),
+    embedder=get_embedder(),
+)
 
 def get_ecomet_context():
-    try:
-        # Assuming ecomet_docs.txt is in the parent directory as per setup
-        with open("../ecomet_reference_full.txt", "r") as f:
-            return f.read()
-    except FileNotFoundError:
-        # Fallback likely for testing if running from different dir
-        if os.path.exists("ecomet_reference_full.txt"):
-             with open("ecomet_reference_full.txt", "r") as f:
-                return f.read()
-        return "No eCOMET documentation found."
-
-SYSTEM_PROMPT = f"""
+    return KNOWLEDGE.state.kb.text
+
+# Only the top-k chunks relevant to each question are sent, not the whole file
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "6000"))
+
+DEFAULT_SYSTEM_PROMPT = """
 You are an expert assistant for the R package 'eCOMET'.
 Your goal is to help users troubleshoot installation errors and provide code snippets for metabolomics data analysis.
 
@@ -68,48 +148,450 @@ P E R S O N A   &   S T Y L E :
 3. **Always Suggest**: At the end of EVERY response, explicitly suggest 2-3 specific "Next Steps" or "Follow-up Questions" relevant to the current topic.
 
 K N O W L E D G E   B A S E :
-Use the following documentation as your primary source.
+Use the eCOMET documentation and source code excerpts provided to you as your primary source.
 If the answers are not in the documentation, you can use your general knowledge of R and Metabolomics but PLEASE mention that it is not explicitly in the eCOMET docs.
-
-Documentation:
-{get_ecomet_context()}
 """
+SYSTEM_PROMPT = DEFAULT_SYSTEM_PROMPT
+
+# Token budgets per prompt component and in total; documentation is trimmed
+# first, then history, and the persona and user message never are
+PROMPTS = PromptBuilder(Budget(
+    persona=int(os.getenv("PROMPT_PERSONA_TOKENS", "2000")),
+    docs=int(os.getenv("PROMPT_DOCS_TOKENS", str(RETRIEVAL_TOKEN_BUDGET))),
+    history=int(os.getenv("PROMPT_HISTORY_TOKENS", "2500")),
+    user=int(os.getenv("PROMPT_USER_TOKENS", "2000")),
+    total=int(os.getenv("PROMPT_TOTAL_TOKENS", "12000")),
+))
+PROMPTS.budget.check_persona(SYSTEM_PROMPT)
+
+# With CONTEXT_CACHE=1 the persona and the whole knowledge base are cached
+# provider-side and each request sends only the user turn
+CONTEXT_CACHE = None
+if os.getenv("CONTEXT_CACHE", "0") == "1":
+    CONTEXT_CACHE = ContextCache(
+        ttl_seconds=int(os.getenv("CONTEXT_CACHE_TTL", "3600")),
+        current=lambda: KNOWLEDGE.state.kb,
+    )
+
+# Config, logs, sessions, response cache and rate limits shared by all workers:
+# a SQLite file (LOG_DB_PATH) by default, Redis with SHARED_STATE_URL=redis://...
+SHARED = get_shared_state()
+
+def sync_system_prompt():
+    """Adopt the system prompt last set through any worker, rebuilding the model client if it changed."""
+    global SYSTEM_PROMPT
+    prompt = SHARED.get_config("system_prompt", DEFAULT_SYSTEM_PROMPT)
+    if prompt != SYSTEM_PROMPT:
+        SYSTEM_PROMPT = prompt
+        LLM.configure(SYSTEM_PROMPT)
+    return SYSTEM_PROMPT
+
+# Conversation history per session; older turns are compacted past the token budget
+SESSIONS = SessionStore(
+    ttl_seconds=int(os.getenv("SESSION_TTL", "3600")),
+    token_budget=int(os.getenv("SESSION_TOKEN_BUDGET", "2000")),
+    summary_tokens=int(os.getenv("SESSION_SUMMARY_TOKENS", "300")),
+    shared=SHARED,
+)
+
+def retrieve(item):
+    state, query = item
+    return state.retriever.context_chunks(
+        query, top_k=RETRIEVAL_TOP_K, token_budget=RETRIEVAL_TOKEN_BUDGET, semantic=state.semantic,
+    )
+
+# With RETRIEVAL_BATCH_WINDOW_MS > 0, retrieval calls arriving within the window
+# run together in a worker thread and identical queries are computed once
+RETRIEVAL_BATCHER = MicroBatcher(
+    retrieve,
+    window=float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "0")) / 1000,
+    max_batch=int(os.getenv("RETRIEVAL_BATCH_MAX", "32")),
+)
+
+async def build_prompt(message, state, session, signature=None):
+    """The documentation chunks retrieved for this message, the conversation and the message, within budget."""
+    docs = None
+    if signature is not None and CONTEXT_CACHE is None:
+        # A usage lookup is grounded in its one reference record; no retrieval needed
+        docs = [signature.as_documentation()]
+    elif CONTEXT_CACHE is None:
+        # Follow-ups ("what about its second argument?") retrieve better with the previous question
+        query = message
+        if session.turns:
+            query = f"{session.turns[-2][1]}\n{message}"
+        with STAGE_SECONDS.time(stage="retrieval"):
+            docs = await RETRIEVAL_BATCHER.submit((state, query))
+    return PROMPTS.build(SYSTEM_PROMPT, message, docs=docs, turns=session.turns, summary=session.summary)
+
+# Plain usage lookups ("arguments of GetDAMs") are served from the function signature
+# index: "direct" answers from the record with no model call, "ground" sends the model
+# only that record instead of retrieved chunks, "off" disables the index
+SIGNATURE_LOOKUP = os.getenv("SIGNATURE_LOOKUP", "direct")
+
+def lookup_signature(message, state):
+    if SIGNATURE_LOOKUP == "off":
+        return None
+    signature = state.signatures.match(message)
+    SIGNATURE_LOOKUPS.inc(outcome="hit" if signature is not None else "miss")
+    return signature
+
+def direct_answer(signature, session):
+    """Answer from the record alone only as an opening question; mid-conversation the model grounds on it instead."""
+    return signature is not None and SIGNATURE_LOOKUP == "direct" and not session.turns
+
+# Chat logs live in the shared state and are written in batches off the request path
+LOG_STORE = LogStore(SHARED)
+
+LLM = get_backend(context_cache=CONTEXT_CACHE)
+
+def cached_knowledge(state):
+    """The knowledge base to serve from the context cache, or None when caching is off."""
+    return state.kb if CONTEXT_CACHE is not None else None
+
+# Bound concurrent model calls; beyond the queue depth, fail fast with 503
+CHAT_LIMITER = ConcurrencyLimiter(
+    limit=int(os.getenv("CHAT_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "30")),
+)
+
+# Per-client request buckets and a budget of estimated upstream tokens per minute,
+# shared by all workers and adjustable at runtime through /admin/limits
+LIMITS = RateLimiter(SHARED, LimitSettings(
+    requests_per_minute=float(os.getenv("RATE_LIMIT_PER_MINUTE", "20")),
+    burst=int(os.getenv("RATE_LIMIT_BURST", "10")),
+    key=os.getenv("RATE_LIMIT_KEY", "ip"),
+    upstream_tokens_per_minute=int(os.getenv("UPSTREAM_TOKENS_PER_MINUTE", "250000")),
+    max_concurrency=CHAT_LIMITER.limit,
+    max_queue=CHAT_LIMITER.max_queue,
+).updated(), CHAT_LIMITER)
+# Reverse proxies in front of the app (e.g. 1 on Hugging Face Spaces); behind them every
+# request comes from a proxy, so the client address is read from X-Forwarded-For instead
+RATE_LIMIT_TRUST_PROXY = int(os.getenv("RATE_LIMIT_TRUST_PROXY", "0"))
+
+def client_key(http_request, request, limits):
+    """Rate-limit key: the session when keyed on sessions and it is one we issued, else the client address."""
+    if limits.key == "session" and SESSIONS.known(request.session_id):
+        return f"session:{request.session_id}"
+    address = client_address(
+        http_request.client.host if http_request.client else None,
+        http_request.headers.getlist("x-forwarded-for"),
+        RATE_LIMIT_TRUST_PROXY,
+    )
+    return f"ip:{address}"
+
+def read_shared(http_request, request, state):
+    """
+    Everything a chat request reads from the shared state before it can be
+    answered: the limits (and the client's bucket under them), the system
+    prompt, the session and any stored answer to an opening question.
+    """
+    limits = LIMITS.read()
+    LIMITS.check_client(client_key(http_request, request, limits), limits)
+    sync_system_prompt()
+    session = SESSIONS.get(request.session_id)
+    stored = None
+    if RESPONSE_CACHE is not None and not session.turns and not session.summary:
+        stored = RESPONSE_CACHE.fetch(request.message, prompt_version(state))
+    return limits, session, stored
+
+async def admit(http_request, request, state):
+    """
+    Turn away an oversized message, then a client over its rate, before any
+    other work. Returns the session and the stored answer from `read_shared`.
+    """
+    PROMPTS.check_message(request.message)
+    # Each shared read may wait on another worker, so they all go off the loop in one trip
+    limits, session, stored = await asyncio.to_thread(read_shared, http_request, request, state)
+    LIMITS.adopt(limits)
+    return session, stored
+
+def rate_limited(endpoint, e):
+    """429 for a client over its rate, 503 while the upstream budget is spent; both say when to retry."""
+    outcome = "rate_limited" if e.scope == "client" else "upstream_budget"
+    REQUESTS.inc(endpoint=endpoint, outcome=outcome)
+    REJECTED.inc(reason=outcome)
+    return HTTPException(
+        status_code=429 if e.scope == "client" else 503,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after))), "X-Limit-Scope": e.scope},
+    )
+
+def estimate_prompt_tokens(message, session, signature=None):
+    """Upper bound on a prompt's tokens, charged to the upstream budget before the prompt is built."""
+    if CONTEXT_CACHE is not None:
+        docs = 0
+    elif signature is not None:
+        docs = count(signature.as_documentation())
+    else:
+        docs = PROMPTS.budget.docs
+    history = min(PROMPTS.budget.history, sum(count(text) for _, text in session.turns) + count(session.summary))
+    return min(PROMPTS.budget.total, count(SYSTEM_PROMPT) + docs + history + count(message))
+
+# Answers to repeated (or near-duplicate) questions are served without a model call
+RESPONSE_CACHE = None
+if os.getenv("RESPONSE_CACHE", "1") == "1":
+    RESPONSE_CACHE = ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", "10000000")),
+        ttl_seconds=int(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+        similarity=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.8")),
+        store=SQLiteResponseStore(os.environ["RESPONSE_CACHE_PATH"]) if os.getenv("RESPONSE_CACHE_PATH") else SHARED.responses,
+    )
+
+def prompt_version(state):
+    """Changes whenever the system prompt or the knowledge base changes."""
+    digest = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+    return f"{digest}-{state.version}"
+
+def cached_answer(message, state, session, stored=None):
+    # A follow-up depends on its conversation, so only opening questions are shared
+    if RESPONSE_CACHE is None or session.turns or session.summary:
+        return None
+    return RESPONSE_CACHE.get(message, prompt_version(state), current=prompt_version(KNOWLEDGE.state), stored=stored)
 
-# In-memory storage for MVP (Production should use a database)
-CHAT_LOGS = []
+def cache_answer(message, state, session, answer, latency):
+    if RESPONSE_CACHE is not None and answer and not session.turns and not session.summary:
+        RESPONSE_CACHE.put(message, prompt_version(state), answer, latency, current=prompt_version(KNOWLEDGE.state))
+
+# Identical opening questions already being answered share that one model call
+COALESCER = SingleFlight() if os.getenv("CHAT_COALESCE", "1") == "1" else None
+
+def coalesce_key(message, state, session):
+    """Key under which identical in-flight questions are joined; None if this one can't be shared."""
+    if COALESCER is None or session.turns or session.summary:
+        return None
+    return (normalize(message), prompt_version(state))
+
+def log_interaction(user, bot):
+    LOG_STORE.append(user, bot)
+
+# Live values exported alongside the request metrics
+REGISTRY.gauge("chat_active_requests", "Model calls in flight.", lambda: CHAT_LIMITER.active)
+REGISTRY.gauge("chat_waiting_requests", "Requests waiting for a model slot.", lambda: CHAT_LIMITER.waiting)
+REGISTRY.gauge("chat_sessions", "Conversations active within the session TTL.", lambda: len(SESSIONS))
+REGISTRY.gauge("chat_log_pending", "Chat logs queued for the writer.", LOG_STORE.pending)
+
+async def remember(session, message, answer):
+    """Record the finished turn for follow-ups and log it."""
+    with STAGE_SECONDS.time(stage="logging"):
+        await asyncio.to_thread(SESSIONS.append, session, message, answer)
+        log_interaction(message, answer)
+
+async def assemble_prompt(message, state, session, signature=None):
+    with STAGE_SECONDS.time(stage="prompt"):
+        prompt = await build_prompt(message, state, session, signature)
+    history_bytes = sum(len(text.encode("utf-8")) for turn in prompt.history for text in turn["parts"])
+    PROMPT_BYTES.observe(len(SYSTEM_PROMPT.encode("utf-8")) + history_bytes + len(prompt.text.encode("utf-8")))
+    for component in ("persona", "docs", "history", "user"):
+        PROMPT_COMPONENT_TOKENS.observe(prompt.sizes[component]["tokens"], component=component)
+    for component, dropped in prompt.sizes["trimmed"].items():
+        if dropped:
+            PROMPT_TRIMMED.inc(dropped, component=component)
+    return prompt
+
+async def generate_answer(message, state, session, received, signature=None):
+    charged = await asyncio.to_thread(LIMITS.charge_upstream, estimate_prompt_tokens(message, session, signature))
+    try:
+        async with CHAT_LIMITER.slot():
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - received)
+            # Use the current global system prompt plus the retrieved documentation
+            start = time.perf_counter()
+            prompt = await assemble_prompt(message, state, session, signature)
+            await asyncio.to_thread(LIMITS.refund_upstream, charged - prompt.sizes["total"]["tokens"])
+            with STAGE_SECONDS.time(stage="model"):
+                answer = await LLM.generate(
+                    SYSTEM_PROMPT,
+                    prompt.text,
+                    knowledge=cached_knowledge(state),
+                    history=prompt.history,
+                )
+            cache_answer(message, state, session, answer, time.perf_counter() - start)
+    except Overloaded:
+        await asyncio.to_thread(LIMITS.refund_upstream, charged)
+        raise
+    # Coalesced requests share the answer and the size breakdown of the prompt behind it
+    return answer, prompt.sizes
 
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
+    await started("chat")
+    # Pin the knowledge base version for the whole request
+    state = KNOWLEDGE.state
+    received = time.perf_counter()
     try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise HTTPException(status_code=500, detail="GEMINI_API_KEY not set")
+        # Turn away a client over its rate or an oversized message before any other work
+        session, stored = await admit(http_request, request, state)
+        signature = lookup_signature(request.message, state)
+        if direct_answer(signature, session):
+            answer = signature.render()
+            await remember(session, request.message, answer)
+            REQUESTS.inc(endpoint="chat", outcome="signature")
+            SIGNATURE_SECONDS.observe(time.perf_counter() - received)
+            return {"response": answer, "cached": False, "signature": signature.name, "session_id": session.id}
 
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("models/gemini-2.5-flash")
-        
-        # Use the current global system prompt
-        chat_session = model.start_chat(history=[
-            {"role": "user", "parts": SYSTEM_PROMPT},
-            {"role": "model", "parts": "Understood. I am ready to help with eCOMET questions based on the documentation provided."}
-        ])
-        
-        response = chat_session.send_message(request.message)
+        answer = cached_answer(request.message, state, session, stored)
+        if answer is not None:
+            await remember(session, request.message, answer)
+            REQUESTS.inc(endpoint="chat", outcome="cached")
+            return {"response": answer, "cached": True, "session_id": session.id}
+
+        key = coalesce_key(request.message, state, session)
+        shared = COALESCER.follow(key) if key else None
+        if shared is not None:
+            answer, sizes = await COALESCER.wait(shared)
+        elif key:
+            answer, sizes = await COALESCER.run(key, lambda: generate_answer(request.message, state, session, received, signature))
+        else:
+            answer, sizes = await generate_answer(request.message, state, session, received, signature)
         
-        # Log the interaction
-        CHAT_LOGS.append({
-            "timestamp": str(datetime.now()),
-            "user": request.message,
-            "bot": response.text
-        })
+        await remember(session, request.message, answer)
+        REQUESTS.inc(endpoint="chat", outcome="coalesced" if shared is not None else "ok")
+        REQUEST_SECONDS.observe(time.perf_counter() - received, endpoint="chat")
         
-        return {"response": response.text}
+        return {
+            "response": answer,
+            "cached": False,
+            "coalesced": shared is not None,
+            "session_id": session.id,
+            "prompt": sizes,
+        }
+    except RateLimited as e:
+        raise rate_limited("chat", e)
+    except PromptTooLarge as e:
+        REQUESTS.inc(endpoint="chat", outcome="too_large")
+        REJECTED.inc(reason="too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    except Overloaded as e:
+        REQUESTS.inc(endpoint="chat", outcome="overloaded")
+        REJECTED.inc(reason="overloaded")
+        raise HTTPException(status_code=503, detail=f"Server busy: {e}", headers={"Retry-After": "1", "X-Limit-Scope": "queue"})
+    except Unavailable as e:
+        REQUESTS.inc(endpoint="chat", outcome="unavailable")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5", "X-Limit-Scope": "model"})
     except HTTPException:
         raise
     except Exception as e:
+        REQUESTS.inc(endpoint="chat", outcome="error")
+        ERRORS.inc(endpoint="chat", error=type(e).__name__)
+        logger.exception("Chat request failed")
         # Return the actual error for debugging
         raise HTTPException(status_code=500, detail=f"Chat Error: {type(e).__name__}: {str(e)}")
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Stream the answer as Server-Sent Events: `token` events, then `done` (or `error`)."""
+    await started("chat_stream")
+    state = KNOWLEDGE.state
+    received = time.perf_counter()
+    try:
+        session, stored = await admit(http_request, request, state)
+    except RateLimited as e:
+        raise rate_limited("chat_stream", e)
+    except PromptTooLarge as e:
+        REQUESTS.inc(endpoint="chat_stream", outcome="too_large")
+        REJECTED.inc(reason="too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    signature = lookup_signature(request.message, state)
+    if direct_answer(signature, session):
+        answer = signature.render()
+        await remember(session, request.message, answer)
+        REQUESTS.inc(endpoint="chat_stream", outcome="signature")
+        SIGNATURE_SECONDS.observe(time.perf_counter() - received)
+        signature_events = [
+            sse_event("token", {"text": answer}),
+            sse_event("done", {"cached": False, "signature": signature.name, "session_id": session.id}),
+        ]
+        return StreamingResponse(iter(signature_events), media_type="text/event-stream")
+
+    answer = cached_answer(request.message, state, session, stored)
+    if answer is not None:
+        await remember(session, request.message, answer)
+        REQUESTS.inc(endpoint="chat_stream", outcome="cached")
+        cached_events = [
+            sse_event("token", {"text": answer}),
+            sse_event("done", {"cached": True, "session_id": session.id}),
+        ]
+        return StreamingResponse(iter(cached_events), media_type="text/event-stream")
+
+    key = coalesce_key(request.message, state, session)
+    shared = COALESCER.follow(key) if key else None
+    if shared is not None:
+        # An identical question is already streaming; send its answer in one piece when ready
+        async def shared_events():
+            try:
+                answer, sizes = await COALESCER.wait(shared)
+                yield sse_event("token", {"text": answer})
+                yield sse_event("done", {"cached": False, "coalesced": True, "session_id": session.id, "prompt": sizes})
+                await remember(session, request.message, answer)
+                REQUESTS.inc(endpoint="chat_stream", outcome="coalesced")
+            except Exception as e:
+                REQUESTS.inc(endpoint="chat_stream", outcome="error")
+                yield sse_event("error", {"detail": f"Chat Error: {type(e).__name__}: {str(e)}"})
+
+        return StreamingResponse(shared_events(), media_type="text/event-stream")
+
+    flight = COALESCER.lead(key) if key else None
+    try:
+        charged = await asyncio.to_thread(LIMITS.charge_upstream, estimate_prompt_tokens(request.message, session, signature))
+    except RateLimited as e:
+        if flight is not None:
+            COALESCER.finish(key, flight, error=e)
+        raise rate_limited("chat_stream", e)
+    try:
+        await CHAT_LIMITER.acquire()
+    except Overloaded as e:
+        await asyncio.to_thread(LIMITS.refund_upstream, charged)
+        if flight is not None:
+            COALESCER.finish(key, flight, error=e)
+        REQUESTS.inc(endpoint="chat_stream", outcome="overloaded")
+        REJECTED.inc(reason="overloaded")
+        raise HTTPException(status_code=503, detail=f"Server busy: {e}", headers={"Retry-After": "1", "X-Limit-Scope": "queue"})
+    QUEUE_WAIT_SECONDS.observe(time.perf_counter() - received)
+
+    async def events():
+        parts = []
+        start = time.perf_counter()
+        try:
+            prompt = await assemble_prompt(request.message, state, session, signature)
+            await asyncio.to_thread(LIMITS.refund_upstream, charged - prompt.sizes["total"]["tokens"])
+            with STAGE_SECONDS.time(stage="model"):
+                async for text in LLM.stream(SYSTEM_PROMPT, prompt.text, knowledge=cached_knowledge(state), history=prompt.history):
+                    if not parts:
+                        FIRST_TOKEN_SECONDS.observe(time.perf_counter() - received)
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+            yield sse_event("done", {"cached": False, "coalesced": False, "session_id": session.id, "prompt": prompt.sizes})
+            # Record and log the completed answer once the stream has finished
+            answer = "".join(parts)
+            if flight is not None:
+                COALESCER.finish(key, flight, result=(answer, prompt.sizes))
+            cache_answer(request.message, state, session, answer, time.perf_counter() - start)
+            await remember(session, request.message, answer)
+            REQUESTS.inc(endpoint="chat_stream", outcome="ok")
+            REQUEST_SECONDS.observe(time.perf_counter() - received, endpoint="chat_stream")
+        except Exception as e:
+            REQUESTS.inc(endpoint="chat_stream", outcome="error")
+            ERRORS.inc(endpoint="chat_stream", error=type(e).__name__)
+            logger.exception("Chat stream failed")
+            if flight is not None:
+                COALESCER.finish(key, flight, error=e)
+            yield sse_event("error", {"detail": f"Chat Error: {type(e).__name__}: {str(e)}"})
+        finally:
+            CHAT_LIMITER.release()
+            if flight is not None:
+                # The client went away mid-stream; don't leave followers waiting
+                COALESCER.finish(key, flight, error=RuntimeError("Shared answer was interrupted"))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 class AdminPromptUpdate(BaseModel):
     new_prompt: str
     password: str
@@ -117,6 +599,16 @@ class AdminPromptUpdate(BaseModel):
 class AdminLogin(BaseModel):
     password: str
 
+class AdminLimitsUpdate(BaseModel):
+    password: str
+    # Only the fields sent are changed
+    requests_per_minute: Optional[float] = None
+    burst: Optional[int] = None
+    key: Optional[str] = None
+    upstream_tokens_per_minute: Optional[int] = None
+    max_concurrency: Optional[int] = None
+    max_queue: Optional[int] = None
+
 @app.post("/admin/login")
 def admin_login(creds: AdminLogin):
     admin_pass = os.getenv("ADMIN_PASSWORD", "admin123") # Default for dev
@@ -125,32 +617,108 @@ def admin_login(creds: AdminLogin):
     return {"status": "ok"}
 
 @app.get("/admin/logs")
-def get_logs(password: str):
+def get_logs(
+    password: str,
+    cursor: Optional[int] = None,
+    limit: int = 50,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    q: Optional[str] = None,
+):
+    """Newest-first page of chat logs. Pass `next_cursor` back as `cursor` for the next page."""
     admin_pass = os.getenv("ADMIN_PASSWORD", "admin123")
     if password != admin_pass:
         raise HTTPException(status_code=401, detail="Invalid password")
-    return CHAT_LOGS
+    limit = max(1, min(limit, 500))
+    return LOG_STORE.query(cursor=cursor, limit=limit, since=since, until=until, search=(q or "").strip() or None)
 
 @app.post("/admin/system-prompt")
 def update_system_prompt(update: AdminPromptUpdate):
-    global SYSTEM_PROMPT
     admin_pass = os.getenv("ADMIN_PASSWORD", "admin123")
     if update.password != admin_pass:
         raise HTTPException(status_code=401, detail="Invalid password")
     
-    SYSTEM_PROMPT = update.new_prompt
-    return {"status": "updated", "new_prompt": SYSTEM_PROMPT}
+    try:
+        PROMPTS.budget.check_persona(update.new_prompt)
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    # Every worker picks it up from the shared state on its next request
+    SHARED.set_config("system_prompt", update.new_prompt)
+    return {"status": "updated", "new_prompt": sync_system_prompt()}
 
 @app.get("/admin/system-prompt")
 def get_system_prompt(password: str):
     admin_pass = os.getenv("ADMIN_PASSWORD", "admin123")
     if password != admin_pass:
         raise HTTPException(status_code=401, detail="Invalid password")
-    return {"system_prompt": SYSTEM_PROMPT}
+    return {"system_prompt": sync_system_prompt()}
+
+@app.get("/admin/limits")
+async def get_limits(password: str):
+    admin_pass = os.getenv("ADMIN_PASSWORD", "admin123")
+    if password != admin_pass:
+        raise HTTPException(status_code=401, detail="Invalid password")
+    LIMITS.adopt(await asyncio.to_thread(LIMITS.read))
+    return {"limits": LIMITS.stats(), "chat_limiter": CHAT_LIMITER.stats()}
+
+@app.post("/admin/limits")
+async def update_limits(update: AdminLimitsUpdate):
+    admin_pass = os.getenv("ADMIN_PASSWORD", "admin123")
+    if update.password != admin_pass:
+        raise HTTPException(status_code=401, detail="Invalid password")
+    try:
+        # Every worker picks the new limits up from the shared state on its next request
+        LIMITS.adopt(await asyncio.to_thread(LIMITS.read))
+        await asyncio.to_thread(LIMITS.update, **update.model_dump(exclude={"password"}, exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Resizing the chat limiter wakes waiters, which must happen on the event loop
+    LIMITS.adopt(await asyncio.to_thread(LIMITS.read))
+    return {"status": "updated", "limits": LIMITS.stats()}
+
+@app.get("/admin/stats")
+def get_stats(password: str):
+    admin_pass = os.getenv("ADMIN_PASSWORD", "admin123")
+    if password != admin_pass:
+        raise HTTPException(status_code=401, detail="Invalid password")
+    return {
+        "chat_limiter": CHAT_LIMITER.stats(),
+        "limits": LIMITS.stats(),
+        "context_cache": CONTEXT_CACHE.stats() if CONTEXT_CACHE is not None else None,
+        "response_cache": RESPONSE_CACHE.stats() if RESPONSE_CACHE is not None else None,
+        "coalescing": COALESCER.stats() if COALESCER is not None else None,
+        "llm": LLM.stats(),
+        "logs": LOG_STORE.stats(),
+        "shared_state": SHARED.info(),
+        "sessions": SESSIONS.stats(),
+        "knowledge": dict(KNOWLEDGE.state.info(), reloads=KNOWLEDGE.reloads),
+        "metrics": REGISTRY.summary(),
+    }
+
+@app.post("/admin/reload-knowledge")
+async def reload_knowledge(creds: AdminLogin):
+    """Rebuild the knowledge base state now instead of waiting for the watcher."""
+    admin_pass = os.getenv("ADMIN_PASSWORD", "admin123")
+    if creds.password != admin_pass:
+        raise HTTPException(status_code=401, detail="Invalid password")
+    changed = await KNOWLEDGE.reload(force=True)
+    return {"status": "reloaded" if changed else "unchanged", "knowledge_version": KNOWLEDGE.state.version}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    if not STARTUP["ready"].is_set():
+        return JSONResponse({"status": "starting"}, status_code=503, headers={"Retry-After": "1"})
+    return {
+        "status": "ready",
+        "knowledge_version": KNOWLEDGE.state.version,
+        "startup_seconds": STARTUP["seconds"],
+        "worker": os.getpid(),
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,222 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters, gauges and fixed-bucket histograms keyed by label values. Recording
+is a dict lookup and a few additions, cheap enough for every request; the text
+exposition and the admin summary are only built when asked for.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTE_BUCKETS = (1024, 4096, 8192, 16384, 32768, 65536, 131072, 262144, 524288, 1048576)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _label_text(self.labelnames, key), value
+
+    def summary(self):
+        with self._lock:
+            return {",".join(key) or "total": value for key, value in sorted(self._values.items())}
+
+
+class Gauge:
+    """A value read from `fn` at scrape time, e.g. the number of requests in flight."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def samples(self):
+        yield self.name, "", self.fn()
+
+    def summary(self):
+        return self.fn()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _snapshot(self):
+        with self._lock:
+            return {key: list(series) for key, series in sorted(self._series.items())}
+
+    def samples(self):
+        for key, series in self._snapshot().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", _label_text(self.labelnames, key, f'le="{bound}"'), cumulative
+            yield f"{self.name}_sum", _label_text(self.labelnames, key), round(series[-1], 6)
+            yield f"{self.name}_count", _label_text(self.labelnames, key), cumulative
+
+    def _quantile(self, counts, total, q):
+        """Upper bound of the bucket holding the q-th observation."""
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return None  # above the largest bucket
+
+    def summary(self):
+        result = {}
+        for key, series in self._snapshot().items():
+            counts, total_sum = series[:-1], series[-1]
+            count = sum(counts)
+            result[",".join(key) or "total"] = {
+                "count": count,
+                "mean": round(total_sum / count, 4) if count else None,
+                "p50": self._quantile(counts, count, 0.5),
+                "p95": self._quantile(counts, count, 0.95),
+                "p99": self._quantile(counts, count, 0.99),
+            }
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, fn):
+        return self.register(Gauge(name, help, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """Prometheus text exposition format, version 0.0.4."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        return {metric.name: metric.summary() for metric in self._metrics}
+
+
+REGISTRY = Registry()
+
+# Metrics recorded by the chat service
+REQUESTS = REGISTRY.counter("chat_requests_total", "Chat requests by endpoint and outcome.", ("endpoint", "outcome"))
+REJECTED = REGISTRY.counter(
+    "chat_rejected_total", "Requests turned away before any prompt was assembled, by reason.", ("reason",),
+)
+ERRORS = REGISTRY.counter("chat_errors_total", "Failed chat requests by endpoint and exception type.", ("endpoint", "error"))
+REQUEST_SECONDS = REGISTRY.histogram("chat_request_seconds", "End-to-end chat request latency.", ("endpoint",))
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_seconds",
+    "Time spent per request stage (prompt includes retrieval; model is the full generation).",
+    ("stage",),
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("chat_queue_wait_seconds", "Time spent waiting for a model slot.")
+FIRST_TOKEN_SECONDS = REGISTRY.histogram("chat_first_token_seconds", "Time from request to first streamed token.")
+TOKENS = REGISTRY.counter("llm_tokens_total", "Model tokens by kind (prompt, output, cached).", ("kind",))
+PROMPT_BYTES = REGISTRY.histogram(
+    "chat_prompt_bytes", "Bytes sent to the model per call (system prompt, history and user turn).", buckets=BYTE_BUCKETS,
+)
+PROMPT_TOKENS = REGISTRY.histogram("llm_prompt_tokens", "Prompt tokens per model call.", buckets=TOKEN_BUCKETS)
+PROMPT_COMPONENT_TOKENS = REGISTRY.histogram(
+    "chat_prompt_component_tokens", "Estimated tokens per prompt component (persona, docs, history, user).",
+    ("component",), buckets=TOKEN_BUCKETS,
+)
+PROMPT_TRIMMED = REGISTRY.counter(
+    "chat_prompt_trimmed_total", "Doc chunks, history pairs and summaries dropped to fit the prompt budget.", ("component",),
+)
+LLM_CALLS = REGISTRY.counter(
+    "llm_calls_total", "Model calls by provider and outcome (ok, error, transient_error, short_circuit).", ("provider", "outcome"),
+)
+LLM_RETRIES = REGISTRY.counter("llm_retries_total", "Retries after a transient provider error.", ("provider",))
+LLM_FALLBACKS = REGISTRY.counter("llm_fallbacks_total", "Calls routed to a fallback provider.", ("provider",))
+SIGNATURE_LOOKUPS = REGISTRY.counter(
+    "signature_lookups_total", "Questions checked against the function signature index, by outcome (hit, miss).", ("outcome",),
+)
+SIGNATURE_SECONDS = REGISTRY.histogram("signature_answer_seconds", "End-to-end latency of answers served from the signature index.")
+COALESCED = REGISTRY.counter("chat_coalesced_total", "Upstream model calls saved by joining an identical in-flight request.")
+COALESCE_WAIT_SECONDS = REGISTRY.histogram("chat_coalesced_wait_seconds", "Time coalesced requests waited for the shared answer.")
+BATCH_SIZE = REGISTRY.histogram("retrieval_batch_size", "Retrieval calls per micro-batch.", buckets=(1, 2, 4, 8, 16, 32, 64))
+BATCH_WAIT_SECONDS = REGISTRY.histogram("retrieval_batch_wait_seconds", "Wait added by the retrieval micro-batching window.")
+
+
+def record_usage(usage):
+    """Record token counts from a Gemini `usage_metadata` (missing fields count as zero)."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_token_count", 0) or 0
+    TOKENS.inc(prompt, kind="prompt")
+    TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, kind="output")
+    TOKENS.inc(getattr(usage, "cached_content_token_count", 0) or 0, kind="cached")
+    PROMPT_TOKENS.observe(prompt)
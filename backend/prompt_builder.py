@@ -0,0 +1,142 @@
+"""
+Token-budgeted prompt assembly.
+
+A model call is made of four components: the persona (system prompt), the
+retrieved documentation, the conversation history (summary plus recent turns)
+and the user message. The builder measures each one exactly as it is sent
+(characters exactly; tokens with the knowledge base's chars-per-token
+estimate, the same one every other budget here uses) and holds each to its
+own budget and the whole to a total budget.
+
+Trimming is deterministic and goes by priority. Documentation is trimmed
+first, dropping the least relevant chunks. History is trimmed next, dropping
+the oldest question/answer pairs and then the summary. The persona and the
+user message are never trimmed. Instead, a message over its budget is
+rejected, and a persona is checked when it is set (`check_persona`), so the
+two always fit in the total.
+"""
+
+from dataclasses import dataclass
+
+from knowledge import estimate_tokens
+
+NO_DOCS = "No relevant documentation found."
+
+
+class PromptTooLarge(ValueError):
+    """A component that is never trimmed (persona or user message) does not fit its budget."""
+
+
+def count(text):
+    return estimate_tokens(text) if text else 0
+
+
+@dataclass
+class Budget:
+    persona: int = 2000
+    docs: int = 6000
+    history: int = 2500
+    user: int = 2000
+    total: int = 12000
+
+    def check_persona(self, persona):
+        """Raise PromptTooLarge if this system prompt would leave no room for a full-size message."""
+        tokens = count(persona)
+        if tokens > self.persona:
+            raise PromptTooLarge(f"System prompt is ~{tokens} tokens; the limit is {self.persona}")
+        if tokens + self.user > self.total:
+            raise PromptTooLarge(
+                f"System prompt is ~{tokens} tokens; with a {self.user}-token message "
+                f"that exceeds the {self.total}-token prompt budget"
+            )
+
+
+@dataclass
+class Prompt:
+    text: str  # the user turn: documentation, conversation summary, question
+    history: list  # earlier turns, {"role", "parts"}
+    sizes: dict
+
+
+class PromptBuilder:
+    def __init__(self, budget):
+        self.budget = budget
+
+    def check_message(self, message):
+        """Raise PromptTooLarge if the user message alone is over its budget."""
+        # Counted as sent with documentation, the longer of the two forms
+        tokens = count(self._render(message, [], "")[2])
+        if tokens > self.budget.user:
+            raise PromptTooLarge(f"Message is ~{tokens} tokens; the limit is {self.budget.user}")
+
+    @staticmethod
+    def _render(message, docs, summary):
+        """(docs, history, user) parts of the user turn; docs=None means no documentation section."""
+        docs_text = "" if docs is None else "Documentation:\n" + ("\n\n".join(docs) or NO_DOCS) + "\n\n"
+        summary_text = f"Conversation summary: {summary}\n\n" if summary else ""
+        user_text = message if docs is None else f"Question: {message}"
+        return docs_text, summary_text, user_text
+
+    def build(self, persona, message, docs=None, turns=(), summary=""):
+        """
+        Assemble the prompt within budget.
+
+        `docs` are rendered chunks, most relevant first (None when documentation
+        is not sent per request, e.g. with the context cache); `turns` are
+        (role, text) pairs, oldest first.
+        """
+        budget = self.budget
+        docs = None if docs is None else list(docs)
+        turns = list(turns)
+        dropped = {"docs": 0, "history": 0, "summary": 0}
+
+        self.check_message(message)
+
+        def sizes():
+            docs_text, summary_text, user_text = self._render(message, docs, summary)
+            history_chars = len(summary_text) + sum(len(text) for _, text in turns)
+            history_tokens = count(summary_text) + sum(count(text) for _, text in turns)
+            return {
+                "persona": {"chars": len(persona), "tokens": count(persona)},
+                "docs": {"chars": len(docs_text), "tokens": count(docs_text)},
+                "history": {"chars": history_chars, "tokens": history_tokens},
+                "user": {"chars": len(user_text), "tokens": count(user_text)},
+            }
+
+        def drop_docs():
+            docs.pop()
+            dropped["docs"] += 1
+
+        def drop_history():
+            if turns:
+                # Whole question/answer pairs, so the history never starts with an answer
+                del turns[:2]
+                dropped["history"] += 1
+            else:
+                nonlocal summary
+                summary = ""
+                dropped["summary"] += 1
+
+        # Each component within its own budget...
+        while docs and sizes()["docs"]["tokens"] > budget.docs:
+            drop_docs()
+        while (turns or summary) and sizes()["history"]["tokens"] > budget.history:
+            drop_history()
+        # ...then the whole, lowest priority first
+        while sum(part["tokens"] for part in sizes().values()) > budget.total:
+            if docs:
+                drop_docs()
+            elif turns or summary:
+                drop_history()
+            else:
+                raise PromptTooLarge(f"Prompt does not fit the {budget.total}-token budget")
+
+        parts = sizes()
+        text = "".join(self._render(message, docs, summary))
+        parts["total"] = {
+            "chars": sum(part["chars"] for part in parts.values()),
+            "tokens": sum(part["tokens"] for part in parts.values()),
+        }
+        parts["trimmed"] = dropped
+        history = [{"role": role, "parts": [content]} for role, content in turns]
+        return Prompt(text=text, history=history, sizes=parts)
@@ -0,0 +1,164 @@
+"""
+Hot reload of the knowledge base.
+
+Everything derived from the knowledge base (the records, the retrieval index,
+the chunk embeddings and the function signature index) lives in one immutable
+KnowledgeState. A background task polls the file
+on disk and, when it changes, builds a complete new state in a worker thread
+and swaps it in with a single assignment. Requests take the state once at the
+start, so in-flight requests finish against the version they started with.
+
+Indexes are taken from the prebuilt artifact (see artifacts.py) when it
+matches the version being loaded; otherwise they are built and the artifact
+is written so the next cold start can skip the build. Chunk embeddings are
+kept in their own files (see embeddings.py) so a new version re-embeds only
+the chunks that changed.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+import artifacts
+import embeddings
+from retrieval import Retriever
+from signatures import SignatureIndex
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeState:
+    def __init__(self, kb, embedder=None, vectors_path=None):
+        self.kb = kb
+        self.version = kb.version
+        self.loaded_at = time.time()
+        self.embedder = embedder
+        self.vectors_path = vectors_path
+        self._retriever = None
+        self._semantic = None
+        self._signatures = None
+        self._lock = threading.Lock()
+
+    @property
+    def retriever(self):
+        """BM25 index over this version's records, built on first use."""
+        if self._retriever is None:
+            with self._lock:
+                if self._retriever is None:
+                    self._retriever = Retriever.from_records(self.kb.records())
+        return self._retriever
+
+    @property
+    def semantic(self):
+        """Embeddings of the retriever's chunks (None with embeddings off), built on first use."""
+        if self.embedder is None:
+            return None
+        if self._semantic is None:
+            chunks = self.retriever.chunks
+            with self._lock:
+                if self._semantic is None:
+                    self._semantic = embeddings.load_or_build(self.vectors_path, self.embedder, chunks)
+        return self._semantic
+
+    @property
+    def signatures(self):
+        """Function name -> usage index over this version's records, built on first use."""
+        if self._signatures is None:
+            with self._lock:
+                if self._signatures is None:
+                    self._signatures = SignatureIndex.from_records(self.kb.records())
+        return self._signatures
+
+    def prebuilt(self, retriever, signatures):
+        """Use indexes loaded from a prebuilt artifact instead of building them."""
+        with self._lock:
+            self._retriever = retriever
+            self._signatures = signatures
+        return self
+
+    def warm(self):
+        self.retriever
+        self.signatures
+        self.semantic
+        return self
+
+    def info(self):
+        semantic = self.semantic
+        return {
+            "version": self.version,
+            "records": len(self.kb),
+            "signatures": len(self.signatures),
+            "embeddings": None if semantic is None else {
+                "embedder": self.embedder.name,
+                "chunks": len(semantic),
+                "embedded": semantic.embedded,
+            },
+            "loaded_at": self.loaded_at,
+        }
+
+
+class KnowledgeReloader:
+    def __init__(self, source, interval=30.0, embedder=None):
+        self.source = source
+        self.interval = interval
+        self.embedder = embedder
+        self.state = self._state()
+        self.reloads = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    async def reload(self, force=False):
+        """Rebuild derived state off the event loop and swap it in. Returns True if the version changed."""
+        async with self._lock:
+            if not force and not self.source.changed():
+                return False
+            state = await asyncio.to_thread(lambda: self._prepare(self._state()))
+            if state.version == self.state.version:
+                return False
+            self.state = state
+            self.reloads += 1
+            logger.info("Knowledge base reloaded: version %s", state.version)
+            return True
+
+    def _state(self):
+        return KnowledgeState(self.source.load(), self.embedder, embeddings.vectors_path(self.source))
+
+    def _prepare(self, state):
+        path = artifacts.artifacts_path(self.source)
+        prebuilt = artifacts.load(path, state.kb)
+        if prebuilt is not None:
+            return state.prebuilt(*prebuilt).warm()
+        state.warm()
+        if path is not None:
+            try:
+                artifacts.save(path, state.kb, state.retriever, state.signatures)
+            except OSError:
+                # A read-only image still works, it just builds on every start
+                logger.warning("Could not write knowledge artifact %s", path, exc_info=True)
+        return state
+
+    async def warm(self):
+        """Load or build the current version's indexes off the event loop."""
+        await asyncio.to_thread(self._prepare, self.state)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reload()
+            except Exception:
+                logger.exception("Knowledge base reload failed; keeping version %s", self.state.version)
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,249 @@
+"""
+Response cache in front of the model call.
+
+Answers are keyed on the normalized message and, optionally, matched against
+near-duplicate questions by Jaccard similarity of their word tokens. Entries are
+evicted LRU-first when the entry or byte cap is reached and expire after a TTL.
+The whole cache is dropped when the version (system prompt + knowledge base)
+changes. A request still on an older version (it took the knowledge base
+before a hot reload) neither reads nor writes, rather than switching the cache
+back and dropping the newer entries. An optional store (a SQLite file, or the shared state) keeps entries
+across restarts and shares them between workers: a local miss is looked up in
+the store before it counts as a miss. The store is read off the event loop
+(`fetch`) and the entry handed to `get`. An entry evicted to make room here
+stays in the store for the other workers; an expired one is deleted from it.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+PUNCT_RE = re.compile(r"[^\w\s]")
+SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(message):
+    text = PUNCT_RE.sub(" ", message.lower())
+    return SPACE_RE.sub(" ", text).strip()
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    answer: str
+    created_at: float
+    latency: float
+    terms: frozenset = None
+
+    @property
+    def size(self):
+        return len(self.key) + len(self.answer)
+
+
+class SQLiteResponseStore:
+    """
+    On-disk copy of the cache so it survives restarts.
+
+    The cache is used on the event loop, and a write can wait on another
+    worker holding the file, so writes are queued to one background thread
+    (in order) while reads use their own connection and return at once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, version TEXT, answer TEXT, created_at REAL, latency REAL)"
+        )
+        self._conn.commit()
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-writer")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write(self, sql, params):
+        self._writer.submit(self._execute, sql, params)
+
+    def _execute(self, sql, params):
+        try:
+            with self._lock:
+                self._conn.execute(sql, params)
+                self._conn.commit()
+        except sqlite3.Error:
+            # A lost write only costs a cache miss later
+            logger.warning("Response cache write failed", exc_info=True)
+
+    def flush(self):
+        """Wait until every queued write has been applied."""
+        self._writer.submit(lambda: None).result()
+
+    def load(self, version):
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT key, answer, created_at, latency FROM responses WHERE version = ? ORDER BY created_at",
+                (version,),
+            ).fetchall()
+        return [CacheEntry(key, answer, created_at, latency) for key, answer, created_at, latency in rows]
+
+    def get(self, key, version):
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT answer, created_at, latency FROM responses WHERE key = ? AND version = ?", (key, version),
+            ).fetchone()
+        return CacheEntry(key, *row) if row is not None else None
+
+    def save(self, version, entry):
+        self._write(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (entry.key, version, entry.answer, entry.created_at, entry.latency),
+        )
+
+    def delete(self, key):
+        self._write("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self, keep_version=None):
+        self._write("DELETE FROM responses WHERE version IS NOT ?", (keep_version,))
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1000, max_bytes=10_000_000, ttl_seconds=86400,
+                 similarity=0.0, store=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.store = store
+        self.version = None
+        self.bytes = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self.stale = 0
+        self._entries = OrderedDict()
+
+    def _set_version(self, version):
+        """Drop everything cached for an older system prompt / knowledge base."""
+        if version == self.version:
+            return
+        self._entries.clear()
+        self.bytes = 0
+        self.version = version
+        if self.store is not None:
+            self.store.clear(keep_version=version)
+            now = time.time()
+            for entry in self.store.load(version):
+                if now - entry.created_at < self.ttl_seconds:
+                    self._insert(entry, persist=False)
+
+    def _use(self, version, current):
+        """Switch to `version` unless a newer one (`current`) is being served; returns whether it may be used."""
+        if current is not None and version != current:
+            self.stale += 1
+            return False
+        self._set_version(version)
+        return True
+
+    def _remove(self, key, expired=False):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        if expired and self.store is not None:
+            self.store.delete(key)
+
+    def _insert(self, entry, persist=True):
+        if entry.key in self._entries:
+            self._remove(entry.key)
+        if self.similarity:
+            entry.terms = frozenset(tokenize(entry.key))
+        self._entries[entry.key] = entry
+        self.bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+        if persist and self.store is not None and entry.key in self._entries:
+            self.store.save(self.version, entry)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None or not self.similarity:
+            return entry, False
+        terms = frozenset(tokenize(key))
+        best, best_score = None, self.similarity
+        for candidate in self._entries.values():
+            score = jaccard(terms, candidate.terms)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best, best is not None
+
+    def fetch(self, message, version):
+        """
+        The stored entry for a message not cached here, for `get`. A read
+        that may wait on another worker, so it is done off the event loop.
+        """
+        key = normalize(message)
+        if self.store is None or (version == self.version and key in self._entries):
+            return None
+        return self.store.get(key, version)
+
+    def get(self, message, version, current=None, stored=None):
+        """Return the cached answer for a message (or a near-duplicate of it), or None; `stored` is from `fetch`."""
+        if not self._use(version, current):
+            return None
+        key = normalize(message)
+        entry, near = self._lookup(key)
+        if entry is None and stored is not None and stored.key == key:
+            # Answered by another worker sharing the store since this one loaded it
+            entry = stored
+            self._insert(entry, persist=False)
+        if entry is not None and time.time() - entry.created_at >= self.ttl_seconds:
+            self._remove(entry.key, expired=True)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(entry.key)
+        self.hits += 1
+        self.near_hits += near
+        self.latency_saved += entry.latency
+        return entry.answer
+
+    def put(self, message, version, answer, latency, current=None):
+        if self._use(version, current):
+            self._insert(CacheEntry(normalize(message), answer, time.time(), latency))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+            "stale_version_skips": self.stale,
+            "persistent": self.store is not None,
+        }
+
@@ -0,0 +1,219 @@
+"""
+Retrieval over the eCOMET knowledge base.
+
+Knowledge base records are split into chunks (page paragraphs packed up to a
+size cap, one per R function block) and indexed with BM25, so each chat
+request only carries the few chunks relevant to it instead of the whole file.
+When a semantic index over the same chunks is given (see embeddings.py), the
+BM25 and cosine rankings are merged with reciprocal rank fusion.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from knowledge import KnowledgeBase, estimate_tokens, record_body, split_r_source
+
+MAX_CHUNK_CHARS = 2400
+
+# Candidates each ranking contributes to fusion, and the usual RRF damping constant
+FUSION_DEPTH = 20
+RRF_K = 60
+
+WORD_RE = re.compile(r"[A-Za-z0-9_.]+")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z]|\d|\b)|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "of", "on", "or", "that", "the", "this",
+    "to", "use", "what", "when", "which", "with", "you", "my", "me", "should",
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens, plus camelCase / snake_case parts of identifiers."""
+    tokens = []
+    for word in WORD_RE.findall(text):
+        word = word.strip("._")
+        if not word:
+            continue
+        lower = word.lower()
+        if lower not in STOPWORDS:
+            tokens.append(lower)
+        parts = [p.lower() for piece in re.split(r"[_.]", word) for p in CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p not in STOPWORDS and len(p) > 1)
+    return tokens
+
+
+@dataclass
+class Chunk:
+    id: int
+    title: str
+    source: str
+    kind: str  # record kind: "reference", "article" or "source"
+    text: str
+
+    @property
+    def tokens(self):
+        return estimate_tokens(self.text)
+
+    def render(self):
+        header = f"### {self.title}"
+        if self.source:
+            header += f"\nSource: {self.source}"
+        return f"{header}\n{self.text}"
+
+
+def _split_paragraphs(lines):
+    blocks, current = [], []
+    for line in lines:
+        if not line.strip():
+            if current:
+                blocks.append(current)
+                current = []
+            continue
+        current.append(line)
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def _pack(blocks, max_chars):
+    """Greedily merge consecutive blocks into pieces of at most max_chars."""
+    pieces, current, size = [], [], 0
+    for block in blocks:
+        # Hard-split a single oversized block at line boundaries
+        while sum(len(l) + 1 for l in block) > max_chars:
+            head, rest, used = [], list(block), 0
+            while rest and (not head or used + len(rest[0]) + 1 <= max_chars):
+                used += len(rest[0]) + 1
+                head.append(rest.pop(0))
+            if current:
+                pieces.append(current)
+                current, size = [], 0
+            pieces.append(head)
+            block = rest
+        if not block:
+            continue
+        block_size = sum(len(l) + 1 for l in block)
+        if current and size + block_size > max_chars:
+            pieces.append(current)
+            current, size = [], 0
+        current.extend(block)
+        size += block_size
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_records(records, max_chars=MAX_CHUNK_CHARS):
+    """Turn knowledge base records into retrieval Chunks of at most max_chars."""
+    chunks, seen = [], set()
+    for record in records:
+        lines = record_body(record).splitlines()
+        if record["kind"] == "source":
+            blocks = split_r_source(lines)
+            # R function records are titled by function name; keep the file for context
+            path = record["source_url"].rsplit("/blob/main/", 1)[-1]
+            title = record["title"] if record["title"] == path else f"{path}: {record['title']}"
+        else:
+            blocks = _split_paragraphs(lines)
+            title = record["title"]
+        for piece in _pack(blocks, max_chars):
+            piece_text = "\n".join(piece).strip()
+            if not piece_text or piece_text in seen:
+                continue
+            seen.add(piece_text)
+            chunks.append(Chunk(
+                id=len(chunks),
+                title=title,
+                source=record["source_url"],
+                kind=record["kind"],
+                text=piece_text,
+            ))
+    return chunks
+
+
+class BM25Index:
+    """Minimal in-memory BM25 (Okapi) index."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = []
+        self.postings = defaultdict(list)
+        for doc_id, tokens in enumerate(documents):
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((doc_id, tf))
+        self.n_docs = len(self.doc_lengths)
+        self.avg_length = (sum(self.doc_lengths) / self.n_docs) if self.n_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (self.n_docs - len(posts) + 0.5) / (len(posts) + 0.5))
+            for term, posts in self.postings.items()
+        }
+
+    def search(self, query_tokens, top_k=5):
+        scores = defaultdict(float)
+        for term in set(query_tokens):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
+
+
+def fuse(rankings, k=RRF_K):
+    """Reciprocal rank fusion of (doc_id, score) rankings; only ranks count, so BM25 and cosine scores needn't be comparable."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, (doc_id, _score) in enumerate(ranking):
+            scores[doc_id] += 1 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class Retriever:
+    """Chunks + BM25 index, with token-budgeted context assembly."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        # Titles carry function / page names, so count them twice
+        self.index = BM25Index([tokenize(c.title) * 2 + tokenize(c.text) for c in chunks])
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(chunk_records(records))
+
+    @classmethod
+    def from_text(cls, text):
+        return cls.from_records(KnowledgeBase.from_text(text).records())
+
+    def search(self, query, top_k=5, semantic=None):
+        """Top-k (chunk, score) by BM25, or by fused BM25 and cosine rank when a semantic index is given."""
+        if semantic is None:
+            ranked = self.index.search(tokenize(query), top_k)
+        else:
+            depth = max(top_k, FUSION_DEPTH)
+            ranked = fuse([self.index.search(tokenize(query), depth), semantic.search(query, depth)])[:top_k]
+        return [(self.chunks[doc_id], score) for doc_id, score in ranked]
+
+    def context_chunks(self, query, top_k=5, token_budget=6000, semantic=None):
+        """The rendered top-k chunks for a query, most relevant first, skipping any that would exceed the token budget."""
+        parts, used = [], 0
+        for chunk, _score in self.search(query, top_k, semantic):
+            rendered = chunk.render()
+            cost = estimate_tokens(rendered)
+            if used + cost > token_budget:
+                continue
+            parts.append(rendered)
+            used += cost
+        return parts
+
+    def build_context(self, query, top_k=5, token_budget=6000, semantic=None):
+        """Return the rendered top-k chunks for a query, stopping at the token budget."""
+        return "\n\n".join(self.context_chunks(query, top_k, token_budget, semantic))
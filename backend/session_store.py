@@ -0,0 +1,119 @@
+"""
+Server-side conversation sessions.
+
+Each session keeps its recent turns so follow-up questions have context.
+Sessions are evicted LRU-first beyond `max_sessions` and after `ttl_seconds`
+of inactivity. When a session's turns exceed `token_budget`, the oldest turns
+are folded into a short extractive summary (the questions asked so far), so a
+long conversation costs about the same per turn as a short one.
+
+With a `shared` backend (see shared_state.py) sessions are read from and
+written to it on every turn instead of held in memory, so a conversation can
+continue on any worker.
+"""
+
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+
+from knowledge import estimate_tokens
+
+
+@dataclass
+class Session:
+    id: str
+    turns: list = field(default_factory=list)  # [(role, text)], role is "user" or "model"
+    summary: str = ""
+    tokens: int = 0
+    updated_at: float = field(default_factory=time.time)
+    compactions: int = 0
+
+    def history(self):
+        """Turns in the {"role", "parts"} form the model backends take."""
+        return [{"role": role, "parts": [text]} for role, text in self.turns]
+
+
+class SessionStore:
+    def __init__(self, max_sessions=1000, ttl_seconds=3600, token_budget=2000, summary_tokens=300, shared=None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.evictions = 0
+        self.shared = shared
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        if self.shared is not None:
+            return self.shared.count_sessions(self.ttl_seconds)
+        return len(self._sessions)
+
+    def _expire(self):
+        now = time.time()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.updated_at < self.ttl_seconds and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def known(self, session_id):
+        """True if `session_id` was issued here and is still live (a client can't make one up)."""
+        if not session_id:
+            return False
+        if self.shared is not None:
+            return self.shared.get_session(session_id, self.ttl_seconds) is not None
+        self._expire()
+        return session_id in self._sessions
+
+    def get(self, session_id):
+        """Return the session (refreshing its LRU position), or a new one with a fresh id if unknown or expired."""
+        if self.shared is not None:
+            data = self.shared.get_session(session_id, self.ttl_seconds) if session_id else None
+            if data is None:
+                return Session(id=uuid.uuid4().hex)
+            # JSON has no tuples
+            return Session(**dict(data, turns=[tuple(turn) for turn in data["turns"]]))
+        self._expire()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            session = Session(id=uuid.uuid4().hex)
+            self._sessions[session.id] = session
+            self._expire()
+        self._sessions.move_to_end(session.id)
+        return session
+
+    def append(self, session, user, answer):
+        session.turns += [("user", user), ("model", answer)]
+        session.tokens += estimate_tokens(user) + estimate_tokens(answer)
+        session.updated_at = time.time()
+        self._compact(session)
+        if self.shared is not None:
+            self.shared.put_session(session.id, asdict(session), self.ttl_seconds)
+
+    def _compact(self, session):
+        """Fold the oldest question/answer pairs into the summary until the turns fit the budget."""
+        dropped = []
+        while session.tokens > self.token_budget and len(session.turns) > 2:
+            (_, user), (_, answer) = session.turns[:2]
+            session.turns = session.turns[2:]
+            session.tokens -= estimate_tokens(user) + estimate_tokens(answer)
+            dropped.append(user.strip().splitlines()[0] if user.strip() else "")
+        if not dropped:
+            return
+        session.compactions += 1
+        asked = "; ".join(q for q in dropped if q)
+        summary = f"{session.summary}; {asked}" if session.summary else f"Earlier the user asked: {asked}"
+        # Keep the most recent part of the summary within its own budget
+        max_chars = self.summary_tokens * 4
+        if len(summary) > max_chars:
+            summary = "Earlier the user asked: ..." + summary[-max_chars:]
+        session.summary = summary
+
+    def stats(self):
+        return {
+            "sessions": len(self),
+            "evictions": self.evictions,
+            "token_budget": self.token_budget,
+        }
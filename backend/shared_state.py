@@ -0,0 +1,378 @@
+"""
+State shared by every worker process (and replica).
+
+Running uvicorn with `--workers N`, or several replicas, means each process
+has its own globals. Everything that must look the same from every worker
+goes through one shared-state object instead:
+
+- config: `get_config(name)` / `set_config(name, value)`, e.g. the admin-set system prompt
+- logs: `write_logs(rows)`, `query_logs(...)`, `count_logs()`
+- sessions: `get_session(id, ttl)`, `put_session(id, data)`, `count_sessions(ttl)`
+- rate limits: `take(key, rate, capacity, cost)`, a token bucket updated atomically
+- response cache: `responses`, a store with the `load/get/save/delete/clear`
+  methods ResponseCache uses (and `flush`, which waits for queued writes)
+
+`SQLiteState` keeps all of it in one SQLite file (WAL mode), which is enough
+for any number of workers on one host. `RedisState` keeps it in Redis (or
+anything speaking its protocol) for replicas on several hosts; it needs the
+optional `redis` package. `get_shared_state()` picks one from
+SHARED_STATE_URL.
+
+Reads return at once, but a write (`take`, `put_session`, `set_config`) can
+wait on another process holding the file (or a round trip to Redis), so async
+code calls them through `asyncio.to_thread` rather than on the event loop.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from response_cache import CacheEntry, SQLiteResponseStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    user TEXT NOT NULL,
+    bot TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_ts ON logs (ts);
+CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5 (user, bot, content='logs', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS logs_ai AFTER INSERT ON logs BEGIN
+    INSERT INTO logs_fts (rowid, user, bot) VALUES (new.id, new.user, new.bot);
+END;
+CREATE TRIGGER IF NOT EXISTS logs_ad AFTER DELETE ON logs BEGIN
+    INSERT INTO logs_fts (logs_fts, rowid, user, bot) VALUES ('delete', old.id, old.user, old.bot);
+END;
+CREATE TABLE IF NOT EXISTS config (name TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL);
+"""
+
+# Rate-limit buckets idle this long have refilled and are dropped
+BUCKET_IDLE_SECONDS = 3600
+# Expired sessions and idle buckets are pruned once every this many writes
+PRUNE_EVERY = 1000
+
+
+def fts_query(text):
+    """Quote each word so user input is never parsed as FTS5 syntax."""
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+def refill(tokens, updated_at, now, rate, capacity):
+    return capacity if tokens is None else min(capacity, tokens + (now - updated_at) * rate)
+
+
+def retry_after(tokens, rate, cost):
+    return (cost - tokens) / rate if rate > 0 else float("inf")
+
+
+class SQLiteState:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._writes = 0
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        # Reads on the request path never wait behind a write (WAL readers don't block on writers),
+        # and log searches get their own connection so they never hold up the request path either
+        self._lookup_lock = threading.Lock()
+        self._lookup = self._connect()
+        self._reader = self._connect()
+        self.responses = SQLiteResponseStore(path)
+
+    def _connect(self):
+        # Autocommit; multi-statement writes open their own transaction
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """One write transaction; IMMEDIATE takes the file's write lock up front, so read-modify-write is atomic across processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            self._writes += 1
+
+    def _maybe_prune(self, conn, now):
+        if self._writes % PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - BUCKET_IDLE_SECONDS,))
+
+    # Config
+
+    def get_config(self, name, default=None):
+        with self._lookup_lock:
+            row = self._lookup.execute("SELECT value FROM config WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else default
+
+    def set_config(self, name, value):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO config VALUES (?, ?, ?)", (name, value, time.time()))
+
+    # Logs
+
+    def write_logs(self, rows):
+        """Append (ts, timestamp, user, bot) rows."""
+        with self._transaction() as conn:
+            conn.executemany("INSERT INTO logs (ts, timestamp, user, bot) VALUES (?, ?, ?, ?)", rows)
+
+    def query_logs(self, cursor=None, limit=50, since=None, until=None, search=None):
+        """Newest-first page of logs; pass the returned next_cursor to get the following page."""
+        clauses, params = [], []
+        if cursor is not None:
+            clauses.append("logs.id < ?")
+            params.append(cursor)
+        if since is not None:
+            clauses.append("logs.ts >= ?")
+            params.append(since.timestamp())
+        if until is not None:
+            clauses.append("logs.ts < ?")
+            params.append(until.timestamp())
+
+        sql = "SELECT logs.id, logs.timestamp, logs.user, logs.bot FROM logs"
+        if search:
+            sql += " JOIN logs_fts ON logs_fts.rowid = logs.id"
+            clauses.append("logs_fts MATCH ?")
+            params.append(fts_query(search))
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY logs.id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._read_lock:
+            rows = self._reader.execute(sql, params).fetchall()
+        items = [{"id": r[0], "timestamp": r[1], "user": r[2], "bot": r[3]} for r in rows[:limit]]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def count_logs(self):
+        with self._read_lock:
+            return self._reader.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+    # Sessions
+
+    def get_session(self, session_id, ttl):
+        with self._lookup_lock:
+            row = self._lookup.execute(
+                "SELECT data FROM sessions WHERE id = ? AND updated_at >= ?", (session_id, time.time() - ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put_session(self, session_id, data, ttl):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session_id, json.dumps(data), now))
+            if self._writes % PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - ttl,))
+
+    def count_sessions(self, ttl):
+        with self._lookup_lock:
+            return self._lookup.execute(
+                "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (time.time() - ttl,),
+            ).fetchone()[0]
+
+    # Rate limits
+
+    def take(self, key, rate, capacity, cost=1.0):
+        """
+        Take `cost` tokens from the bucket `key` (refilling at `rate` per second
+        up to `capacity`). Returns (allowed, seconds until it would be allowed).
+        A negative cost puts tokens back.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = refill(*(row or (None, None)), now, rate, capacity)
+            allowed = tokens >= cost
+            if allowed:
+                tokens = min(capacity, tokens - cost)
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (key, tokens, now))
+            self._maybe_prune(conn, now)
+        return allowed, 0.0 if allowed else retry_after(tokens, rate, cost)
+
+    def info(self):
+        return {"backend": "sqlite", "path": self.path}
+
+
+# Token bucket as one atomic script: KEYS[1] bucket; ARGV now, rate, capacity, cost, idle ttl
+TAKE_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local now, rate, capacity, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = capacity
+if state[1] then
+    tokens = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+    tokens = math.min(capacity, tokens - cost)
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisResponseStore:
+    """ResponseCache store with one hash of entries per prompt version."""
+
+    def __init__(self, client, prefix, ttl_seconds=86400):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self._version = None
+
+    def _key(self, version):
+        return f"{self.prefix}responses:{version}"
+
+    @staticmethod
+    def _entry(key, raw):
+        data = json.loads(raw)
+        return CacheEntry(key, data["answer"], data["created_at"], data["latency"])
+
+    def load(self, version):
+        self._version = version
+        entries = [self._entry(k.decode(), v) for k, v in self.client.hgetall(self._key(version)).items()]
+        return sorted(entries, key=lambda e: e.created_at)
+
+    def get(self, key, version):
+        raw = self.client.hget(self._key(version), key)
+        return self._entry(key, raw) if raw is not None else None
+
+    def save(self, version, entry):
+        self._version = version
+        data = {"answer": entry.answer, "created_at": entry.created_at, "latency": entry.latency}
+        with self.client.pipeline() as pipe:
+            pipe.hset(self._key(version), entry.key, json.dumps(data))
+            pipe.expire(self._key(version), self.ttl_seconds)
+            pipe.execute()
+
+    def flush(self):
+        """Writes are applied as they're made; nothing is queued."""
+
+    def delete(self, key):
+        if self._version is not None:
+            self.client.hdel(self._key(self._version), key)
+
+    def clear(self, keep_version=None):
+        self._version = keep_version
+        keep = self._key(keep_version).encode()
+        for name in self.client.scan_iter(match=f"{self.prefix}responses:*"):
+            if name != keep:
+                self.client.delete(name)
+
+
+class RedisState:
+    """
+    Logs are a hash of id -> JSON row plus a sorted set of ids for paging;
+    search is a case-insensitive match of every word, checked while paging.
+    """
+
+    def __init__(self, url, prefix="ecomet:", response_ttl=86400):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SHARED_STATE_URL points at Redis but the `redis` package is not installed") from e
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._take = self.client.register_script(TAKE_SCRIPT)
+        self.responses = RedisResponseStore(self.client, prefix, ttl_seconds=response_ttl)
+
+    def _key(self, name):
+        return f"{self.prefix}{name}"
+
+    # Config
+
+    def get_config(self, name, default=None):
+        value = self.client.hget(self._key("config"), name)
+        return value.decode() if value is not None else default
+
+    def set_config(self, name, value):
+        self.client.hset(self._key("config"), name, value)
+
+    # Logs
+
+    def write_logs(self, rows):
+        first = self.client.incrby(self._key("logs:id"), len(rows)) - len(rows) + 1
+        with self.client.pipeline() as pipe:
+            for log_id, (ts, timestamp, user, bot) in enumerate(rows, start=first):
+                pipe.hset(self._key("logs"), log_id, json.dumps({"ts": ts, "timestamp": timestamp, "user": user, "bot": bot}))
+                pipe.zadd(self._key("logs:order"), {log_id: log_id})
+            pipe.execute()
+
+    def query_logs(self, cursor=None, limit=50, since=None, until=None, search=None):
+        words = [w.lower() for w in (search or "").split()]
+        items, top, page = [], (cursor - 1) if cursor is not None else "+inf", max(limit * 4, 100)
+        while len(items) <= limit:
+            ids = self.client.zrevrangebyscore(self._key("logs:order"), top, "-inf", start=0, num=page)
+            if not ids:
+                break
+            for log_id, raw in zip(ids, self.client.hmget(self._key("logs"), ids)):
+                row = json.loads(raw)
+                text = f"{row['user']}\n{row['bot']}".lower()
+                if since is not None and row["ts"] < since.timestamp():
+                    continue
+                if until is not None and row["ts"] >= until.timestamp():
+                    continue
+                if not all(word in text for word in words):
+                    continue
+                items.append({"id": int(log_id), "timestamp": row["timestamp"], "user": row["user"], "bot": row["bot"]})
+            top = f"({int(ids[-1])}"
+        next_cursor = items[limit - 1]["id"] if len(items) > limit else None
+        return {"items": items[:limit], "next_cursor": next_cursor}
+
+    def count_logs(self):
+        return self.client.hlen(self._key("logs"))
+
+    # Sessions
+
+    def get_session(self, session_id, ttl):
+        raw = self.client.get(self._key(f"session:{session_id}"))
+        return json.loads(raw) if raw is not None else None
+
+    def put_session(self, session_id, data, ttl):
+        with self.client.pipeline() as pipe:
+            pipe.set(self._key(f"session:{session_id}"), json.dumps(data), ex=int(ttl))
+            pipe.zadd(self._key("sessions"), {session_id: time.time()})
+            pipe.execute()
+
+    def count_sessions(self, ttl):
+        key = self._key("sessions")
+        self.client.zremrangebyscore(key, "-inf", time.time() - ttl)
+        return self.client.zcard(key)
+
+    # Rate limits
+
+    def take(self, key, rate, capacity, cost=1.0):
+        allowed, tokens = self._take(
+            keys=[self._key(f"bucket:{key}")],
+            args=[time.time(), rate, capacity, cost, BUCKET_IDLE_SECONDS],
+        )
+        return bool(allowed), 0.0 if allowed else retry_after(float(tokens), rate, cost)
+
+    def info(self):
+        return {"backend": "redis", "prefix": self.prefix}
+
+
+def get_shared_state():
+    """SHARED_STATE_URL: a redis:// (rediss://, unix://) URL, or a SQLite path (default LOG_DB_PATH)."""
+    url = os.getenv("SHARED_STATE_URL", "")
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisState(url, prefix=os.getenv("SHARED_STATE_PREFIX", "ecomet:"),
+                          response_ttl=int(os.getenv("RESPONSE_CACHE_TTL", "86400")))
+    return SQLiteState(url or os.getenv("LOG_DB_PATH", "chat_logs.db"))
@@ -0,0 +1,137 @@
+"""
+Function signature index for instant usage lookups.
+
+Questions like "what are the arguments of GetDAMs" or "how to call LoadMMO"
+are plain lookups. The index maps each function name found in a record's usage
+to that record's usage, arguments and examples, matches names fuzzily (case,
+typos) with difflib, and renders an answer directly, so these questions need
+no retrieval and no model call.
+
+Only a message that is nothing but a lookup counts: the whole message must
+fit one of the LOOKUP_PATTERNS. A question that mentions a function and an
+argument but is really about an error ("why does GetDAMs fail with an
+argument error?") or a task ("how do I use GetDAMs to compare my groups and
+plot it?") goes to the model like any other.
+"""
+
+import difflib
+import re
+from dataclasses import dataclass
+
+# `Name <- function(` in R source, `Name(` in rendered reference usage
+USAGE_NAME_RE = re.compile(r"^\s*([A-Za-z.][\w.]*)\s*(?:<-\s*function\s*)?\(", re.MULTILINE)
+R_DEFINITION_RE = re.compile(r"^(\s*[A-Za-z.][\w.]*)\s*<-\s*function\s*\(", re.MULTILINE)
+ARGUMENT_LINE_RE = re.compile(r"^- (\S+) ", re.MULTILINE)
+
+_FIELD = r"(?:arguments?|args|param(?:eter)?s?|usage|signature|syntax|inputs?)"
+_FIELDS = rf"{_FIELD}(?:\s+(?:and|&)\s+{_FIELD})?"
+_NAME = r"`?(?P<name>[A-Za-z.][\w.]*)(?:\(\))?`?"
+_ASK = r"(?:(?:please|can you|could you)\s+)?"
+# Whole-message forms of a plain lookup, matched after trailing punctuation is stripped
+LOOKUP_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    # "what are the arguments of GetDAMs", "show me the usage for VolcanoPlot", "arguments of GetDAMs"
+    rf"{_ASK}(?:(?:what|which)\s+(?:are|is)\s+|what's\s+|show(?:\s+me)?\s+|list\s+|give\s+me\s+|tell\s+me\s+)?"
+    rf"(?:the\s+|all\s+)?{_FIELDS}\s+(?:of|for|to|in)\s+{_NAME}",
+    # "GetDAMs arguments", "VolcanoPlot usage"
+    rf"{_NAME}(?:'s)?\s+{_FIELDS}",
+    # "how to call LoadMMO", "how do I use GetDAMs"
+    rf"how\s+(?:do\s+i|to|should\s+i|can\s+i|do\s+you)\s+(?:call|use|run)\s+{_NAME}",
+    # "what arguments does GetDAMs take"
+    rf"(?:what|which)\s+{_FIELDS}\s+(?:does|do)\s+{_NAME}\s+(?:take|accept|need|have|expect)",
+)]
+# Reference pages are written for users; prefer them over a source block of the same name
+KIND_RANK = {"reference": 2, "source": 1}
+
+
+@dataclass
+class Signature:
+    name: str
+    usage: str
+    arguments: str
+    examples: str
+    description: str
+    source_url: str
+    kind: str
+
+    def render(self):
+        """Markdown answer built from the record alone."""
+        parts = [f"**{self.name}**" + (f": {self.description.strip()}" if self.description.strip() else "")]
+        # Show source definitions as calls: `Name <- function(x)` becomes `Name(x)`
+        usage = R_DEFINITION_RE.sub(r"\1(", self.usage.strip())
+        parts.append(f"**Usage**\n```r\n{usage}\n```")
+        if self.arguments.strip():
+            parts.append("**Arguments**\n" + ARGUMENT_LINE_RE.sub(r"- `\1`: ", self.arguments.strip()))
+        if self.examples.strip():
+            parts.append(f"**Examples**\n```r\n{self.examples.strip()}\n```")
+        parts.append(f"Source: {self.source_url}")
+        parts.append(
+            "**Next steps**\n"
+            f"- Ask for a worked example using `{self.name}` on your data\n"
+            f"- Ask what each argument of `{self.name}` does in more detail\n"
+            "- Ask which functions usually come before or after it in the workflow"
+        )
+        return "\n\n".join(parts)
+
+    def as_documentation(self):
+        """The single record to ground a model answer in."""
+        parts = [f"### {self.name}", f"Source: {self.source_url}"]
+        if self.description.strip():
+            parts.append(self.description.strip())
+        parts.append(f"Usage:\n{self.usage.strip()}")
+        if self.arguments.strip():
+            parts.append(f"Arguments:\n{self.arguments.strip()}")
+        if self.examples.strip():
+            parts.append(f"Examples:\n{self.examples.strip()}")
+        return "\n\n".join(parts)
+
+
+class SignatureIndex:
+    def __init__(self, signatures, cutoff=0.85):
+        self.cutoff = cutoff
+        self._by_name = {s.name.lower(): s for s in signatures}
+
+    @classmethod
+    def from_records(cls, records, cutoff=0.85):
+        best = {}
+        for record in records:
+            kind = record.get("kind")
+            usage = record.get("usage") or ""
+            if kind not in KIND_RANK or not usage.strip():
+                continue
+            for name in dict.fromkeys(USAGE_NAME_RE.findall(usage)):
+                current = best.get(name.lower())
+                # Later records win ties: newer builds of the R source are scraped after older ones
+                if current is not None and KIND_RANK[current.kind] > KIND_RANK[kind]:
+                    continue
+                best[name.lower()] = Signature(
+                    name=name,
+                    usage=usage,
+                    arguments=record.get("arguments") or "",
+                    examples=record.get("examples") or "",
+                    description=record.get("description") or "",
+                    source_url=record.get("source_url") or "",
+                    kind=kind,
+                )
+        return cls(best.values(), cutoff=cutoff)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def get(self, name):
+        """Exact (case-insensitive) or close fuzzy match for a function name."""
+        key = name.lower()
+        if key in self._by_name:
+            return self._by_name[key]
+        if len(key) < 4:
+            return None
+        matches = difflib.get_close_matches(key, self._by_name, n=1, cutoff=self.cutoff)
+        return self._by_name[matches[0]] if matches else None
+
+    def match(self, message):
+        """The signature a lookup question asks about, or None if the message is anything more than a plain lookup."""
+        text = " ".join(message.split()).rstrip("?.! ")
+        for pattern in LOOKUP_PATTERNS:
+            found = pattern.fullmatch(text)
+            if found:
+                return self.get(found.group("name"))
+        return None
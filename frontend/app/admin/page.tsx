@@ -7,9 +7,12 @@ export default function AdminPage() {
     const [password, setPassword] = useState("");
     const [isAuthenticated, setIsAuthenticated] = useState(false);
     const [logs, setLogs] = useState<any[]>([]);
+    const [nextCursor, setNextCursor] = useState<number | null>(null);
+    const [search, setSearch] = useState("");
     const [systemPrompt, setSystemPrompt] = useState("");
     const [status, setStatus] = useState("");
     const [activeTab, setActiveTab] = useState("logs");
+    const [stats, setStats] = useState<any>(null);
 
     // Use environment variable for backend URL (Systematic Approach)
     const baseUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
@@ -33,9 +36,17 @@ export default function AdminPage() {
         }
     };
 
-    const fetchLogs = async () => {
-        const res = await fetch(`${baseUrl}/admin/logs?password=${password}`);
-        if (res.ok) setLogs(await res.json());
+    // Logs come back newest-first, one page at a time
+    const fetchLogs = async (cursor: number | null = null) => {
+        const params = new URLSearchParams({ password, limit: "50" });
+        if (cursor !== null) params.set("cursor", String(cursor));
+        if (search.trim()) params.set("q", search.trim());
+        const res = await fetch(`${baseUrl}/admin/logs?${params}`);
+        if (res.ok) {
+            const data = await res.json();
+            setLogs((prev) => (cursor === null ? data.items : [...prev, ...data.items]));
+            setNextCursor(data.next_cursor);
+        }
     };
 
     const fetchPrompt = async () => {
@@ -46,6 +57,11 @@ export default function AdminPage() {
         }
     };
 
+    const fetchStats = async () => {
+        const res = await fetch(`${baseUrl}/admin/stats?password=${password}`);
+        if (res.ok) setStats(await res.json());
+    };
+
     const updatePrompt = async () => {
         const res = await fetch(`${baseUrl}/admin/system-prompt`, {
             method: "POST",
@@ -53,6 +69,7 @@ export default function AdminPage() {
             body: JSON.stringify({ new_prompt: systemPrompt, password }),
         });
         if (res.ok) setStatus("Prompt updated successfully!");
+        else if (res.status === 413) setStatus(`Prompt rejected: ${(await res.json()).detail}`);
         else setStatus("Failed to update prompt.");
     };
 
@@ -97,20 +114,44 @@ export default function AdminPage() {
                     >
                         System Prompt
                     </button>
+                    <button
+                        onClick={() => { setActiveTab("metrics"); fetchStats(); }}
+                        className={clsx("px-4 py-2 rounded", activeTab === "metrics" ? "bg-[#158CBA] text-white" : "bg-white text-gray-700 hover:bg-gray-100")}
+                    >
+                        Metrics
+                    </button>
                 </div>
 
                 {activeTab === "logs" && (
                     <div className="bg-white p-6 rounded shadow">
                         <h2 className="text-lg font-bold mb-4">User Interactions</h2>
+                        <div className="flex space-x-2 mb-4">
+                            <input
+                                type="text"
+                                value={search}
+                                onChange={(e) => setSearch(e.target.value)}
+                                onKeyDown={(e) => e.key === "Enter" && fetchLogs()}
+                                placeholder="Search logs"
+                                className="flex-1 p-2 border rounded"
+                            />
+                            <button onClick={() => fetchLogs()} className="bg-[#158CBA] text-white px-4 py-2 rounded hover:bg-blue-600">
+                                Search
+                            </button>
+                        </div>
                         <div className="space-y-4">
-                            {logs.length === 0 ? <p className="text-gray-500">No logs yet.</p> : logs.slice().reverse().map((log, i) => (
-                                <div key={i} className="border-b pb-4">
+                            {logs.length === 0 ? <p className="text-gray-500">No logs yet.</p> : logs.map((log) => (
+                                <div key={log.id} className="border-b pb-4">
                                     <p className="text-xs text-gray-400">{log.timestamp}</p>
                                     <p className="font-semibold text-[#158CBA]">User: {log.user}</p>
                                     <p className="text-gray-700 mt-1">Bot: {log.bot}</p>
                                 </div>
                             ))}
                         </div>
+                        {nextCursor !== null && (
+                            <button onClick={() => fetchLogs(nextCursor)} className="mt-4 px-4 py-2 rounded bg-white border text-gray-700 hover:bg-gray-100">
+                                Load more
+                            </button>
+                        )}
                     </div>
                 )}
 
@@ -130,6 +171,81 @@ export default function AdminPage() {
                         </div>
                     </div>
                 )}
+
+                {activeTab === "metrics" && (
+                    <div className="bg-white p-6 rounded shadow">
+                        <div className="flex justify-between items-center mb-4">
+                            <h2 className="text-lg font-bold">Request Metrics</h2>
+                            <button onClick={fetchStats} className="px-4 py-2 rounded bg-white border text-gray-700 hover:bg-gray-100">
+                                Refresh
+                            </button>
+                        </div>
+                        {!stats ? <p className="text-gray-500">Loading...</p> : (
+                            <div className="space-y-6">
+                                <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
+                                    {Object.entries(stats.metrics.chat_requests_total).map(([key, value]) => (
+                                        <div key={key} className="border rounded p-3">
+                                            <p className="text-xs text-gray-400">{key}</p>
+                                            <p className="text-2xl font-semibold text-[#158CBA]">{String(value)}</p>
+                                        </div>
+                                    ))}
+                                    {Object.entries(stats.metrics.signature_lookups_total).map(([key, value]) => (
+                                        <div key={`signature-${key}`} className="border rounded p-3">
+                                            <p className="text-xs text-gray-400">signature lookup {key}</p>
+                                            <p className="text-2xl font-semibold text-[#158CBA]">{String(value)}</p>
+                                        </div>
+                                    ))}
+                                    {Object.entries(stats.metrics.llm_tokens_total).map(([key, value]) => (
+                                        <div key={key} className="border rounded p-3">
+                                            <p className="text-xs text-gray-400">{key} tokens</p>
+                                            <p className="text-2xl font-semibold text-[#158CBA]">{String(value)}</p>
+                                        </div>
+                                    ))}
+                                </div>
+                                <table className="w-full text-sm">
+                                    <thead>
+                                        <tr className="text-left text-gray-500 border-b">
+                                            <th className="py-2">Latency (seconds)</th>
+                                            <th>Count</th>
+                                            <th>Mean</th>
+                                            <th>p50</th>
+                                            <th>p95</th>
+                                            <th>p99</th>
+                                        </tr>
+                                    </thead>
+                                    <tbody>
+                                        {[
+                                            ["request", stats.metrics.chat_request_seconds],
+                                            ["stage", stats.metrics.chat_stage_seconds],
+                                            ["queue wait", stats.metrics.chat_queue_wait_seconds],
+                                            ["first token", stats.metrics.chat_first_token_seconds],
+                                            ["signature answer", stats.metrics.signature_answer_seconds],
+                                        ].flatMap(([group, series]: any) =>
+                                            Object.entries(series).map(([key, row]: any) => (
+                                                <tr key={`${group}-${key}`} className="border-b">
+                                                    <td className="py-2">{group}: {key}</td>
+                                                    <td>{row.count}</td>
+                                                    <td>{row.mean ?? "-"}</td>
+                                                    <td>{row.p50 ?? "> max"}</td>
+                                                    <td>{row.p95 ?? "> max"}</td>
+                                                    <td>{row.p99 ?? "> max"}</td>
+                                                </tr>
+                                            ))
+                                        )}
+                                    </tbody>
+                                </table>
+                                {Object.keys(stats.metrics.chat_errors_total).length > 0 && (
+                                    <div>
+                                        <h3 className="font-semibold mb-2">Errors</h3>
+                                        {Object.entries(stats.metrics.chat_errors_total).map(([key, value]) => (
+                                            <p key={key} className="text-red-600">{key}: {String(value)}</p>
+                                        ))}
+                                    </div>
+                                )}
+                            </div>
+                        )}
+                    </div>
+                )}
             </div>
         </div>
     );
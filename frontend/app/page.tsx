@@ -11,12 +11,45 @@ interface Message {
   content: string;
 }
 
+function parseEvent(raw: string) {
+  let type = "message";
+  let data = "";
+  for (const line of raw.split("\n")) {
+    if (line.startsWith("event:")) type = line.slice(6).trim();
+    else if (line.startsWith("data:")) data += line.slice(5).trim();
+  }
+  return { type, data: data ? JSON.parse(data) : {} };
+}
+
+// Seconds to wait from a Retry-After header (delay in seconds, or an HTTP date)
+function retryAfterSeconds(header: string | null) {
+  const seconds = Number(header);
+  if (header && Number.isFinite(seconds)) return Math.max(1, Math.ceil(seconds));
+  const date = header ? Date.parse(header) : NaN;
+  return Number.isNaN(date) ? 5 : Math.max(1, Math.ceil((date - Date.now()) / 1000));
+}
+
+// Why the backend turned a message away, from the status and its X-Limit-Scope header
+function limitMessage(status: number, scope: string | null, wait: number) {
+  const retry = `Please wait ${wait} second${wait === 1 ? "" : "s"} and try again.`;
+  if (status === 429) return `You're sending messages too quickly. ${retry}`;
+  if (scope === "upstream") return `The assistant has reached its usage limit for the moment. ${retry}`;
+  if (scope === "model") return `The AI model is unavailable right now. ${retry}`;
+  if (scope === "starting") return `The assistant is still starting up. ${retry}`;
+  return `The assistant is busy answering other questions. ${retry}`;
+}
+
 export default function Home() {
   const [messages, setMessages] = useState<Message[]>([
     { role: "bot", content: "Hello! I'm the eCOMET assistant. Ask me about installation, data input, or analysis workflows." }
   ]);
   const [input, setInput] = useState("");
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
+  // Set while waiting out a Retry-After
+  const [isWaiting, setIsWaiting] = useState(false);
+  // Server-side conversation id, so follow-up questions keep their context
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
   const scrollToBottom = () => {
@@ -28,7 +61,7 @@ export default function Home() {
   }, [messages]);
 
   const sendMessage = async () => {
-    if (!input.trim() || isLoading) return;
+    if (!input.trim() || isLoading || isWaiting) return;
 
     const userMessage = input.trim();
     setMessages((prev) => [...prev, { role: "user", content: userMessage }]);
@@ -39,20 +72,59 @@ export default function Home() {
     const baseUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
     try {
-      const response = await fetch(`${baseUrl}/chat`, {
+      const response = await fetch(`${baseUrl}/chat/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: userMessage }),
+        body: JSON.stringify({ message: userMessage, session_id: sessionId }),
       });
 
-      if (!response.ok) throw new Error("Failed to fetch response");
+      if (response.status === 429 || response.status === 503) {
+        // Turned away: say why and how long to wait, hold sending until then and give the message back
+        const wait = retryAfterSeconds(response.headers.get("Retry-After"));
+        const content = limitMessage(response.status, response.headers.get("X-Limit-Scope"), wait);
+        setMessages((prev) => [...prev, { role: "bot", content }]);
+        setInput(userMessage);
+        setIsWaiting(true);
+        setTimeout(() => setIsWaiting(false), wait * 1000);
+        return;
+      }
+      if (!response.ok || !response.body) throw new Error("Failed to fetch response");
+
+      // Read Server-Sent Events and render tokens as they arrive
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let answer = "";
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split("\n\n");
+        buffer = events.pop() ?? "";
+        for (const raw of events) {
+          const event = parseEvent(raw);
+          if (event.type === "error") throw new Error(event.data.detail);
+          if (event.type === "done" && event.data.session_id) setSessionId(event.data.session_id);
+          if (event.type !== "token") continue;
 
-      const data = await response.json();
-      setMessages((prev) => [...prev, { role: "bot", content: data.response }]);
+          const isFirstToken = answer === "";
+          answer += event.data.text;
+          const current = answer;
+          setMessages((prev) =>
+            isFirstToken
+              ? [...prev, { role: "bot", content: current }]
+              : [...prev.slice(0, -1), { role: "bot", content: current }]
+          );
+          setIsStreaming(true);
+        }
+      }
     } catch (error) {
       setMessages((prev) => [...prev, { role: "bot", content: "Sorry, something went wrong. Please ensure the backend is running." }]);
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -111,7 +183,7 @@ export default function Home() {
               </div>
             </div>
           ))}
-          {isLoading && (
+          {isLoading && !isStreaming && (
             <div className="flex items-center gap-2 text-gray-500 ml-12">
               <Loader2 className="w-4 h-4 animate-spin" />
               <span className="text-sm">Generating answer...</span>
@@ -129,9 +201,9 @@ export default function Home() {
             value={input}
             onChange={(e) => setInput(e.target.value)}
             onKeyDown={(e) => e.key === "Enter" && sendMessage()}
-            placeholder="Ask a question about eCOMET..."
+            placeholder={isWaiting ? "Please wait a moment..." : "Ask a question about eCOMET..."}
             className="w-full px-4 py-3 rounded-lg border border-gray-300 focus:outline-none focus:border-primary focus:ring-1 focus:ring-primary transition-colors shadow-sm text-lg"
-            disabled={isLoading}
+            disabled={isLoading || isWaiting}
           />
         </div>
         <p className="text-center text-xs text-gray-400 mt-[-10vh] mb-2">Powered by Gemini & eCOMET Documentation</p>
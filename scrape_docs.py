@@ -2,6 +2,11 @@ import requests
 from bs4 import BeautifulSoup
 import time
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from knowledge import KB_RECORDS_FILENAME, doc_kind, make_record, write_knowledge_base
 
 urls = [
   "https://phytoecia.github.io/eCOMET/articles/Interspecific_study_tutorial.html",
@@ -84,68 +89,64 @@ urls = [
   "https://phytoecia.github.io/eCOMET/reference/write_anova.html"
 ]
 
-output_file = "ecomet_reference_full.txt"
-
-with open(output_file, "w") as f:
-    f.write("# eCOMET Reference Documentation\n\n")
+# Records are merged into the structured knowledge base next to the ones
+# scripts/scrape_ecomet.py writes; duplicates are dropped on content hash.
+output_file = KB_RECORDS_FILENAME
+records = []
 
-    for url in urls:
-        print(f"Scraping {url}...")
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Extract Title
-                title = soup.find('h1')
-                title_text = title.text.strip() if title else url
-                
-                # Extract Usage/Signature (usually in <pre> or specific div)
-                usage = ""
-                usage_div = soup.find('div', class_='ref-usage') or soup.find('div', class_='sourceCode')
-                if usage_div:
-                    usage = usage_div.text.strip()
-                
-                # Extract Arguments (ref-arguments)
-                args = ""
-                args_div = soup.find('div', id='ref-arguments') or soup.find('div', class_='ref-arguments')
-                if args_div:
-                    args = args_div.text.strip()
+for url in urls:
+    print(f"Scraping {url}...")
+    try:
+        response = requests.get(url)
+        if response.status_code == 200:
+            soup = BeautifulSoup(response.text, 'html.parser')
+            
+            # Extract Title
+            title = soup.find('h1')
+            title_text = title.text.strip() if title else url
+            
+            # Extract Usage/Signature (usually in <pre> or specific div)
+            usage = ""
+            usage_div = soup.find('div', class_='ref-usage') or soup.find('div', class_='sourceCode')
+            if usage_div:
+                usage = usage_div.text.strip()
+            
+            # Extract Arguments (ref-arguments)
+            args = ""
+            args_div = soup.find('div', id='ref-arguments') or soup.find('div', class_='ref-arguments')
+            if args_div:
+                args = args_div.text.strip()
 
-                # Extract Description (ref-description)
-                desc = ""
-                desc_div = soup.find('div', class_='ref-description')
-                if desc_div:
-                    desc = desc_div.text.strip()
-                
-                # Extract Examples (ref-examples)
-                examples = ""
-                examples_div = soup.find('div', class_='ref-examples')
-                if examples_div:
-                    examples = examples_div.text.strip()
-                
-                # If article/tutorial, extract main content
-                content = ""
-                if "/articles/" in url:
-                    main_content = soup.find('main')
-                    if main_content:
-                        content = main_content.text.strip()[:2000] # Limit content length
-                
-                f.write(f"\n## Function/Topic: {title_text}\n")
-                f.write(f"URL: {url}\n")
-                if desc: f.write(f"\n### Description\n{desc}\n")
-                if usage: f.write(f"\n### Usage\n```r\n{usage}\n```\n")
-                if args: f.write(f"\n### Arguments\n{args}\n")
-                if examples: f.write(f"\n### Examples\n```r\n{examples}\n```\n")
-                if content: f.write(f"\n### Article Content Summary\n{content}\n")
-                
-                f.write("\n" + "="*50 + "\n")
-            else:
-                print(f"Failed to fetch {url}: {response.status_code}")
-        except Exception as e:
-            print(f"Error scraping {url}: {e}")
-        
-        # Be nice to the server
-        time.sleep(0.5)
+            # Extract Description (ref-description)
+            desc = ""
+            desc_div = soup.find('div', class_='ref-description')
+            if desc_div:
+                desc = desc_div.text.strip()
+            
+            # Extract Examples (ref-examples)
+            examples = ""
+            examples_div = soup.find('div', class_='ref-examples')
+            if examples_div:
+                examples = examples_div.text.strip()
+            
+            # If article/tutorial, extract main content
+            content = ""
+            if "/articles/" in url:
+                main_content = soup.find('main')
+                if main_content:
+                    content = main_content.text.strip()[:2000] # Limit content length
+            
+            records.append(make_record(
+                doc_kind(url), title_text, url, origin="scrape_docs",
+                description=desc, usage=usage, arguments=args, examples=examples, content=content,
+            ))
+        else:
+            print(f"Failed to fetch {url}: {response.status_code}")
+    except Exception as e:
+        print(f"Error scraping {url}: {e}")
+    
+    # Be nice to the server
+    time.sleep(0.5)
 
-print(f"Scraping complete. Saved to {output_file}")
+version = write_knowledge_base(records, output_file, origin="scrape_docs")
+print(f"Scraping complete. Saved {len(records)} records to {output_file} (version {version})")
@@ -0,0 +1,61 @@
+"""
+Start the backend under uvicorn for the scripts that measure or check it.
+
+The backend runs from backend/ on the fake model with the per-client and
+upstream rate limits off: a bench or check sends every request from one
+address, so the limits would only measure themselves. Startup waits on
+/health until every worker reports ready, since with `--workers N` each one
+warms up on its own.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, "backend")
+
+
+def start(port, env=None, workers=1, timeout=60):
+    """
+    Launch uvicorn on 127.0.0.1:`port`, with `env` over the defaults, and wait
+    until `workers` workers report ready.
+
+    Returns (process, base URL, health), where health holds the seconds from
+    launch to the first /health response and to ready, and the ready workers'
+    pids. Stops the server and raises RuntimeError if it isn't ready in time.
+    """
+    environment = dict(os.environ, LLM_BACKEND="fake", RATE_LIMIT_PER_MINUTE="0", UPSTREAM_TOKENS_PER_MINUTE="0")
+    environment.update(env or {})
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+    if workers > 1:
+        command += ["--workers", str(workers)]
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=BACKEND_DIR, env=environment,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    health = {"first_response": None, "ready": None, "workers": set()}
+    while len(health["workers"]) < workers and time.perf_counter() - started < timeout:
+        try:
+            r = requests.get(f"{base}/health", timeout=1)
+            if health["first_response"] is None:
+                health["first_response"] = time.perf_counter() - started
+            # Older builds answer 200 {"status": "ok"} as soon as they listen
+            if r.status_code == 200 and r.json().get("status") in ("ok", "ready"):
+                health["workers"].add(r.json().get("worker"))
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.01)
+    if len(health["workers"]) < workers:
+        stop(proc)
+        raise RuntimeError(f"{len(health['workers'])} of {workers} workers were ready after {timeout}s")
+    health["ready"] = time.perf_counter() - started
+    return proc, base, health
+
+
+def stop(proc):
+    proc.terminate()
+    proc.wait()
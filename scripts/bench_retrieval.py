@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark the retrieval index against the old "inline the whole knowledge base" prompt.
+
+Reports index build time, per-question retrieval latency, prompt size and the
+top chunk for a fixed set of questions. Retrieval is hybrid (BM25 + chunk
+embeddings) unless `--embeddings off`. Run from the repo root:
+
+    python scripts/bench_retrieval.py [--top-k 6] [--budget 6000] [--embeddings hashing] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from knowledge import KnowledgeSource, estimate_tokens  # noqa: E402
+from retrieval import Retriever  # noqa: E402
+from embeddings import SemanticIndex, get_embedder  # noqa: E402
+
+QUESTIONS = [
+    "How do I install eCOMET?",
+    "What are the arguments of GetDAMs?",
+    "Which normalization options are available?",
+    "How do I make a volcano plot?",
+    "How do I compare diversity between treatments?",
+    "How do I import MZmine feature tables and metadata?",
+    "How do I run a PERMANOVA on my mmo object?",
+    "How can I add SIRIUS CANOPUS annotations?",
+    "What does ReplaceZero do?",
+    "How do I export features of interest to CSV?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", default=os.path.join(ROOT, "ecomet_kb.jsonl"))
+    parser.add_argument("--kb", default=os.path.join(ROOT, "ecomet_reference_full.txt"),
+                        help="Flat knowledge base, used for the inline-everything baseline")
+    parser.add_argument("--top-k", type=int, default=6)
+    parser.add_argument("--budget", type=int, default=6000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--embeddings", default="hashing",
+                        help="Embedder for hybrid retrieval: hashing, off, or a sentence-transformers model name")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    with open(args.kb, encoding="utf-8") as f:
+        text = f.read()
+
+    start = time.perf_counter()
+    kb = KnowledgeSource(records_path=args.records, text_path=args.kb).load()
+    retriever = Retriever.from_records(kb.records())
+    build_ms = (time.perf_counter() - start) * 1000
+
+    semantic, embed_ms = None, 0.0
+    embedder = get_embedder(args.embeddings)
+    if embedder is not None:
+        start = time.perf_counter()
+        semantic = SemanticIndex.build(embedder, retriever.chunks)
+        embed_ms = (time.perf_counter() - start) * 1000
+
+    rows = []
+    for question in QUESTIONS:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            context = retriever.build_context(question, top_k=args.top_k, token_budget=args.budget, semantic=semantic)
+            timings.append((time.perf_counter() - start) * 1000)
+        top = retriever.search(question, 1, semantic)
+        rows.append({
+            "question": question,
+            "top_chunk": top[0][0].title if top else None,
+            "prompt_chars": len(context),
+            "prompt_tokens": estimate_tokens(context),
+            "latency_ms_p50": round(statistics.median(timings), 3),
+            "latency_ms_max": round(max(timings), 3),
+        })
+
+    result = {
+        "knowledge_base_chars": len(text),
+        "knowledge_base_tokens": estimate_tokens(text),
+        "chunks": len(retriever.chunks),
+        "index_build_ms": round(build_ms, 1),
+        "embedder": embedder.name if embedder else None,
+        "embed_ms": round(embed_ms, 1),
+        "top_k": args.top_k,
+        "token_budget": args.budget,
+        "mean_prompt_tokens": round(statistics.mean(r["prompt_tokens"] for r in rows)),
+        "questions": rows,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"Knowledge base: {len(text) / 1024:.1f} KB (~{result['knowledge_base_tokens']} tokens inlined per request before)")
+    print(f"Index: {result['chunks']} chunks built in {result['index_build_ms']} ms")
+    if embedder:
+        print(f"Embeddings: {embedder.name}, computed in {result['embed_ms']} ms")
+    print(f"{'question':<52} {'tokens':>7} {'p50 ms':>8} {'max ms':>8}  top chunk")
+    for r in rows:
+        print(f"{r['question'][:52]:<52} {r['prompt_tokens']:>7} {r['latency_ms_p50']:>8} {r['latency_ms_max']:>8}  "
+              f"{(r['top_chunk'] or '-')[-40:]}")
+    print(f"Mean retrieved context: ~{result['mean_prompt_tokens']} tokens "
+          f"({result['mean_prompt_tokens'] / result['knowledge_base_tokens']:.1%} of the full file)")
+
+
+if __name__ == "__main__":
+    main()
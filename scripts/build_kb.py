@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Convert the flat ecomet_reference_full.txt into the structured ecomet_kb.jsonl.
+
+scripts/scrape_ecomet.py writes both formats itself; this is for regenerating
+the records from an existing flat file without hitting the network. Run from
+the repo root:
+
+    python scripts/build_kb.py [--input ecomet_reference_full.txt] [--output ecomet_kb.jsonl]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from knowledge import KB_FILENAME, KB_RECORDS_FILENAME, records_from_text, write_knowledge_base  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build ecomet_kb.jsonl from the flat knowledge base")
+    parser.add_argument("--input", default=KB_FILENAME)
+    parser.add_argument("--output", default=KB_RECORDS_FILENAME)
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        records = records_from_text(f.read())
+    version = write_knowledge_base(records, args.output, origin="scrape_ecomet")
+    print(f"Wrote {args.output} from {len(records)} records (version {version})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Show single-flight coalescing of identical in-flight questions.
+
+Starts the backend with the fake model twice, with CHAT_COALESCE=0 and =1, and
+fires a burst of the same question (as at the start of a workshop) at each.
+Reports how many upstream model calls were made, how many were saved and the
+wait added to joined requests, read from /metrics. Run from the repo root:
+
+    python scripts/coalesce_demo.py [--burst 32] [--latency 1.0]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend_server  # noqa: E402
+
+QUESTION = "How do I install eCOMET?"
+
+
+def metric(text, name):
+    """Sum of all samples of `name` in a Prometheus text exposition."""
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith(name + " ") or line.startswith(name + "{"):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+def run(port, burst, latency, coalesce):
+    proc, base, _ = backend_server.start(port, {
+        "FAKE_LLM_LATENCY": str(latency),
+        "CHAT_COALESCE": "1" if coalesce else "0",
+        # Keep the response cache out of the picture; only in-flight sharing is measured
+        "RESPONSE_CACHE": "0",
+        "CHAT_MAX_CONCURRENCY": str(burst),
+        "CHAT_MAX_QUEUE": str(burst),
+        "KB_RELOAD_INTERVAL": "0",
+    })
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=burst) as pool:
+            results = list(pool.map(
+                lambda _: requests.post(f"{base}/chat", json={"message": QUESTION}, timeout=120),
+                range(burst),
+            ))
+        elapsed = time.perf_counter() - start
+        text = requests.get(f"{base}/metrics", timeout=10).text
+    finally:
+        backend_server.stop(proc)
+
+    coalesced = metric(text, "chat_coalesced_total")
+    waits = metric(text, "chat_coalesced_wait_seconds_count")
+    return {
+        "coalesce": coalesce,
+        "ok": sum(1 for r in results if r.status_code == 200),
+        "upstream_calls": int(metric(text, 'chat_stage_seconds_count{stage="model"}')),
+        "saved_calls": int(coalesced),
+        "mean_join_wait_s": metric(text, "chat_coalesced_wait_seconds_sum") / waits if waits else 0.0,
+        "wall_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Demonstrate coalescing with the fake model")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--burst", type=int, default=32, help="Identical requests sent at once")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake model latency in seconds")
+    args = parser.parse_args()
+
+    print(f"{'coalesce':>9} {'ok':>4} {'upstream':>9} {'saved':>6} {'join wait s':>12} {'wall s':>7}")
+    for coalesce in (False, True):
+        r = run(args.port, args.burst, args.latency, coalesce)
+        print(f"{'on' if r['coalesce'] else 'off':>9} {r['ok']:>4} {r['upstream_calls']:>9} {r['saved_calls']:>6} "
+              f"{r['mean_join_wait_s']:>12.3f} {r['wall_s']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Benchmark the backend against the local fake model.
+
+Starts backend/main.py with LLM_BACKEND=fake (configurable latency and token
+rate), drives a weighted mix of /chat (or /chat/stream), /admin/logs and
+/health at increasing concurrency, and reports per-endpoint p50/p95/p99
+latency, requests per second, server RSS growth and prompt bytes per model
+call. Results can be written as JSON and compared against a saved baseline.
+Run from the repo root:
+
+    python scripts/load_test.py [--latency 0.5] [--levels 1 2 4 8 16] [--stream]
+    python scripts/load_test.py --output bench.json
+    python scripts/load_test.py --compare bench.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import backend_server
+
+ADMIN_PASSWORD = "bench"
+
+
+def rss_kb(pid):
+    """Resident set size of a process from /proc (None where /proc is unavailable)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def metric(text, name):
+    """Sum of all samples of `name` in a Prometheus text exposition."""
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith(name + " ") or line.startswith(name + "{"):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def post_chat(base, i):
+    r = requests.post(f"{base}/chat", json={"message": f"How do I install eCOMET? #{i}"}, timeout=120)
+    return r.status_code, None
+
+
+def stream_chat(base, i):
+    """Read the SSE stream to the end; returns the status and time to the first token."""
+    start = time.perf_counter()
+    first_token = None
+    with requests.post(f"{base}/chat/stream", json={"message": f"How do I install eCOMET? #{i}"},
+                       stream=True, timeout=120) as r:
+        if r.status_code != 200:
+            return r.status_code, None
+        for line in r.iter_lines():
+            if first_token is None and line.startswith(b"event: token"):
+                first_token = time.perf_counter() - start
+            if line.startswith(b"event: error"):
+                return 500, first_token
+    return 200, first_token
+
+
+def get_logs(base, i):
+    r = requests.get(f"{base}/admin/logs", params={"password": ADMIN_PASSWORD, "limit": 50}, timeout=30)
+    return r.status_code, None
+
+
+def get_health(base, i):
+    r = requests.get(f"{base}/health", timeout=30)
+    return r.status_code, None
+
+
+def schedule(mix, total):
+    """Deterministic interleaving of endpoint names in proportion to their weights."""
+    names = [name for name, weight in mix.items() for _ in range(weight)]
+    return [names[i % len(names)] for i in range(total)]
+
+
+def summarize(samples):
+    latencies = [s["latency"] for s in samples if s["status"] == 200]
+    first_tokens = [s["first_token"] for s in samples if s["first_token"] is not None]
+    ms = lambda v: round(v * 1000, 2) if v is not None else None  # noqa: E731
+    row = {
+        "count": len(samples),
+        "ok": len(latencies),
+        "rejected": sum(1 for s in samples if s["status"] == 503),
+        "errors": sum(1 for s in samples if s["status"] not in (200, 503)),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+    }
+    if first_tokens:
+        row["first_token_p50_ms"] = ms(percentile(first_tokens, 50))
+        row["first_token_p95_ms"] = ms(percentile(first_tokens, 95))
+    return row
+
+
+def run_level(base, pid, concurrency, total, mix, stream, offset):
+    calls = {"chat": stream_chat if stream else post_chat, "logs": get_logs, "health": get_health}
+    plan = schedule(mix, total)
+
+    def one(i):
+        name = plan[i]
+        start = time.perf_counter()
+        try:
+            status, first_token = calls[name](base, offset + i)
+        except requests.RequestException:
+            status, first_token = 0, None
+        return name, {"status": status, "latency": time.perf_counter() - start, "first_token": first_token}
+
+    before = requests.get(f"{base}/metrics", timeout=10).text
+    rss_start = rss_kb(pid)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    rss_end = rss_kb(pid)
+    after = requests.get(f"{base}/metrics", timeout=10).text
+
+    model_calls = metric(after, "chat_prompt_bytes_count") - metric(before, "chat_prompt_bytes_count")
+    prompt_bytes = metric(after, "chat_prompt_bytes_sum") - metric(before, "chat_prompt_bytes_sum")
+    by_endpoint = {}
+    for name, sample in results:
+        by_endpoint.setdefault(name, []).append(sample)
+    ok = sum(1 for _, s in results if s["status"] == 200)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(ok / elapsed, 2),
+        "endpoints": {name: summarize(samples) for name, samples in sorted(by_endpoint.items())},
+        "rss_start_kb": rss_start,
+        "rss_end_kb": rss_end,
+        "rss_growth_kb": rss_end - rss_start if rss_start is not None and rss_end is not None else None,
+        "model_calls": int(model_calls),
+        "prompt_bytes_per_call": round(prompt_bytes / model_calls) if model_calls else None,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """Regressions of the chat endpoint against a baseline run, level by level."""
+    problems = []
+    base_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in result["levels"]:
+        base = base_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        c = level["concurrency"]
+        if base["rps"] and level["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"concurrency {c}: {level['rps']} req/s vs {base['rps']} baseline")
+        for key in ("p95_ms", "p99_ms"):
+            now, then = level["endpoints"].get("chat", {}).get(key), base["endpoints"].get("chat", {}).get(key)
+            if now is not None and then and now > then * (1 + tolerance):
+                problems.append(f"concurrency {c}: chat {key} {now} vs {then} baseline")
+        now, then = level["prompt_bytes_per_call"], base.get("prompt_bytes_per_call")
+        if now is not None and then and now > then * (1 + tolerance):
+            problems.append(f"concurrency {c}: {now} prompt bytes per call vs {then} baseline")
+    return problems
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("chat", "logs", "health"):
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r} (use chat, logs, health)")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend with a fake model")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake model latency in seconds")
+    parser.add_argument("--token-rate", type=float, default=200, help="Fake model tokens per second")
+    parser.add_argument("--stream", action="store_true", help="Send chat traffic to /chat/stream")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=8,logs=1,health=1"),
+                        help="Endpoint weights, e.g. chat=8,logs=1,health=1")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="CHAT_MAX_CONCURRENCY for the server")
+    parser.add_argument("--max-queue", type=int, default=32, help="CHAT_MAX_QUEUE for the server")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--json", action="store_true", help="Print the JSON results instead of a table")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    config = {
+        "latency": args.latency,
+        "token_rate": args.token_rate,
+        "stream": args.stream,
+        "mix": args.mix,
+        "requests_per_level": args.requests,
+        "max_concurrency": args.max_concurrency,
+        "max_queue": args.max_queue,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        proc, base, _ = backend_server.start(args.port, {
+            "FAKE_LLM_LATENCY": str(args.latency),
+            "FAKE_LLM_TOKEN_RATE": str(args.token_rate),
+            "CHAT_MAX_CONCURRENCY": str(args.max_concurrency),
+            "CHAT_MAX_QUEUE": str(args.max_queue),
+            "ADMIN_PASSWORD": ADMIN_PASSWORD,
+            "LOG_DB_PATH": os.path.join(tmp, "chat_logs.db"),
+            "KB_RELOAD_INTERVAL": "0",
+        })
+        try:
+            rss_initial = rss_kb(proc.pid)
+            levels, offset = [], 0
+            for level in args.levels:
+                levels.append(run_level(base, proc.pid, level, args.requests, args.mix, args.stream, offset))
+                offset += args.requests
+            rss_final = rss_kb(proc.pid)
+        finally:
+            backend_server.stop(proc)
+
+    result = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": config,
+        "rss_initial_kb": rss_initial,
+        "rss_growth_kb": rss_final - rss_initial if rss_initial is not None and rss_final is not None else None,
+        "levels": levels,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{'conc':>5} {'endpoint':>8} {'ok':>4} {'503':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'req/s':>7} {'rss +KB':>8} {'prompt B':>9}")
+        for r in levels:
+            for i, (name, e) in enumerate(r["endpoints"].items()):
+                tail = f"{r['rps']:>7.2f} {r['rss_growth_kb'] or 0:>8} {r['prompt_bytes_per_call'] or 0:>9}" if i == 0 else ""
+                print(f"{r['concurrency']:>5} {name:>8} {e['ok']:>4} {e['rejected']:>4} {e['p50_ms'] or 0:>8.1f} "
+                      f"{e['p95_ms'] or 0:>8.1f} {e['p99_ms'] or 0:>8.1f} {tail}")
+        print(f"Server RSS grew {result['rss_growth_kb']} KB over the run")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Check that several workers behave as one service.
+
+Starts the backend with `uvicorn --workers N` on the fake model and one
+shared-state file, then checks from the outside that:
+- a system prompt set through one worker is served by all of them
+- every worker's chat logs are in one log
+- an answer cached by one worker is a cache hit on the others
+- a conversation continues whichever worker takes the next turn
+- a rate-limit bucket taken from several processes at once never over-grants
+Exits 1 if any check fails. Run from the repo root:
+
+    python scripts/multiworker_check.py [--workers 4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+
+import backend_server
+
+ADMIN_PASSWORD = "check"
+
+
+def start_workers(port, workers, db_path):
+    # The shared-state file, not a Redis from the caller's environment
+    env = dict(FAKE_LLM_LATENCY="0.05", ADMIN_PASSWORD=ADMIN_PASSWORD, LOG_DB_PATH=db_path,
+               KB_RELOAD_INTERVAL="0", CHAT_COALESCE="0", SHARED_STATE_URL="")
+    return backend_server.start(port, env, workers=workers)
+
+
+def parallel(fn, args, threads=16):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(fn, args))
+
+
+def chat(base, message, session_id=None):
+    r = requests.post(f"{base}/chat", json={"message": message, "session_id": session_id}, timeout=60)
+    r.raise_for_status()
+    return r.json()
+
+
+def check_system_prompt(base, workers):
+    prompt = f"You are a terse eCOMET assistant ({uuid.uuid4().hex[:8]})."
+    requests.post(f"{base}/admin/system-prompt", json={"new_prompt": prompt, "password": ADMIN_PASSWORD},
+                  timeout=10).raise_for_status()
+    served = parallel(lambda _: requests.get(f"{base}/admin/system-prompt", params={"password": ADMIN_PASSWORD},
+                                             timeout=10).json()["system_prompt"], range(workers * 8))
+    return all(p == prompt for p in served), f"{served.count(prompt)}/{len(served)} reads return the new prompt"
+
+
+def check_logs(base, workers):
+    marker = uuid.uuid4().hex[:8]
+    total = workers * 10
+    parallel(lambda i: chat(base, f"Log check {marker} question {i}"), range(total))
+    time.sleep(1.5)  # writers flush every 0.5 s
+    items = requests.get(f"{base}/admin/logs", params={"password": ADMIN_PASSWORD, "q": marker, "limit": 500},
+                         timeout=10).json()["items"]
+    return len(items) == total, f"{len(items)}/{total} chats found in the shared log"
+
+
+def check_response_cache(base, workers):
+    question = f"How do I install eCOMET? {uuid.uuid4().hex[:8]}"
+    chat(base, question)
+    results = parallel(lambda _: chat(base, question), range(workers * 8))
+    hits = sum(r["cached"] for r in results)
+    return hits == len(results), f"{hits}/{len(results)} repeats were cache hits"
+
+
+def check_sessions(base, workers):
+    session_id = chat(base, "How do I run a PERMANOVA?")["session_id"]
+    turns = workers * 3
+    with_history = 0
+    for i in range(turns):
+        r = chat(base, f"And what about step {i}?", session_id)
+        with_history += r["prompt"]["history"]["chars"] > 0 and r["session_id"] == session_id
+    return with_history == turns, f"{with_history}/{turns} follow-ups carried the conversation"
+
+
+def take_many(db_path, n):
+    sys.path.insert(0, backend_server.BACKEND_DIR)
+    from shared_state import SQLiteState
+
+    state = SQLiteState(db_path)
+    return sum(state.take("check", rate=0.0, capacity=100, cost=1)[0] for _ in range(n))
+
+
+def check_rate_limit(db_path, workers):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        granted = sum(pool.map(take_many, [db_path] * workers, [50] * workers))
+    return granted == 100, f"{granted} of {workers * 50} takes granted from a 100-token bucket (want 100)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check consistent behavior across uvicorn workers")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "shared.db")
+        try:
+            proc, base, health = start_workers(args.port, args.workers, db_path)
+        except RuntimeError as e:
+            print(f"FAIL {e}")
+            sys.exit(1)
+        try:
+            print(f"{len(health['workers'])} workers ready: {sorted(health['workers'])}")
+            for name, check in [("system prompt", check_system_prompt), ("logs", check_logs),
+                                ("response cache", check_response_cache), ("sessions", check_sessions)]:
+                ok, detail = check(base, args.workers)
+                failed |= not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+        finally:
+            backend_server.stop(proc)
+        ok, detail = check_rate_limit(os.path.join(tmp, "buckets.db"), args.workers)
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} rate limit: {detail}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
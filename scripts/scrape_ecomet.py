@@ -2,13 +2,39 @@
 """
 Scrape eCOMET documentation AND source code from GitHub.
 This script is run by GitHub Actions weekly to keep the knowledge base up-to-date.
+
+Pages and files are fetched concurrently over a bounded connection pool with
+per-host rate limiting. Conditional requests (ETag / Last-Modified) and GitHub
+blob SHAs let unchanged pages and files be skipped; their rendered sections are
+reused from a local manifest, and the output file is only rewritten when a
+section actually changed.
+
+Base URLs can be pointed at a local fixture server for offline runs:
+
+    python scripts/scrape_ecomet.py --docs-url http://127.0.0.1:8000/docs --github-api http://127.0.0.1:8000/api
 """
 
-import requests
-from bs4 import BeautifulSoup
-import os
+import argparse
 import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from knowledge import (  # noqa: E402
+    GITHUB_BLOB_URL, KB_RECORDS_FILENAME, doc_kind, make_record, r_source_records, write_knowledge_base,
+)
 
 # Documentation website
 DOCS_URL = "https://phytoecia.github.io/eCOMET"
@@ -46,12 +72,76 @@ REFERENCE_FUNCTIONS = [
     "run_PERMANOVA.html",
 ]
 
-# Key source code files to include (R files from the package)
-SOURCE_CODE_PATHS = [
-    "R",  # All R source files
-    "DESCRIPTION",
-    "NAMESPACE",
-]
+# Top-level files included alongside the R/ directory
+SOURCE_FILES = ["DESCRIPTION", "NAMESPACE"]
+
+OUTPUT_FILE = "ecomet_reference_full.txt"
+MANIFEST_FILE = "kb_manifest.json"
+ORIGIN = "scrape_ecomet"
+
+
+class HostRateLimiter:
+    """Allow at most `rate` requests per second to each host, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Fetcher:
+    """Shared session with a bounded pool, rate limiting, conditional GETs and byte accounting."""
+
+    def __init__(self, workers, rate):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        token = os.getenv("GITHUB_TOKEN")
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.limiter = HostRateLimiter(rate)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_fetched = 0
+
+    def get(self, url, cached=None):
+        """GET with If-None-Match / If-Modified-Since from a previous manifest entry."""
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        self.limiter.wait(url)
+        response = self.session.get(url, headers=headers, timeout=30)
+        with self.lock:
+            self.requests += 1
+            self.bytes_fetched += len(response.content)
+            if response.status_code == 304:
+                self.not_modified += 1
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+
+def validators(response):
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
 
 
 def clean_text(soup):
@@ -63,128 +153,231 @@ def clean_text(soup):
     return '\n'.join(line for line in lines if line)
 
 
-def scrape_doc_page(url):
-    """Scrape a single documentation page."""
+def pop_section(soup, *finders):
+    """Text of the first matching pkgdown section, removed from the page so it is not repeated."""
+    for name, attrs in finders:
+        node = soup.find(name, attrs=attrs)
+        if node:
+            text = clean_text(node)
+            node.decompose()
+            return text
+    return ""
+
+
+def render_doc_page(url, html):
+    """Return the flat-text section and the structured record for one page."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title = soup.find('h1')
+    title_text = title.get_text() if title else url.split('/')[-1]
+
+    main = soup.find('main') or soup.find('article') or soup.find('div', class_='content')
+    content = clean_text(main) if main else clean_text(soup)
+    text = f"\n\n{'='*60}\n## {title_text}\nSource: {url}\n{'='*60}\n\n{content}"
+
+    kind = doc_kind(url)
+    fields = {}
+    if kind == "reference" and main:
+        fields = {
+            "description": pop_section(main, ("div", {"class": "ref-description"})),
+            "usage": pop_section(main, ("div", {"class": "ref-usage"}), ("div", {"class": "sourceCode"})),
+            "arguments": pop_section(main, ("div", {"id": "ref-arguments"}), ("div", {"class": "ref-arguments"})),
+            "examples": pop_section(main, ("div", {"class": "ref-examples"})),
+        }
+        content = clean_text(main)
+    record = make_record(kind, title_text.strip(), url, origin=ORIGIN, content=content, **fields)
+    return text, [record]
+
+
+def scrape_doc_page(fetcher, url, cached):
+    """Scrape a single documentation page, reusing the cached section on 304; None once it is gone (404/410)."""
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        title = soup.find('h1')
-        title_text = title.get_text() if title else url.split('/')[-1]
-        
-        main = soup.find('main') or soup.find('article') or soup.find('div', class_='content')
-        content = clean_text(main) if main else clean_text(soup)
-        
-        return f"\n\n{'='*60}\n## {title_text}\nSource: {url}\n{'='*60}\n\n{content}"
+        response = fetcher.get(url, cached)
+        if response.status_code == 304:
+            return dict(cached, changed=False)
+        content, records = render_doc_page(url, response.text)
+        return dict(validators(response), content=content, records=records, changed=True)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code in (404, 410):
+            print(f"Removed upstream: {url}")
+            return None
+        print(f"Error scraping {url}: {e}")
+        return dict(cached, changed=False) if cached else None
     except Exception as e:
         print(f"Error scraping {url}: {e}")
-        return ""
+        # Keep the last good copy rather than dropping the section
+        return dict(cached, changed=False) if cached else None
 
 
-def fetch_github_file(path):
-    """Fetch a file from GitHub API and return its content."""
+def fetch_github_file(fetcher, api, path, cached):
+    """Fetch a file (or directory listing) from the GitHub contents API."""
     try:
-        url = f"{GITHUB_API}/{path}"
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        if isinstance(data, list):
-            # It's a directory, return list of files
-            return data
-        else:
-            # It's a file, decode content
-            if data.get('encoding') == 'base64':
-                content = base64.b64decode(data['content']).decode('utf-8')
-                return content
-            return None
+        response = fetcher.get(f"{api}/{path}", cached)
+        if response.status_code == 304:
+            return None, False
+        return response, True
     except Exception as e:
         print(f"Error fetching {path}: {e}")
+        return None, False
+
+
+def decode_content(data):
+    if data.get('encoding') == 'base64':
+        return base64.b64decode(data['content']).decode('utf-8')
+    return None
+
+
+def scrape_source_file(fetcher, api, path, cached, sha=None, fence=""):
+    """Fetch one source file unless its blob SHA (or ETag) shows it is unchanged."""
+    if cached and sha and cached.get("sha") == sha:
+        return dict(cached, changed=False)
+    response, changed = fetch_github_file(fetcher, api, path, None if sha else cached)
+    if not changed:
+        return dict(cached, changed=False) if cached else None
+    data = response.json()
+    content = decode_content(data)
+    if content is None:
         return None
+    if path.endswith(".R"):
+        records = r_source_records(path, content.splitlines(), origin=ORIGIN)
+    else:
+        records = [make_record("source", path, f"{GITHUB_BLOB_URL}/{path}", origin=ORIGIN, content=content)]
+    return dict(
+        validators(response),
+        sha=data.get("sha"),
+        content=f"\n\n## {path}\n```{fence}\n{content}\n```",
+        records=records,
+        changed=True,
+    )
+
+
+def list_r_files(fetcher, api, manifest):
+    """Directory listing of R/, conditional on the previous listing's ETag."""
+    cached = manifest.get("listing:R")
+    response, changed = fetch_github_file(fetcher, api, "R", cached)
+    if not changed:
+        return cached.get("files", []) if cached else []
+    files = [
+        {"name": f["name"], "sha": f.get("sha")}
+        for f in response.json()
+        if f.get("name", "").endswith(".R")
+    ]
+    manifest["listing:R"] = dict(validators(response), files=files)
+    return files
+
+
+def scrape_all(fetcher, docs_url, api, manifest, workers):
+    """Fetch every section concurrently; returns {key: section} in output order."""
+    doc_urls = [docs_url + page for page in DOC_PAGES]
+    doc_urls += [f"{docs_url}/reference/{func}" for func in REFERENCE_FUNCTIONS]
+    r_files = list_r_files(fetcher, api, manifest)
 
+    def cached(key):
+        # Sections cached before records were added to the manifest must be refetched
+        section = manifest.get(key)
+        return section if section and "records" in section else None
 
-def scrape_source_code():
-    """Scrape R source code from GitHub."""
-    all_code = []
-    all_code.append("\n\n" + "="*60)
-    all_code.append("# eCOMET R PACKAGE SOURCE CODE")
-    all_code.append("# From: https://github.com/Phytoecia/eCOMET")
-    all_code.append("="*60)
-    
-    # Fetch DESCRIPTION file
-    print("Fetching DESCRIPTION...")
-    desc = fetch_github_file("DESCRIPTION")
-    if desc:
-        all_code.append(f"\n\n## DESCRIPTION\n```\n{desc}\n```")
-    
-    # Fetch NAMESPACE file
-    print("Fetching NAMESPACE...")
-    ns = fetch_github_file("NAMESPACE")
-    if ns:
-        all_code.append(f"\n\n## NAMESPACE\n```\n{ns}\n```")
-    
-    # Fetch all R files from R/ directory
-    print("Fetching R source files...")
-    r_files = fetch_github_file("R")
-    if r_files and isinstance(r_files, list):
-        for file_info in r_files:
-            if file_info.get('name', '').endswith('.R'):
-                print(f"  Fetching R/{file_info['name']}...")
-                content = fetch_github_file(f"R/{file_info['name']}")
-                if content:
-                    all_code.append(f"\n\n## R/{file_info['name']}\n```r\n{content}\n```")
-    
-    return '\n'.join(all_code)
+    jobs = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for url in doc_urls:
+            key = f"doc:{url}"
+            jobs[key] = pool.submit(scrape_doc_page, fetcher, url, cached(key))
+        for path in SOURCE_FILES:
+            key = f"src:{path}"
+            jobs[key] = pool.submit(scrape_source_file, fetcher, api, path, cached(key))
+        for f in r_files:
+            key = f"src:R/{f['name']}"
+            jobs[key] = pool.submit(
+                scrape_source_file, fetcher, api, f"R/{f['name']}", cached(key), f["sha"], "r"
+            )
+        return {key: job.result() for key, job in jobs.items()}
+
+
+def build_output(sections, docs_url):
+    header = [
+        "# eCOMET Complete Knowledge Base",
+        f"# Documentation from: {docs_url}",
+        "# Source code from: https://github.com/Phytoecia/eCOMET",
+    ]
+    body = ["\n\n" + "#"*60, "# PART 1: DOCUMENTATION", "#"*60]
+    body += [s["content"] for key, s in sections.items() if key.startswith("doc:") and s]
+
+    body += ["\n\n" + "#"*60, "# PART 2: SOURCE CODE", "#"*60]
+    body += [
+        "\n\n" + "="*60,
+        "# eCOMET R PACKAGE SOURCE CODE",
+        "# From: https://github.com/Phytoecia/eCOMET",
+        "="*60,
+    ]
+    body += [s["content"] for key, s in sections.items() if key.startswith("src:") and s]
+    return header, body
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Update the eCOMET knowledge base")
+    parser.add_argument("--docs-url", default=os.getenv("ECOMET_DOCS_URL", DOCS_URL))
+    parser.add_argument("--github-api", default=os.getenv("ECOMET_GITHUB_API", GITHUB_API))
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--records", default=KB_RECORDS_FILENAME, help="Structured knowledge base (JSONL)")
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests (connection pool size)")
+    parser.add_argument("--rate", type=float, default=5.0, help="Max requests per second per host (0 = unlimited)")
+    args = parser.parse_args()
+
     print("Starting eCOMET knowledge base update...")
     print(f"Timestamp: {datetime.now().isoformat()}")
-    
-    all_content = []
-    all_content.append("# eCOMET Complete Knowledge Base")
-    all_content.append(f"# Documentation from: {DOCS_URL}")
-    all_content.append(f"# Source code from: https://github.com/Phytoecia/eCOMET")
-    all_content.append(f"# Last updated: {datetime.now().isoformat()}")
-    
-    # Section 1: Documentation
-    all_content.append("\n\n" + "#"*60)
-    all_content.append("# PART 1: DOCUMENTATION")
-    all_content.append("#"*60)
-    
-    # Scrape main doc pages
-    for page in DOC_PAGES:
-        url = DOCS_URL + page
-        print(f"Scraping doc: {url}")
-        content = scrape_doc_page(url)
-        if content:
-            all_content.append(content)
-    
-    # Scrape reference pages
-    for func in REFERENCE_FUNCTIONS:
-        url = f"{DOCS_URL}/reference/{func}"
-        print(f"Scraping ref: {url}")
-        content = scrape_doc_page(url)
-        if content:
-            all_content.append(content)
-    
-    # Section 2: Source Code
-    all_content.append("\n\n" + "#"*60)
-    all_content.append("# PART 2: SOURCE CODE")
-    all_content.append("#"*60)
-    
-    source_code = scrape_source_code()
-    all_content.append(source_code)
-    
-    # Write output
-    output_file = "ecomet_reference_full.txt"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(all_content))
-    
-    file_size = os.path.getsize(output_file) / 1024
-    print(f"\nDone! Saved to {output_file}")
+    start = time.perf_counter()
+
+    manifest = load_manifest(args.manifest)
+    fetcher = Fetcher(args.workers, args.rate)
+    sections = scrape_all(fetcher, args.docs_url, args.github_api, manifest, args.workers)
+
+    changed = [key for key, s in sections.items() if s and s["changed"]]
+    # A page or file gone upstream changes no kept section, but its records must still go
+    previous = {key for key in manifest if key.startswith(("doc:", "src:"))}
+    current = {key for key, s in sections.items() if s}
+    for key in previous - current:
+        del manifest[key]
+    for key, section in sections.items():
+        if section:
+            manifest[key] = {k: v for k, v in section.items() if k != "changed"}
+
+    header, body = build_output(sections, args.docs_url)
+    body_text = '\n'.join(body)
+    body_hash = hashlib.sha256(body_text.encode("utf-8")).hexdigest()
+    body_changed = body_hash != manifest.get("output_hash")
+
+    # The timestamp is part of the file, so only rewrite it when the content changed
+    if body_changed or not os.path.exists(args.output):
+        header.append(f"# Last updated: {datetime.now().isoformat()}")
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(header + body))
+        manifest["output_hash"] = body_hash
+        print(f"\nDone! Saved to {args.output} ({len(changed)} sections changed)")
+    else:
+        print(f"\nNo upstream changes; {args.output} left untouched")
+
+    # Structured records for the backend; scrape_docs.py's records are kept alongside
+    if changed or body_changed or current != previous or not os.path.exists(args.records):
+        records = [r for s in sections.values() if s for r in s.get("records", [])]
+        version = write_knowledge_base(records, args.records, origin=ORIGIN)
+        print(f"Wrote {len(records)} records to {args.records} (version {version})")
+
+    with open(args.manifest, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    elapsed = time.perf_counter() - start
+    file_size = os.path.getsize(args.output) / 1024
     print(f"Total size: {file_size:.1f} KB")
+    print(f"Wall time: {elapsed:.2f}s, requests: {fetcher.requests} "
+          f"({fetcher.not_modified} not modified), bytes fetched: {fetcher.bytes_fetched}")
 
 
 if __name__ == "__main__":
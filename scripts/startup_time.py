@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Measure backend cold-start cost.
+
+Reports, each as the median of several fresh processes:
+- time to `import main` in a new interpreter (module imports plus module-level setup)
+- time from launching uvicorn until /health first answers, and until it reports ready
+- latency of the first /chat (fake model, no latency) once ready
+Run from the repo root:
+
+    python scripts/startup_time.py [--runs 5] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import backend_server
+
+ENV = dict(os.environ, LLM_BACKEND="fake", FAKE_LLM_LATENCY="0", RESPONSE_CACHE="0",
+           RATE_LIMIT_PER_MINUTE="0", UPSTREAM_TOKENS_PER_MINUTE="0")
+
+
+def import_time():
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=backend_server.BACKEND_DIR, env=ENV,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def server_times(port):
+    proc, base, health = backend_server.start(port, ENV)
+    try:
+        t = time.perf_counter()
+        requests.post(f"{base}/chat", json={"message": "How do I run a PERMANOVA?"}, timeout=60).raise_for_status()
+        first_chat = time.perf_counter() - t
+    finally:
+        backend_server.stop(proc)
+    return health["first_response"], health["ready"], first_chat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend cold-start time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A file rather than ":memory:": the shared state opens more than one connection to it
+        ENV["LOG_DB_PATH"] = os.path.join(tmp, "shared.db")
+        imports = [import_time() for _ in range(args.runs)]
+        servers = [server_times(args.port) for _ in range(args.runs)]
+    ms = lambda values: round(statistics.median(values) * 1000, 1)  # noqa: E731
+    result = {
+        "runs": args.runs,
+        "import_main_ms": ms(imports),
+        "health_first_response_ms": ms([s[0] for s in servers]),
+        "health_ready_ms": ms([s[1] for s in servers]),
+        "first_chat_ms": ms([s[2] for s in servers]),
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    for key, value in result.items():
+        print(f"{key:<26} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backend and the scripts import their modules by bare name, as when run from their own directory
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+
+@pytest.fixture(scope="session")
+def app_client(tmp_path_factory):
+    """The app on the fake model with its state in a temp dir, shared by the tests that need it."""
+    state_dir = tmp_path_factory.mktemp("app")
+    os.environ.update({
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY": "0",
+        "LOG_DB_PATH": str(state_dir / "shared.db"),
+        "ADMIN_PASSWORD": "test",
+        "KB_RELOAD_INTERVAL": "0",
+        "RATE_LIMIT_PER_MINUTE": "0",
+        "UPSTREAM_TOKENS_PER_MINUTE": "0",
+    })
+    os.environ.pop("SHARED_STATE_URL", None)
+    import main
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as client:
+        deadline = time.time() + 30
+        while client.get("/health").status_code != 200 and time.time() < deadline:
+            time.sleep(0.05)
+        yield client
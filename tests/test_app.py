@@ -0,0 +1,121 @@
+import threading
+import time
+
+def test_opening_lookup_is_answered_from_the_reference(app_client):
+    body = app_client.post("/chat", json={"message": "What are the arguments of GetDAMs?"}).json()
+    assert body["signature"] == "GetDAMs"
+
+
+def test_troubleshooting_question_goes_to_the_model(app_client):
+    body = app_client.post("/chat", json={"message": "Why does GetDAMs fail with an argument error?"}).json()
+    assert "signature" not in body
+    assert body["response"].startswith("(fake answer")
+
+
+def test_lookup_mid_conversation_goes_to_the_model(app_client):
+    session_id = app_client.post("/chat", json={"message": "How do I find differential metabolites?"}).json()["session_id"]
+    body = app_client.post("/chat", json={"message": "arguments of GetDAMs", "session_id": session_id}).json()
+    assert "signature" not in body
+    assert body["session_id"] == session_id
+    # Grounded in the one reference record rather than retrieved chunks
+    assert body["prompt"]["docs"]["tokens"] > 0
+
+
+def set_limits(client, **limits):
+    assert client.post("/admin/limits", json=dict(limits, password="test")).status_code == 200
+
+
+def test_rejections_say_which_limit_applied(app_client):
+    try:
+        set_limits(app_client, requests_per_minute=0.01, burst=1)
+        assert app_client.post("/chat", json={"message": "What is eCOMET?"}).status_code == 200
+        response = app_client.post("/chat/stream", json={"message": "What is eCOMET?"})
+        assert response.status_code == 429
+        assert response.headers["X-Limit-Scope"] == "client"
+        assert int(response.headers["Retry-After"]) > 60
+
+        set_limits(app_client, requests_per_minute=0, upstream_tokens_per_minute=1)
+        app_client.post("/chat", json={"message": "How do I install eCOMET?"})
+        response = app_client.post("/chat", json={"message": "How do I load my data?"})
+        assert response.status_code == 503
+        assert response.headers["X-Limit-Scope"] == "upstream"
+    finally:
+        set_limits(app_client, requests_per_minute=0, upstream_tokens_per_minute=0)
+
+
+def test_chat_during_warm_up_waits_without_blocking_the_loop(app_client, monkeypatch):
+    import main
+    import reloader
+
+    # A fresh, unbuilt knowledge state whose index build is slow, as on a cold start
+    state = main.KNOWLEDGE._state()
+    monkeypatch.setattr(main.KNOWLEDGE, "state", state)
+    build = reloader.Retriever.from_records
+    monkeypatch.setattr(reloader.Retriever, "from_records", staticmethod(lambda records: time.sleep(1.5) or build(records)))
+    app_client.portal.call(main.STARTUP["ready"].clear)
+    try:
+        warming = threading.Thread(target=state.warm)
+        warming.start()
+        time.sleep(0.1)
+        replies = []
+        asking = threading.Thread(target=lambda: replies.append(
+            app_client.post("/chat", json={"message": "Which functions normalize peak areas?"})))
+        asking.start()
+        time.sleep(0.2)
+
+        start = time.perf_counter()
+        assert app_client.get("/health").status_code == 503
+        assert time.perf_counter() - start < 0.5
+
+        warming.join()
+        app_client.portal.call(main.STARTUP["ready"].set)
+        asking.join()
+        assert replies[0].status_code == 200
+    finally:
+        app_client.portal.call(main.STARTUP["ready"].set)
+
+
+def test_chat_gives_up_on_a_long_warm_up(app_client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "STARTUP_WAIT", 0.05)
+    app_client.portal.call(main.STARTUP["ready"].clear)
+    try:
+        response = app_client.post("/chat/stream", json={"message": "What is eCOMET?"})
+        assert response.status_code == 503
+        assert response.headers["X-Limit-Scope"] == "starting"
+    finally:
+        app_client.portal.call(main.STARTUP["ready"].set)
+
+
+def test_shared_reads_stay_off_the_event_loop(app_client, monkeypatch):
+    import main
+
+    loop_thread = app_client.portal.call(threading.get_ident)
+    reads = []
+
+    def watch(obj, name):
+        read = getattr(obj, name)
+
+        def watched(*args, **kwargs):
+            reads.append((name, threading.get_ident() == loop_thread))
+            return read(*args, **kwargs)
+
+        monkeypatch.setattr(obj, name, watched)
+
+    watch(main.SHARED, "get_config")
+    watch(main.SHARED, "get_session")
+    watch(main.RESPONSE_CACHE.store, "get")
+
+    session_id = app_client.post("/chat", json={"message": "How do I filter low-intensity features?"}).json()["session_id"]
+    app_client.post("/chat/stream", json={"message": "And how do I pick the threshold?", "session_id": session_id})
+    app_client.get("/admin/limits", params={"password": "test"})
+    # The opening question is looked up in the store, the follow-up's session is loaded
+    assert {name for name, _ in reads} == {"get_config", "get_session", "get"}
+    assert [name for name, on_loop in reads if on_loop] == []
+
+
+def test_admin_limits_say_which_limits_are_per_worker(app_client):
+    limits = app_client.get("/admin/limits", params={"password": "test"}).json()["limits"]
+    assert limits["per_worker"] == ["max_concurrency", "max_queue"]
+    assert set(limits["per_worker"]) <= set(limits)
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import artifacts
+import reloader
+from knowledge import KnowledgeSource, make_record, write_knowledge_base
+from reloader import KnowledgeReloader
+
+
+def publish(path, usage="GetDAMs(mmo, group)"):
+    records = [
+        make_record("reference", "GetDAMs", "https://example.org/reference/GetDAMs.html",
+                    description="Find differentially accumulated metabolites.", usage=usage),
+        make_record("reference", "PCAplot", "https://example.org/reference/PCAplot.html", usage="PCAplot(mmo, color)"),
+    ]
+    return write_knowledge_base(records, str(path))
+
+
+@pytest.fixture
+def source(tmp_path):
+    publish(tmp_path / "ecomet_kb.jsonl")
+    return KnowledgeSource(records_path=str(tmp_path / "ecomet_kb.jsonl"), text_path=str(tmp_path / "none.txt"))
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Count index builds (as opposed to loads from the artifact)."""
+    counts = {"retriever": 0}
+    build = reloader.Retriever.from_records
+
+    def counting(records):
+        counts["retriever"] += 1
+        return build(records)
+
+    monkeypatch.setattr(reloader.Retriever, "from_records", staticmethod(counting))
+    return counts
+
+
+def warm(source):
+    knowledge = KnowledgeReloader(source, interval=0)
+    asyncio.run(knowledge.warm())
+    return knowledge.state
+
+
+def test_cold_start_builds_once_then_loads_the_artifact(source, builds):
+    first = warm(source)
+    assert builds["retriever"] == 1
+    path = artifacts.artifacts_path(source)
+    assert path.endswith("ecomet_kb.artifacts.pkl")
+
+    second = warm(source)
+    assert builds["retriever"] == 1
+    assert second.signatures.get("GetDAMs").usage == first.signatures.get("GetDAMs").usage
+    assert [c.title for c in second.retriever.chunks] == [c.title for c in first.retriever.chunks]
+
+
+def test_artifact_for_another_version_is_rebuilt_and_replaced(source, builds, tmp_path):
+    warm(source)
+    version = publish(tmp_path / "ecomet_kb.jsonl", usage="GetDAMs(mmo, group, p_value = 0.05)")
+    state = warm(source)
+    assert builds["retriever"] == 2
+    assert state.version == version
+    assert "p_value" in state.signatures.get("GetDAMs").usage
+    # The rewritten artifact matches the new version, so the next start loads it
+    warm(source)
+    assert builds["retriever"] == 2
+
+
+def test_artifact_from_other_code_is_ignored(source, builds, monkeypatch):
+    warm(source)
+    monkeypatch.setattr(artifacts, "code_version", lambda: "changed-code")
+    warm(source)
+    assert builds["retriever"] == 2
+
+
+def test_unreadable_artifact_falls_back_to_building(source, builds):
+    warm(source)
+    with open(artifacts.artifacts_path(source), "wb") as f:
+        f.write(b"not a pickle")
+    state = warm(source)
+    assert builds["retriever"] == 2
+    assert state.signatures.get("PCAplot") is not None
+
+
+def test_read_only_artifact_location_still_serves(source, builds, monkeypatch):
+    def read_only(*args):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(artifacts, "save", read_only)
+    assert warm(source).signatures.get("GetDAMs") is not None
+    assert warm(source).signatures.get("GetDAMs") is not None
+    assert builds["retriever"] == 2
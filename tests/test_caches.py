@@ -0,0 +1,148 @@
+import asyncio
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from context_cache import ContextCache
+from response_cache import ResponseCache, SQLiteResponseStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteResponseStore(str(tmp_path / "responses.db"))
+
+
+def test_new_version_drops_old_entries(store):
+    cache = ResponseCache(store=store)
+    cache.put("How do I install eCOMET?", "v1", "old answer", 1.0)
+    assert cache.get("How do I install eCOMET?", "v1") == "old answer"
+    assert cache.get("How do I install eCOMET?", "v2") is None
+    store.flush()
+    assert store.get("how do i install ecomet", "v1") is None
+
+
+def test_stale_request_neither_reads_nor_switches_back(store):
+    cache = ResponseCache(store=store)
+    cache.put("How do I install eCOMET?", "v2", "new answer", 1.0, current="v2")
+    # A request that took v1 before the reload finishes after it
+    assert cache.get("How do I install eCOMET?", "v1", current="v2") is None
+    cache.put("How do I install eCOMET?", "v1", "old answer", 1.0, current="v2")
+    assert cache.version == "v2"
+    assert cache.get("How do I install eCOMET?", "v2", current="v2") == "new answer"
+    # Other workers' entries for the new version survive too
+    store.flush()
+    assert store.get("how do i install ecomet", "v2").answer == "new answer"
+    assert cache.stats()["stale_version_skips"] == 2
+
+
+def test_entries_are_shared_through_the_store(store):
+    ResponseCache(store=store).put("What does ReplaceZero do?", "v1", "shared answer", 2.0)
+    store.flush()
+    other_worker = ResponseCache(store=SQLiteResponseStore(store.path))
+    assert other_worker.get("what does replacezero do", "v1") == "shared answer"
+
+
+def test_store_writes_do_not_wait_for_a_locked_file(store):
+    # Another worker holds the write lock
+    holder = sqlite3.connect(store.path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    cache = ResponseCache(store=store)
+    start = time.perf_counter()
+    cache.put("What does ReplaceZero do?", "v1", "answer", 1.0)
+    assert cache.get("What does ReplaceZero do?", "v1") == "answer"
+    assert time.perf_counter() - start < 0.5
+    holder.execute("COMMIT")
+    store.flush()
+    assert store.get("what does replacezero do", "v1").answer == "answer"
+
+
+def test_evicted_entries_stay_in_the_store_for_other_workers(store):
+    cache = ResponseCache(max_entries=1, store=store)
+    cache.put("How do I install eCOMET?", "v1", "install answer", 1.0)
+    cache.put("What does ReplaceZero do?", "v1", "replace answer", 1.0)
+    assert cache.stats()["entries"] == 1
+    store.flush()
+    assert store.get("how do i install ecomet", "v1").answer == "install answer"
+    # Evicted here, still answered from the store
+    stored = cache.fetch("How do I install eCOMET?", "v1")
+    assert cache.get("How do I install eCOMET?", "v1", stored=stored) == "install answer"
+
+
+def test_expired_entries_are_deleted_from_the_store(store):
+    cache = ResponseCache(ttl_seconds=0, store=store)
+    cache.put("How do I install eCOMET?", "v1", "install answer", 1.0)
+    assert cache.get("How do I install eCOMET?", "v1") is None
+    store.flush()
+    assert store.get("how do i install ecomet", "v1") is None
+
+
+def test_get_reads_the_store_only_through_fetch(store):
+    cache = ResponseCache(store=store)
+    assert cache.get("What does ReplaceZero do?", "v1") is None
+    # Another worker answers it after this one loaded the store
+    other_store = SQLiteResponseStore(store.path)
+    ResponseCache(store=other_store).put("What does ReplaceZero do?", "v1", "shared answer", 2.0)
+    other_store.flush()
+    assert cache.get("What does ReplaceZero do?", "v1") is None
+    stored = cache.fetch("What does ReplaceZero do?", "v1")
+    assert cache.get("What does ReplaceZero do?", "v1", stored=stored) == "shared answer"
+    # Cached here now, so there is nothing to fetch
+    assert cache.fetch("What does ReplaceZero do?", "v1") is None
+
+
+def test_near_duplicates_share_an_answer():
+    cache = ResponseCache(similarity=0.6)
+    cache.put("How do I make a volcano plot?", "v1", "use VolcanoPlot", 1.0)
+    assert cache.get("how can I make a volcano plot", "v1") == "use VolcanoPlot"
+    assert cache.stats()["near_duplicate_hits"] == 1
+
+
+class FakeCachedContent:
+    created = []
+
+    def __init__(self, display_name):
+        self.display_name = display_name
+        self.deleted = False
+        self.usage_metadata = SimpleNamespace(total_token_count=100)
+
+    @classmethod
+    def create(cls, model, display_name, system_instruction, contents, ttl):
+        cached = cls(display_name)
+        cls.created.append(cached)
+        return cached
+
+    def delete(self):
+        self.deleted = True
+
+
+@pytest.fixture
+def fake_caching(monkeypatch):
+    import google.generativeai as genai
+    from google.generativeai import caching
+
+    FakeCachedContent.created = []
+    monkeypatch.setattr(caching, "CachedContent", FakeCachedContent)
+    monkeypatch.setattr(genai.GenerativeModel, "from_cached_content",
+                        classmethod(lambda cls, cached: SimpleNamespace(cached=cached)))
+    return FakeCachedContent
+
+
+def test_context_cache_is_not_switched_back_by_a_stale_request(fake_caching):
+    old = SimpleNamespace(version="v1", text="old knowledge")
+    new = SimpleNamespace(version="v2", text="new knowledge")
+    serving = {"kb": old}
+    cache = ContextCache(current=lambda: serving["kb"])
+
+    async def scenario():
+        assert (await cache.model("m", "persona", old)).cached.display_name == "ecomet-v1"
+        serving["kb"] = new  # hot reload
+        assert (await cache.model("m", "persona", new)).cached.display_name == "ecomet-v2"
+        # A request that took v1 before the reload gets the current cache
+        assert (await cache.model("m", "persona", old)).cached.display_name == "ecomet-v2"
+
+    asyncio.run(scenario())
+    assert [c.display_name for c in fake_caching.created] == ["ecomet-v1", "ecomet-v2"]
+    assert fake_caching.created[0].deleted and not fake_caching.created[1].deleted
+    assert cache.stats()["stale_version_requests"] == 1
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+
+def events(response):
+    """(event, data) pairs of a Server-Sent Events body."""
+    parsed = []
+    for block in response.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+@pytest.fixture
+def main(app_client):
+    import main
+
+    yield main
+    # Every path through the stream gives back its slot and its coalescing entry
+    assert main.CHAT_LIMITER.active == 0
+    assert main.COALESCER.stats()["in_flight"] == 0
+
+
+def test_tokens_then_done(app_client, main):
+    response = app_client.post("/chat/stream", json={"message": "How do I normalize peak areas?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    sent = events(response)
+    assert [event for event, _ in sent[:-1]] == ["token"] * (len(sent) - 1) and len(sent) > 2
+    event, done = sent[-1]
+    assert event == "done"
+    assert done["cached"] is False and done["coalesced"] is False
+    assert done["prompt"]["total"]["tokens"] > 0
+    answer = "".join(data["text"] for _, data in sent[:-1])
+    assert answer.startswith("(fake answer")
+
+
+def test_identical_question_follows_the_stream_in_flight(app_client, main, monkeypatch):
+    async def slow_stream(*args, **kwargs):
+        await asyncio.sleep(0.5)
+        yield "shared"
+        yield " answer"
+
+    monkeypatch.setattr(main.LLM, "stream", slow_stream)
+    message = {"message": "Which scaling does the PCA use?"}
+    responses = {}
+
+    def ask(name):
+        responses[name] = app_client.post("/chat/stream", json=message)
+
+    leader = threading.Thread(target=ask, args=("leader",))
+    leader.start()
+    deadline = time.time() + 5
+    while main.COALESCER.stats()["in_flight"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    followers = main.COALESCER.followers
+    ask("follower")
+    leader.join()
+
+    assert main.COALESCER.followers == followers + 1
+    assert events(responses["leader"])[:2] == [("token", {"text": "shared"}), ("token", {"text": " answer"})]
+    (token, text), (done, data) = events(responses["follower"])
+    assert (token, text) == ("token", {"text": "shared answer"})
+    assert done == "done" and data["coalesced"] is True
+    assert data["prompt"] == events(responses["leader"])[-1][1]["prompt"]
+
+
+def test_backend_failure_ends_with_an_error_event(app_client, main, monkeypatch):
+    async def failing_stream(*args, **kwargs):
+        yield "partial"
+        raise RuntimeError("upstream went away")
+
+    monkeypatch.setattr(main.LLM, "stream", failing_stream)
+    response = app_client.post("/chat/stream", json={"message": "How do I export the network?"})
+    assert response.status_code == 200
+    assert events(response) == [
+        ("token", {"text": "partial"}),
+        ("error", {"detail": "Chat Error: RuntimeError: upstream went away"}),
+    ]
+
+
+def test_client_leaving_mid_stream_releases_the_slot(app_client, main, monkeypatch):
+    from starlette.requests import Request
+
+    async def endless_stream(*args, **kwargs):
+        while True:
+            yield "more"
+            await asyncio.sleep(0)
+
+    monkeypatch.setattr(main.LLM, "stream", endless_stream)
+
+    async def leave_after_first_token():
+        request = Request({"type": "http", "method": "POST", "headers": [], "client": ("127.0.0.1", 1)})
+        response = await main.chat_stream(main.ChatRequest(message="How are the features annotated?"), request)
+        body = response.body_iterator
+        first = await body.__anext__()
+        held = (main.CHAT_LIMITER.active, main.COALESCER.stats()["in_flight"])
+        # What the server does when the client disconnects
+        await body.aclose()
+        return first, held
+
+    first, held = app_client.portal.call(leave_after_first_token)
+    assert first.startswith("event: token")
+    assert held == (1, 1)
@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+import pytest
+
+from coalesce import MicroBatcher, SingleFlight
+
+
+class Upstream:
+    """An async call that counts its invocations and holds until released."""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return f"answer {self.calls}"
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_identical_calls_share_one_upstream_call():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        calls = [asyncio.ensure_future(flight.run("q", upstream)) for _ in range(5)]
+        await settle()
+        assert flight.stats()["in_flight"] == 1
+        upstream.release.set()
+        assert await asyncio.gather(*calls) == ["answer 1"] * 5
+        assert upstream.calls == 1
+        assert flight.stats() == {"in_flight": 0, "upstream_calls": 1, "coalesced": 4, "coalesced_rate": 0.8}
+        # Finished calls aren't reused
+        assert await flight.run("q", upstream) == "answer 2"
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_are_not_joined():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        upstream.release.set()
+        assert await asyncio.gather(flight.run("a", upstream), flight.run("b", upstream)) == ["answer 1", "answer 2"]
+        assert flight.stats()["coalesced"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_an_error_reaches_every_caller_and_is_not_cached():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream(error=RuntimeError("model down"))
+        calls = [asyncio.ensure_future(flight.run("q", upstream)) for _ in range(3)]
+        await settle()
+        upstream.release.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) and str(r) == "model down" for r in results)
+        assert upstream.calls == 1
+
+        upstream.error = None
+        assert await flight.run("q", upstream) == "answer 2"
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_the_leader_still_answers_the_followers():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        leader = asyncio.ensure_future(flight.run("q", upstream))
+        await settle()
+        follower = asyncio.ensure_future(flight.run("q", upstream))
+        await settle()
+        leader.cancel()
+        await settle()
+        upstream.release.set()
+        assert await follower == "answer 1"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_a_follower_leaves_the_call_running():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        leader = asyncio.ensure_future(flight.run("q", upstream))
+        await settle()
+        follower = asyncio.ensure_future(flight.run("q", upstream))
+        await settle()
+        follower.cancel()
+        await settle()
+        upstream.release.set()
+        assert await leader == "answer 1"
+        assert follower.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_streamed_lead_publishes_its_result_or_error():
+    async def scenario():
+        flight = SingleFlight()
+        call = flight.lead("q")
+        waiter = asyncio.ensure_future(flight.wait(flight.follow("q")))
+        flight.finish("q", call, result=("answer", {}))
+        assert await waiter == ("answer", {})
+        # Finishing twice (e.g. again from a finally block) changes nothing
+        flight.finish("q", call, error=RuntimeError("late"))
+        assert flight.follow("q") is None
+
+        call = flight.lead("q")
+        waiter = asyncio.ensure_future(flight.wait(flight.follow("q")))
+        flight.finish("q", call, error=RuntimeError("interrupted"))
+        with pytest.raises(RuntimeError, match="interrupted"):
+            await waiter
+
+    asyncio.run(scenario())
+
+
+def test_batcher_without_a_window_runs_inline():
+    async def scenario():
+        seen = []
+        batcher = MicroBatcher(lambda item: seen.append(item) or item * 2, window=0)
+        assert await batcher.submit(3) == 6
+        assert seen == [3]
+
+    asyncio.run(scenario())
+
+
+def test_batcher_flushes_after_the_window_computing_each_item_once():
+    async def scenario():
+        seen = []
+        batcher = MicroBatcher(lambda item: seen.append(item) or item.upper(), window=0.05)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(batcher.submit(item) for item in ["a", "b", "a", "a"]))
+        assert results == ["A", "B", "A", "A"]
+        assert sorted(seen) == ["a", "b"]
+        assert time.perf_counter() - start >= 0.04
+
+    asyncio.run(scenario())
+
+
+def test_batcher_flushes_a_full_batch_without_waiting():
+    async def scenario():
+        batcher = MicroBatcher(lambda item: item + 1, window=10, max_batch=3)
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(3))), timeout=2)
+        assert results == [1, 2, 3]
+
+    asyncio.run(scenario())
+
+
+def test_batcher_error_reaches_every_caller():
+    async def scenario():
+        def fail(item):
+            raise ValueError(f"bad {item}")
+
+        batcher = MicroBatcher(fail, window=0.01)
+        results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(scenario())
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pytest
+
+import embeddings
+from embeddings import HashingEmbedder, SemanticIndex, load, load_or_build
+from retrieval import Chunk, Retriever, fuse
+
+
+class CountingEmbedder(HashingEmbedder):
+    """The hashing embedder, recording every text it embeds."""
+
+    def __init__(self):
+        super().__init__(dim=64)
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return super().embed(texts)
+
+
+def chunks(*texts):
+    return [Chunk(i, f"chunk {i}", "", "article", text) for i, text in enumerate(texts)]
+
+
+def test_hashing_rows_are_unit_vectors_and_share_stems():
+    matrix = HashingEmbedder().embed(["beta diversity between treatments", "GetBetaDiversity", "install the package"])
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1)
+    assert matrix[0] @ matrix[1] > matrix[0] @ matrix[2]
+
+
+def test_build_embeds_only_chunks_with_a_new_hash():
+    embedder = CountingEmbedder()
+    first = SemanticIndex.build(embedder, chunks("alpha diversity", "beta diversity", "volcano plot"))
+    assert first.embedded == 3
+
+    embedder.embedded.clear()
+    second = SemanticIndex.build(embedder, chunks("alpha diversity", "PCA plot", "volcano plot"), first)
+    assert embedder.embedded == ["chunk 1\nPCA plot"]
+    assert second.embedded == 1
+    assert np.array_equal(second.matrix[0], first.matrix[0])
+    assert np.array_equal(second.matrix[2], first.matrix[2])
+    # Same chunks: nothing to do
+    assert SemanticIndex.build(embedder, chunks("alpha diversity", "PCA plot", "volcano plot"), second) is second
+
+
+def test_build_with_another_embedder_embeds_everything():
+    previous = SemanticIndex.build(CountingEmbedder(), chunks("alpha", "beta"))
+    other = HashingEmbedder(dim=32)
+    rebuilt = SemanticIndex.build(other, chunks("alpha", "beta"), previous)
+    assert rebuilt.embedded == 2
+    assert rebuilt.matrix.shape == (2, 32)
+
+
+def test_save_and_load_round_trip_memory_mapped(tmp_path):
+    path = str(tmp_path / "ecomet_kb.vectors.json")
+    embedder = CountingEmbedder()
+    index = SemanticIndex.build(embedder, chunks("alpha diversity", "beta diversity"))
+    index.save(path)
+
+    loaded = load(path, embedder)
+    assert isinstance(loaded.matrix, np.memmap)
+    assert np.array_equal(np.asarray(loaded.matrix), index.matrix)
+    assert loaded.hashes == index.hashes
+    assert loaded.search("beta", top_k=1)[0][0] == 1
+    # Stored by another embedder, or unreadable: not used
+    assert load(path, HashingEmbedder(dim=32)) is None
+    with open(path, "w") as f:
+        f.write("{")
+    assert load(path, embedder) is None
+
+
+def test_load_or_build_reuses_stored_rows_and_replaces_the_matrix(tmp_path):
+    path = str(tmp_path / "ecomet_kb.vectors.json")
+    embedder = CountingEmbedder()
+    first = load_or_build(path, embedder, chunks("alpha diversity", "beta diversity"))
+    assert first.embedded == 2
+    old_matrix = [name for name in os.listdir(tmp_path) if name.endswith(".npy")]
+
+    embedder.embedded.clear()
+    again = load_or_build(path, embedder, chunks("alpha diversity", "beta diversity"))
+    assert embedder.embedded == [] and again.embedded == 0
+
+    changed = load_or_build(path, embedder, chunks("alpha diversity", "gamma diversity"))
+    assert embedder.embedded == ["chunk 1\ngamma diversity"]
+    assert changed.embedded == 1
+    # One matrix file on disk, named for the new content
+    matrices = [name for name in os.listdir(tmp_path) if name.endswith(".npy")]
+    assert len(matrices) == 1 and matrices != old_matrix
+    assert load(path, embedder).hashes == changed.hashes
+
+
+def test_load_or_build_still_serves_when_the_directory_is_read_only(tmp_path, monkeypatch):
+    def read_only(*args, **kwargs):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(embeddings, "write_atomic", read_only)
+    index = load_or_build(str(tmp_path / "kb.vectors.json"), CountingEmbedder(), chunks("alpha", "beta"))
+    assert len(index) == 2
+
+
+def test_rrf_ranks_agreement_first():
+    bm25 = [(1, 9.0), (2, 5.0), (3, 1.0)]
+    cosine = [(2, 0.9), (4, 0.8), (1, 0.1)]
+    fused = [doc_id for doc_id, _ in fuse([bm25, cosine])]
+    # Found by both rankings beats found by one; among those, the better combined rank wins
+    assert fused[:2] == [2, 1]
+    assert set(fused[2:]) == {3, 4}
+
+
+def test_rrf_breaks_ties_by_id():
+    fused = fuse([[(5, 1.0), (3, 0.5)], [(3, 1.0), (5, 0.5)]])
+    assert [doc_id for doc_id, _ in fused] == [3, 5]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_hybrid_search_finds_what_bm25_misses():
+    retriever = Retriever(chunks("Compare diversity across treatment groups.", "Volcano plot of fold changes."))
+    semantic = SemanticIndex.build(HashingEmbedder(), retriever.chunks)
+    # "diverse" shares no BM25 term with chunk 0 but shares its n-grams
+    assert retriever.search("how diverse", top_k=2) == []
+    assert retriever.search("how diverse", top_k=1, semantic=semantic)[0][0].id == 0
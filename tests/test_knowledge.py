@@ -0,0 +1,39 @@
+from knowledge import KnowledgeBase, make_record, write_knowledge_base
+
+TUTORIAL = "https://phytoecia.github.io/eCOMET/articles/Treatment-based_study_tutorial.html"
+
+
+def tutorial(origin, content):
+    return make_record("article", "Treatment-based study tutorial", TUTORIAL, origin=origin, content=content)
+
+
+def contents(path):
+    kb = KnowledgeBase.load(str(path))
+    return {record["id"]: (record["origin"], record["content"]) for record in kb.records()}
+
+
+def test_newest_origin_wins_an_id_collision(tmp_path):
+    path = tmp_path / "ecomet_kb.jsonl"
+    other = make_record("article", "Installation", "https://example.org/install", origin="scrape_docs", content="install it")
+    write_knowledge_base([tutorial("scrape_docs", "truncated tutorial..."), other], str(path), origin="scrape_docs")
+    write_knowledge_base([tutorial("scrape_ecomet", "the full tutorial, updated")], str(path), origin="scrape_ecomet")
+    assert contents(path) == {
+        TUTORIAL: ("scrape_ecomet", "the full tutorial, updated"),
+        "https://example.org/install": ("scrape_docs", "install it"),
+    }
+
+    # Next week's update still replaces it
+    write_knowledge_base([tutorial("scrape_ecomet", "the full tutorial, v2")], str(path), origin="scrape_ecomet")
+    assert contents(path)[TUTORIAL] == ("scrape_ecomet", "the full tutorial, v2")
+
+    # And the other scraper running again takes it back
+    write_knowledge_base([tutorial("scrape_docs", "truncated tutorial..."), other], str(path), origin="scrape_docs")
+    assert contents(path)[TUTORIAL] == ("scrape_docs", "truncated tutorial...")
+
+
+def test_rewriting_the_same_records_keeps_the_version(tmp_path):
+    path = str(tmp_path / "ecomet_kb.jsonl")
+    write_knowledge_base([tutorial("scrape_docs", "docs")], path, origin="scrape_docs")
+    ecomet = [make_record("reference", "GetDAMs", "https://example.org/GetDAMs", origin="scrape_ecomet", usage="GetDAMs(mmo)")]
+    first = write_knowledge_base(ecomet, path, origin="scrape_ecomet")
+    assert write_knowledge_base(ecomet, path, origin="scrape_ecomet") == first
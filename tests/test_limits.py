@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from limits import ConcurrencyLimiter, LimitSettings, RateLimiter, client_address
+from session_store import SessionStore
+
+
+def test_client_address_ignores_forwarded_for_unless_proxies_are_trusted():
+    assert client_address("10.0.0.1", ["1.2.3.4"]) == "10.0.0.1"
+    assert client_address(None, []) == "unknown"
+
+
+def test_client_address_takes_the_entry_the_trusted_proxy_appended():
+    # The client sent "6.6.6.6" itself; the proxy appended the address it saw
+    assert client_address("10.0.0.1", ["6.6.6.6, 203.0.113.7"], trusted_proxies=1) == "203.0.113.7"
+    assert client_address("10.0.0.1", ["6.6.6.6", "203.0.113.7"], trusted_proxies=1) == "203.0.113.7"
+
+
+def test_client_address_rotating_forged_entries_keep_one_key():
+    keys = {client_address("10.0.0.1", [f"9.9.9.{i}, 203.0.113.7"], trusted_proxies=1) for i in range(20)}
+    assert keys == {"203.0.113.7"}
+
+
+def test_client_address_with_several_trusted_proxies():
+    header = ["6.6.6.6, 203.0.113.7, 10.1.1.1"]
+    assert client_address("10.0.0.1", header, trusted_proxies=2) == "203.0.113.7"
+    # Fewer entries than proxies means the header didn't come through them; use the peer
+    assert client_address("10.0.0.1", ["203.0.113.7"], trusted_proxies=2) == "10.0.0.1"
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_only_issued_sessions_are_known(shared, tmp_path):
+    backend = None
+    if shared:
+        from shared_state import SQLiteState
+
+        backend = SQLiteState(str(tmp_path / "state.db"))
+    sessions = SessionStore(shared=backend)
+    assert not sessions.known("made-up-by-the-client")
+    session = sessions.get("made-up-by-the-client")
+    assert session.id != "made-up-by-the-client"
+    sessions.append(session, "question", "answer")
+    assert sessions.known(session.id)
+    assert sessions.get(session.id).turns == [("user", "question"), ("model", "answer")]
+
+
+def test_limit_settings_coerce_numbers_sent_as_strings_or_floats():
+    settings = LimitSettings().updated(requests_per_minute="30", burst=5.0, max_queue="8")
+    assert settings.requests_per_minute == 30.0
+    assert settings.burst == 5 and isinstance(settings.burst, int)
+    assert settings.max_queue == 8
+
+
+@pytest.mark.parametrize("changes", [
+    {"burst": "many"},
+    {"burst": 2.5},
+    {"burst": True},
+    {"requests_per_minute": None},
+    {"requests_per_minute": float("nan")},
+    {"key": 1},
+    {"max_queue": -1},
+])
+def test_limit_settings_reject_bad_values_with_value_error(changes):
+    with pytest.raises(ValueError):
+        LimitSettings().updated(**changes)
+
+
+@pytest.mark.parametrize("stored", ["{not json", "[1, 2]", json.dumps({"burst": "many"}), json.dumps({"nope": 1})])
+def test_sync_falls_back_to_the_defaults_on_unreadable_stored_limits(stored, tmp_path):
+    from shared_state import SQLiteState
+
+    shared = SQLiteState(str(tmp_path / "state.db"))
+    limiter = RateLimiter(shared, LimitSettings(burst=3), ConcurrencyLimiter(8, 32))
+    shared.set_config("limits", json.dumps({"burst": 7}))
+    assert limiter.sync().burst == 7
+    shared.set_config("limits", stored)
+    assert limiter.sync() == LimitSettings(burst=3)
+    # A good update replaces the bad config
+    limiter.update(burst=4)
+    assert limiter.sync().burst == 4
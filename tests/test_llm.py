@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from llm import CircuitBreaker, ResilientBackend, Unavailable
+
+HANG = object()
+
+
+class StubProvider:
+    """Plays back one outcome per call: an answer, an exception to raise, or HANG to wait forever."""
+
+    label = "stub"
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def configure(self, system_prompt):
+        pass
+
+    async def _next(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if outcome is HANG:
+            await asyncio.Event().wait()
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    async def generate(self, system_prompt, prompt, knowledge=None, history=None):
+        return await self._next()
+
+    async def stream(self, system_prompt, prompt, knowledge=None, history=None):
+        answer = await self._next()
+        for word in answer.split():
+            yield word
+
+
+def resilient(provider):
+    # One failure opens the circuit, and it is half-open again at once
+    return ResilientBackend([provider], retries=0, failure_threshold=1, reset_timeout=0)
+
+
+def open_circuit(llm):
+    with pytest.raises(Unavailable):
+        asyncio.run(llm.generate("persona", "question"))
+    assert llm.breakers["stub"].opened_at is not None
+
+
+def test_breaker_opens_and_trial_success_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_open_circuit_short_circuits():
+    llm = ResilientBackend([StubProvider(api_exceptions.ServiceUnavailable("down"))], retries=0,
+                           failure_threshold=1, reset_timeout=60)
+    with pytest.raises(Unavailable):
+        asyncio.run(llm.generate("persona", "question"))
+    with pytest.raises(Unavailable):
+        asyncio.run(llm.generate("persona", "question"))
+    assert llm.providers[0].calls == 1
+
+
+def test_non_transient_error_during_trial_releases_it():
+    provider = StubProvider(api_exceptions.ServiceUnavailable("down"), ValueError("bad request"), "recovered")
+    llm = resilient(provider)
+    open_circuit(llm)
+    with pytest.raises(ValueError):
+        asyncio.run(llm.generate("persona", "question"))
+    assert llm.breakers["stub"].state == "half_open"
+    assert asyncio.run(llm.generate("persona", "question")) == "recovered"
+    assert llm.breakers["stub"].state == "closed"
+
+
+def test_stream_closed_during_trial_releases_it():
+    provider = StubProvider(api_exceptions.ServiceUnavailable("down"), "a long answer", "recovered")
+    llm = resilient(provider)
+    open_circuit(llm)
+
+    async def read_one_and_close():
+        stream = llm.stream("persona", "question")
+        first = await stream.__anext__()
+        await stream.aclose()  # the client went away
+        return first
+
+    assert asyncio.run(read_one_and_close()) == "a"
+    assert asyncio.run(llm.generate("persona", "question")) == "recovered"
+
+
+def test_cancelled_trial_releases_it():
+    provider = StubProvider(api_exceptions.ServiceUnavailable("down"), HANG, "recovered")
+    llm = resilient(provider)
+    open_circuit(llm)
+
+    async def cancel_trial():
+        task = asyncio.create_task(llm.generate("persona", "question"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert asyncio.run(llm.generate("persona", "question")) == "recovered"
+
+
+def test_abandoned_call_outside_a_trial_leaves_the_circuit_alone():
+    provider = StubProvider(ValueError("bad request"), "fine")
+    llm = resilient(provider)
+    with pytest.raises(ValueError):
+        asyncio.run(llm.generate("persona", "question"))
+    breaker = llm.breakers["stub"]
+    assert breaker.state == "closed" and breaker.failures == 0
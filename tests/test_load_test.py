@@ -0,0 +1,96 @@
+import argparse
+import json
+import socket
+import sys
+
+import pytest
+
+import load_test
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert load_test.percentile(values, 50) == 50
+    assert load_test.percentile(values, 95) == 95
+    assert load_test.percentile(values, 100) == 100
+    assert load_test.percentile([7], 99) == 7
+    assert load_test.percentile([], 50) is None
+
+
+def test_metric_sums_every_labelled_sample():
+    text = "\n".join([
+        "# HELP chat_prompt_bytes Bytes per prompt.",
+        "chat_prompt_bytes_count 3",
+        'chat_requests_total{endpoint="chat",outcome="ok"} 5',
+        'chat_requests_total{endpoint="chat",outcome="cached"} 2',
+        "chat_requests_total_created 1.7e9",
+    ])
+    assert load_test.metric(text, "chat_requests_total") == 7
+    assert load_test.metric(text, "chat_prompt_bytes_count") == 3
+    assert load_test.metric(text, "missing") == 0
+
+
+def test_schedule_interleaves_by_weight():
+    plan = load_test.schedule({"chat": 3, "health": 1}, 8)
+    assert plan == ["chat", "chat", "chat", "health"] * 2
+
+
+def test_parse_mix():
+    assert load_test.parse_mix("chat=8,logs=1,health") == {"chat": 8, "logs": 1, "health": 1}
+    with pytest.raises(argparse.ArgumentTypeError):
+        load_test.parse_mix("chat=1,admin=1")
+
+
+def test_summarize_separates_rejections_from_errors():
+    samples = [{"status": 200, "latency": 0.1 * i, "first_token": None} for i in range(1, 5)]
+    samples += [{"status": 503, "latency": 0.0, "first_token": None}, {"status": 500, "latency": 0.0, "first_token": None}]
+    row = load_test.summarize(samples)
+    assert (row["count"], row["ok"], row["rejected"], row["errors"]) == (6, 4, 1, 1)
+    assert row["p50_ms"] == 200.0
+    assert "first_token_p50_ms" not in row
+
+
+def level(concurrency, rps, p95, prompt_bytes=1000):
+    return {
+        "concurrency": concurrency,
+        "rps": rps,
+        "endpoints": {"chat": {"p95_ms": p95, "p99_ms": p95}},
+        "prompt_bytes_per_call": prompt_bytes,
+    }
+
+
+def test_compare_flags_regressions_beyond_the_tolerance():
+    baseline = {"levels": [level(1, 10.0, 100.0), level(4, 30.0, 120.0)]}
+    within = {"levels": [level(1, 9.0, 115.0), level(4, 28.0, 130.0), level(16, 1.0, 999.0)]}
+    assert load_test.compare(within, baseline, 0.2) == []
+
+    worse = {"levels": [level(1, 7.0, 100.0), level(4, 30.0, 150.0, prompt_bytes=1300)]}
+    problems = load_test.compare(worse, baseline, 0.2)
+    assert problems == [
+        "concurrency 1: 7.0 req/s vs 10.0 baseline",
+        "concurrency 4: chat p95_ms 150.0 vs 120.0 baseline",
+        "concurrency 4: chat p99_ms 150.0 vs 120.0 baseline",
+        "concurrency 4: 1300 prompt bytes per call vs 1000 baseline",
+    ]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_benchmark_runs_end_to_end_and_compares_against_itself(tmp_path, monkeypatch, capsys):
+    output = tmp_path / "bench.json"
+    argv = ["load_test.py", "--port", str(free_port()), "--latency", "0", "--levels", "1", "2",
+            "--requests", "10", "--stream", "--output", str(output), "--json"]
+    monkeypatch.setattr(sys, "argv", argv)
+    load_test.main()
+    result = json.loads(output.read_text())
+    assert [lvl["concurrency"] for lvl in result["levels"]] == [1, 2]
+    for lvl in result["levels"]:
+        chat = lvl["endpoints"]["chat"]
+        assert chat["errors"] == 0 and chat["ok"] == chat["count"]
+        assert chat["first_token_p50_ms"] is not None
+    assert load_test.compare(result, result, 0.0) == []
+    assert json.loads(capsys.readouterr().out)["levels"] == result["levels"]
@@ -0,0 +1,69 @@
+import re
+
+import pytest
+
+from metrics import Registry
+
+SAMPLE_RE = re.compile(r"^(\w+)(\{.*\})? (\S+)$")
+
+
+def scrape(client):
+    """{(name, labels): value} and {name: type} from the /metrics exposition."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples, types = {}, {}
+    for line in response.text.splitlines():
+        if line.startswith("# TYPE "):
+            name, kind = line[len("# TYPE "):].split()
+            types[name] = kind
+        elif not line.startswith("#"):
+            name, labels, value = SAMPLE_RE.match(line).groups()
+            samples[name, labels or ""] = float(value)
+    return samples, types
+
+
+def test_chat_is_counted_and_timed_in_the_scrape(app_client):
+    before, _ = scrape(app_client)
+    assert app_client.post("/chat", json={"message": "How do I annotate the features with SIRIUS?"}).status_code == 200
+    after, types = scrape(app_client)
+
+    def delta(name, labels=""):
+        return after.get((name, labels), 0) - before.get((name, labels), 0)
+
+    assert types["chat_requests_total"] == "counter"
+    assert delta("chat_requests_total", '{endpoint="chat",outcome="ok"}') == 1
+    assert delta("llm_calls_total", '{provider="fake",outcome="ok"}') == 1
+
+    assert types["chat_request_seconds"] == "histogram"
+    assert delta("chat_request_seconds_count", '{endpoint="chat"}') == 1
+    assert delta("chat_request_seconds_sum", '{endpoint="chat"}') > 0
+    buckets = [
+        (labels, value) for (name, labels), value in after.items()
+        if name == "chat_request_seconds_bucket" and labels.startswith('{endpoint="chat",')
+    ]
+    assert buckets[-1] == ('{endpoint="chat",le="+Inf"}', after["chat_request_seconds_count", '{endpoint="chat"}'])
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts)
+    for stage in ("retrieval", "prompt", "model"):
+        assert delta("chat_stage_seconds_count", f'{{stage="{stage}"}}') == 1
+    assert delta("chat_prompt_component_tokens_count", '{component="docs"}') == 1
+
+    assert types["chat_active_requests"] == "gauge"
+    assert after["chat_active_requests", ""] == 0
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, route="a")
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{route="a",le="0.1"} 2',
+        'latency_seconds_bucket{route="a",le="1"} 3',
+        'latency_seconds_bucket{route="a",le="+Inf"} 4',
+        'latency_seconds_sum{route="a"} 3.65',
+        'latency_seconds_count{route="a"} 4',
+    ]
+    assert registry.summary()["latency_seconds"]["a"]["p50"] == 0.1
+    assert registry.summary()["latency_seconds"]["a"]["mean"] == pytest.approx(0.9125)
@@ -0,0 +1,26 @@
+import os
+import socket
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_uvicorn_workers_behave_as_one_service():
+    # Real worker processes on one shared-state file; the check script drives them from outside
+    env = dict(os.environ)
+    env.pop("SHARED_STATE_URL", None)
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "scripts", "multiworker_check.py"), "--workers", "2",
+         "--port", str(free_port())],
+        capture_output=True, text=True, timeout=300, env=env,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    checks = [line for line in result.stdout.splitlines() if line.startswith(("ok", "FAIL"))]
+    assert len(checks) == 5 and all(line.startswith("ok") for line in checks), result.stdout
@@ -0,0 +1,86 @@
+import math
+
+import pytest
+
+from prompt_builder import Budget, PromptBuilder, PromptTooLarge
+
+PERSONA = "p" * 40  # 10 tokens at 4 chars per token
+DOCS = ["a" * 40, "b" * 40]  # most relevant first
+TURNS = [("user", "1" * 40), ("model", "2" * 40), ("user", "3" * 40), ("model", "4" * 40)]
+SUMMARY = "s" * 40
+
+
+def build(**budget):
+    builder = PromptBuilder(Budget(**dict(dict(persona=100, docs=100, history=100, user=100, total=1000), **budget)))
+    return builder.build(PERSONA, "q", docs=DOCS, turns=TURNS, summary=SUMMARY)
+
+
+def test_components_are_measured_at_four_chars_per_token():
+    sizes = build().sizes
+    for component in ("persona", "docs", "user"):
+        assert sizes[component]["tokens"] == math.ceil(sizes[component]["chars"] / 4)
+    # History counts the summary and each turn separately, as they are sent
+    assert sizes["history"]["tokens"] == math.ceil(len("Conversation summary: " + SUMMARY + "\n\n") / 4) + 4 * 10
+    assert sizes["total"]["tokens"] == sum(sizes[c]["tokens"] for c in ("persona", "docs", "history", "user")) == 94
+
+
+@pytest.mark.parametrize("total, trimmed", [
+    (94, {"docs": 0, "history": 0, "summary": 0}),
+    # The least relevant chunk goes first...
+    (84, {"docs": 1, "history": 0, "summary": 0}),
+    (82, {"docs": 2, "history": 0, "summary": 0}),
+    # ...then the oldest question/answer pairs...
+    (62, {"docs": 2, "history": 1, "summary": 0}),
+    (42, {"docs": 2, "history": 2, "summary": 0}),
+    # ...then the summary
+    (26, {"docs": 2, "history": 2, "summary": 1}),
+])
+def test_total_budget_trims_docs_then_oldest_history_then_summary(total, trimmed):
+    prompt = build(total=total)
+    assert prompt.sizes["trimmed"] == trimmed
+    assert prompt.sizes["total"]["tokens"] <= total
+    assert ("b" * 40 in prompt.text) == (trimmed["docs"] == 0)
+    assert ("a" * 40 in prompt.text) == (trimmed["docs"] < 2)
+    kept = [part for turn in prompt.history for part in turn["parts"]]
+    assert kept == [text for _, text in TURNS[2 * trimmed["history"]:]]
+    assert (SUMMARY in prompt.text) == (trimmed["summary"] == 0)
+
+
+def test_persona_and_message_alone_over_the_total_are_rejected():
+    with pytest.raises(PromptTooLarge):
+        build(total=25)
+
+
+def test_each_component_is_held_to_its_own_budget():
+    prompt = build(docs=20, history=40)
+    assert prompt.sizes["docs"]["tokens"] <= 20 and prompt.sizes["history"]["tokens"] <= 40
+    # Only the most relevant chunk fits, and the summary with the newest pair
+    assert prompt.sizes["trimmed"] == {"docs": 1, "history": 1, "summary": 0}
+    assert "a" * 40 in prompt.text and "b" * 40 not in prompt.text
+
+
+def test_message_over_its_budget_is_rejected():
+    builder = PromptBuilder(Budget(user=10))
+    builder.check_message("x" * 20)
+    with pytest.raises(PromptTooLarge):
+        builder.check_message("x" * 40)
+
+
+def test_persona_must_leave_room_for_a_full_message():
+    budget = Budget(persona=100, user=50, total=120)
+    budget.check_persona("p" * 4 * 70)
+    with pytest.raises(PromptTooLarge, match="limit is 100"):
+        budget.check_persona("p" * 4 * 101)
+    with pytest.raises(PromptTooLarge, match="prompt budget"):
+        budget.check_persona("p" * 4 * 71)
+
+
+def test_admin_rejects_a_system_prompt_over_budget(app_client):
+    import main
+
+    before = app_client.get("/admin/system-prompt", params={"password": "test"}).json()["system_prompt"]
+    too_long = "p" * (4 * main.PROMPTS.budget.persona + 4)
+    response = app_client.post("/admin/system-prompt", json={"password": "test", "new_prompt": too_long})
+    assert response.status_code == 413
+    assert "limit is" in response.json()["detail"]
+    assert app_client.get("/admin/system-prompt", params={"password": "test"}).json()["system_prompt"] == before
@@ -0,0 +1,100 @@
+from knowledge import estimate_tokens, make_record
+from retrieval import BM25Index, Chunk, Retriever, _pack, chunk_records, tokenize
+
+R_FILE = """#' Find differentially accumulated metabolites.
+#' @export
+GetDAMs <- function(mmo, group) {
+  mmo
+}
+
+#' Plot a PCA of the features.
+#' @export
+PCAplot <- function(mmo, color) {
+  mmo
+}
+"""
+
+
+def test_tokens_include_identifier_parts():
+    # Stopwords are dropped, from the parts too
+    assert tokenize("How do I use GetDAMs with my_data.frame?") == [
+        "getdams", "get", "da", "ms", "my_data.frame", "data", "frame",
+    ]
+
+
+def test_pack_merges_blocks_up_to_the_budget():
+    blocks = [["a" * 9], ["b" * 9], ["c" * 9]]  # 10 chars each with the newline
+    assert _pack(blocks, 20) == [["a" * 9, "b" * 9], ["c" * 9]]
+    assert _pack(blocks, 30) == [["a" * 9, "b" * 9, "c" * 9]]
+
+
+def test_pack_splits_an_oversized_block_at_lines():
+    lines = [f"line {i:02d}" for i in range(10)]  # 8 chars + newline each
+    pieces = _pack([["short"], lines], 30)
+    assert pieces[0] == ["short"]
+    assert [l for piece in pieces[1:] for l in piece] == lines
+    for piece in pieces:
+        assert sum(len(l) + 1 for l in piece) <= 30
+
+
+def test_article_chunks_break_at_paragraphs():
+    paragraphs = [f"Paragraph {i} " + "word " * 100 for i in range(5)]
+    record = make_record("article", "Tutorial", "https://example.org/tutorial", content="\n\n".join(paragraphs))
+    chunks = chunk_records([record], max_chars=1200)
+    assert len(chunks) > 1
+    assert all(len(c.text) <= 1200 for c in chunks)
+    # No paragraph is cut, and none is lost
+    assert [p.strip() for c in chunks for p in c.text.splitlines()] == [p.strip() for p in paragraphs]
+    assert [c.id for c in chunks] == list(range(len(chunks)))
+
+
+def test_source_chunks_are_function_blocks_titled_with_their_file():
+    record = make_record(
+        "source", "GetDAMs", "https://github.com/Phytoecia/eCOMET/blob/main/R/GetDAMs.R", content=R_FILE,
+    )
+    chunks = chunk_records([record], max_chars=60)
+    assert chunks[0].title == "R/GetDAMs.R: GetDAMs"
+    assert chunks[0].text.startswith("#' Find differentially")
+    assert any(c.text.startswith("#' Plot a PCA") for c in chunks)
+    assert all(c.kind == "source" for c in chunks)
+
+
+def test_identical_pieces_are_indexed_once():
+    notes = [make_record("article", f"Page {i}", f"https://example.org/{i}", content="See the FAQ.") for i in range(3)]
+    assert len(chunk_records(notes)) == 1
+
+
+def test_bm25_ranks_rarer_and_more_frequent_terms_higher():
+    index = BM25Index([
+        tokenize("metabolite metabolite network"),
+        tokenize("metabolite plot"),
+        tokenize("volcano plot"),
+    ])
+    assert [doc_id for doc_id, _ in index.search(tokenize("metabolite"))] == [0, 1]
+    # "volcano" is in one document, "plot" in two: the rarer term decides
+    assert index.search(tokenize("volcano plot"))[0][0] == 2
+    assert index.search(tokenize("plot"), top_k=1) == index.search(tokenize("plot"))[:1]
+    assert index.search(tokenize("unrelated")) == []
+
+
+def test_titles_weigh_in_the_ranking():
+    retriever = Retriever([
+        Chunk(0, "Installation", "", "article", "Run the PCAplot example after installing."),
+        Chunk(1, "PCAplot", "", "reference", "Plot the first two components."),
+    ])
+    assert retriever.search("PCAplot")[0][0].id == 1
+
+
+def test_context_chunks_keep_order_and_skip_what_does_not_fit():
+    big = Chunk(0, "Volcano plot", "", "article", "volcano " * 400)
+    small = Chunk(1, "Volcano colours", "https://example.org/colours", "article", "volcano colours")
+    retriever = Retriever([big, small])
+    assert [c.id for c, _ in retriever.search("volcano")] == [0, 1]
+
+    parts = retriever.context_chunks("volcano", token_budget=10_000)
+    assert parts == [big.render(), small.render()]
+    assert parts[1] == "### Volcano colours\nSource: https://example.org/colours\nvolcano colours"
+    # The most relevant chunk is over the budget; the next one still fits
+    assert retriever.context_chunks("volcano", token_budget=50) == [small.render()]
+    assert estimate_tokens(big.render()) > 50
+    assert retriever.build_context("volcano", token_budget=50) == small.render()
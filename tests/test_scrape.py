@@ -0,0 +1,191 @@
+import base64
+import hashlib
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import scrape_ecomet
+
+REFERENCE_PAGE = """<html><body><main><h1>{name}</h1>
+<div class="ref-description"><p>{text}</p></div>
+<div class="ref-usage"><pre>{name}(x)</pre></div>
+</main></body></html>"""
+
+R_FILE = """#' {text}
+#' @param x Input
+#' @export
+{name} <- function(x) {{
+  x
+}}
+"""
+
+
+class Site:
+    """Docs pages and GitHub contents API responses, with ETags, and a log of what was requested."""
+
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def page(self, path, body, content_type="text/html"):
+        self.pages[path] = (body.encode("utf-8"), content_type)
+
+    def source(self, path, text):
+        sha = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        data = {"sha": sha, "encoding": "base64", "content": base64.b64encode(text.encode("utf-8")).decode()}
+        self.page(f"/api/{path}", json.dumps(data), "application/json")
+        return sha
+
+    def listing(self, files):
+        self.page("/api/R", json.dumps([{"name": name, "sha": sha} for name, sha in files.items()]), "application/json")
+
+    def fetched(self, status=200):
+        """Paths answered with `status` since the last call."""
+        with self.lock:
+            paths = sorted(path for path, code in self.requests if code == status)
+        return paths
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+
+
+@pytest.fixture
+def site():
+    site = Site()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body, content_type = site.pages.get(self.path, (None, None))
+            etag = f'"{hashlib.sha1(body).hexdigest()}"' if body is not None else None
+            if body is None:
+                status = 404
+            elif self.headers.get("If-None-Match") == etag:
+                status = 304
+            else:
+                status = 200
+            with site.lock:
+                site.requests.append((self.path, status))
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+            if status == 200:
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if status == 200:
+                self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def scrape(site, tmp_path, monkeypatch):
+    monkeypatch.setattr(scrape_ecomet, "DOC_PAGES", ["/index.html"])
+    monkeypatch.setattr(scrape_ecomet, "REFERENCE_FUNCTIONS", ["plotPCA.html", "eco.html"])
+    monkeypatch.setattr(scrape_ecomet, "SOURCE_FILES", ["DESCRIPTION"])
+    monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+    paths = {name: tmp_path / name for name in ("kb.txt", "kb.jsonl", "manifest.json")}
+
+    def run():
+        site.reset()
+        monkeypatch.setattr(sys, "argv", [
+            "scrape_ecomet.py", "--docs-url", f"{site.url}/docs", "--github-api", f"{site.url}/api",
+            "--output", str(paths["kb.txt"]), "--records", str(paths["kb.jsonl"]),
+            "--manifest", str(paths["manifest.json"]), "--rate", "0",
+        ])
+        scrape_ecomet.main()
+        return json.loads(paths["manifest.json"].read_text())
+
+    run.paths = paths
+    return run
+
+
+def publish(site, pca="Principal component plot.", runeco="Run the eco model."):
+    site.page("/docs/index.html", "<html><body><main><h1>eCOMET</h1><p>Welcome.</p></main></body></html>")
+    site.page("/docs/reference/plotPCA.html", REFERENCE_PAGE.format(name="plotPCA", text=pca))
+    site.page("/docs/reference/eco.html", REFERENCE_PAGE.format(name="eco", text="Fit eco."))
+    site.source("DESCRIPTION", "Package: eCOMET\nVersion: 0.1.0\n")
+    site.listing({
+        "plotPCA.R": site.source("R/plotPCA.R", R_FILE.format(name="plotPCA", text="Plot a PCA.")),
+        "runeco.R": site.source("R/runeco.R", R_FILE.format(name="runeco", text=runeco)),
+    })
+
+
+def test_first_run_fetches_everything(site, scrape):
+    publish(site)
+    manifest = scrape()
+    assert site.fetched(200) == [
+        "/api/DESCRIPTION", "/api/R", "/api/R/plotPCA.R", "/api/R/runeco.R",
+        "/docs/index.html", "/docs/reference/eco.html", "/docs/reference/plotPCA.html",
+    ]
+    text = scrape.paths["kb.txt"].read_text()
+    assert "Principal component plot." in text and "runeco <- function(x)" in text
+    assert manifest[f"doc:{site.url}/docs/reference/plotPCA.html"]["etag"]
+    assert manifest["src:R/runeco.R"]["sha"] == manifest["listing:R"]["files"][1]["sha"]
+    titles = {json.loads(line)["title"] for line in scrape.paths["kb.jsonl"].read_text().splitlines()}
+    assert {"plotPCA", "runeco"} <= titles
+
+
+def test_unchanged_run_refetches_nothing(site, scrape):
+    publish(site)
+    first = scrape()
+    before = scrape.paths["kb.txt"].read_text()
+    second = scrape()
+    # Pages and the listing come back 304; R files with a known SHA are not requested at all
+    assert site.fetched(200) == []
+    assert site.fetched(304) == [
+        "/api/DESCRIPTION", "/api/R", "/docs/index.html", "/docs/reference/eco.html", "/docs/reference/plotPCA.html",
+    ]
+    assert scrape.paths["kb.txt"].read_text() == before
+    assert second == first
+
+
+def test_partial_rebuild_refetches_only_changed_pages(site, scrape):
+    publish(site)
+    first = scrape()
+    publish(site, pca="Principal component analysis, redrawn.", runeco="Run the eco model, faster.")
+    second = scrape()
+    assert site.fetched(200) == ["/api/R", "/api/R/runeco.R", "/docs/reference/plotPCA.html"]
+
+    text = scrape.paths["kb.txt"].read_text()
+    assert "Principal component analysis, redrawn." in text
+    assert "Run the eco model, faster." in text
+    assert "Principal component plot." not in text
+    # Unchanged sections are reused from the manifest as they were
+    assert second["src:R/plotPCA.R"] == first["src:R/plotPCA.R"]
+    assert second[f"doc:{site.url}/docs/index.html"] == first[f"doc:{site.url}/docs/index.html"]
+    # Changed ones carry their new validators
+    page = f"doc:{site.url}/docs/reference/plotPCA.html"
+    assert second[page]["etag"] != first[page]["etag"]
+    assert second["src:R/runeco.R"]["sha"] != first["src:R/runeco.R"]["sha"]
+    assert second["output_hash"] != first["output_hash"]
+
+
+def test_removed_page_and_file_leave_the_records(site, scrape):
+    publish(site)
+    scrape()
+    del site.pages["/docs/reference/eco.html"]
+    site.listing({"plotPCA.R": site.source("R/plotPCA.R", R_FILE.format(name="plotPCA", text="Plot a PCA."))})
+    manifest = scrape()
+
+    titles = {json.loads(line)["title"] for line in scrape.paths["kb.jsonl"].read_text().splitlines()}
+    assert "plotPCA" in titles
+    assert "eco" not in titles and "runeco" not in titles
+    assert f"doc:{site.url}/docs/reference/eco.html" not in manifest
+    assert "src:R/runeco.R" not in manifest
+    text = scrape.paths["kb.txt"].read_text()
+    assert "Fit eco." not in text and "runeco <- function" not in text
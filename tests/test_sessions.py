@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from knowledge import estimate_tokens
+from session_store import SessionStore
+
+
+@pytest.fixture(params=["memory", "shared"])
+def make_store(request, tmp_path):
+    """SessionStore factory; "shared" ones on the same SQLite file act as separate workers."""
+    def make(**kwargs):
+        if request.param == "memory":
+            return SessionStore(**kwargs)
+        from shared_state import SQLiteState
+
+        return SessionStore(shared=SQLiteState(str(tmp_path / "state.db")), **kwargs)
+
+    return make
+
+
+def test_turns_are_kept_in_model_history_form(make_store):
+    store = make_store()
+    session = store.get(None)
+    store.append(session, "How do I install eCOMET?", "Use remotes::install_github.")
+    again = store.get(session.id)
+    assert again.history() == [
+        {"role": "user", "parts": ["How do I install eCOMET?"]},
+        {"role": "model", "parts": ["Use remotes::install_github."]},
+    ]
+    assert again.tokens == estimate_tokens("How do I install eCOMET?") + estimate_tokens("Use remotes::install_github.")
+
+
+def test_old_turns_are_folded_into_the_summary(make_store):
+    store = make_store(token_budget=60)
+    session = store.get(None)
+    for i in range(6):
+        store.append(session, f"Question {i} about GetDAMs?", "word " * 40)
+    session = store.get(session.id)
+    # Only the latest pair fits the budget; earlier questions survive as the summary
+    assert [text for role, text in session.turns if role == "user"] == ["Question 5 about GetDAMs?"]
+    assert session.summary.startswith("Earlier the user asked: Question 0 about GetDAMs?")
+    assert "Question 4 about GetDAMs?" in session.summary
+    assert session.compactions == 5
+    assert session.tokens == estimate_tokens("Question 5 about GetDAMs?") + estimate_tokens("word " * 40)
+
+
+def test_summary_keeps_the_most_recent_questions_within_its_budget(make_store):
+    store = make_store(token_budget=1, summary_tokens=10)
+    session = store.get(None)
+    for i in range(20):
+        store.append(session, f"Question number {i}", "answer")
+    assert len(session.summary) <= len("Earlier the user asked: ...") + 40
+    assert session.summary.endswith("Question number 18")
+
+
+def test_expired_sessions_start_over(make_store):
+    store = make_store(ttl_seconds=0.05)
+    session = store.get(None)
+    store.append(session, "question", "answer")
+    time.sleep(0.1)
+    fresh = store.get(session.id)
+    assert fresh.id != session.id
+    assert fresh.turns == []
+    assert not store.known(session.id)
+
+
+def test_least_recently_used_sessions_are_evicted_in_memory():
+    store = SessionStore(max_sessions=2)
+    first, second = store.get(None), store.get(None)
+    store.get(first.id)  # first is now the most recent
+    store.get(None)
+    assert store.known(first.id)
+    assert not store.known(second.id)
+    assert store.stats()["evictions"] == 1
+
+
+def test_a_conversation_continues_on_another_worker(tmp_path):
+    from shared_state import SQLiteState
+
+    path = str(tmp_path / "state.db")
+    one, two = SessionStore(shared=SQLiteState(path)), SessionStore(shared=SQLiteState(path))
+    session = one.get(None)
+    one.append(session, "What does GetDAMs return?", "A table of DAMs.")
+    followed = two.get(session.id)
+    assert followed.turns == [("user", "What does GetDAMs return?"), ("model", "A table of DAMs.")]
+    two.append(followed, "And its arguments?", "data, group, ...")
+    assert len(one.get(session.id).turns) == 4
+    assert len(one) == len(two) == 1
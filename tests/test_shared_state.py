@@ -0,0 +1,127 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from response_cache import CacheEntry, ResponseCache
+from shared_state import RedisState, SQLiteState
+
+
+@pytest.fixture
+def sqlite_state(tmp_path):
+    return SQLiteState(str(tmp_path / "state.db"))
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def worker(request, tmp_path, monkeypatch):
+    """Make another worker's view of one shared state: a SQLite file, or one (fake) Redis server."""
+    if request.param == "sqlite":
+        path = str(tmp_path / "state.db")
+        return lambda: SQLiteState(path)
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", classmethod(lambda cls, url: fakeredis.FakeRedis(server=server)))
+    return lambda: RedisState("redis://localhost:6379/0")
+
+
+def test_config_is_shared(worker):
+    a, b = worker(), worker()
+    assert b.get_config("system_prompt", "default") == "default"
+    a.set_config("system_prompt", "You are helpful.")
+    assert b.get_config("system_prompt") == "You are helpful."
+
+
+def test_sessions_are_shared(worker):
+    a, b = worker(), worker()
+    assert b.get_session("abc", 60) is None
+    a.put_session("abc", {"id": "abc", "turns": [["user", "hi"]]}, 60)
+    assert b.get_session("abc", 60) == {"id": "abc", "turns": [["user", "hi"]]}
+    assert b.count_sessions(60) == 1
+
+
+def test_bucket_grants_capacity_then_says_when_to_retry(worker):
+    a, b = worker(), worker()
+    rate = 1 / 60
+    assert a.take("client:x", rate, 2) == (True, 0.0)
+    assert b.take("client:x", rate, 2) == (True, 0.0)
+    allowed, wait = a.take("client:x", rate, 2)
+    assert not allowed
+    assert 50 < wait <= 60
+    # A refund puts a token back
+    b.take("client:x", rate, 2, cost=-1)
+    assert a.take("client:x", rate, 2)[0]
+    # Buckets are independent
+    assert a.take("client:y", rate, 2)[0]
+
+
+def test_bucket_is_atomic_across_workers(worker):
+    workers = [worker() for _ in range(4)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda i: workers[i % 4].take("upstream", 0.001, 50)[0], range(200)))
+    assert sum(results) == 50
+
+
+def test_logs_page_newest_first_and_search(worker):
+    a, b = worker(), worker()
+    now = time.time()
+    a.write_logs([(now + i, str(datetime.fromtimestamp(now + i)), f"question {i}", "answer") for i in range(5)])
+    a.write_logs([(now + 5, str(datetime.fromtimestamp(now + 5)), "how do I install eCOMET", "use remotes")])
+    assert b.count_logs() == 6
+
+    page = b.query_logs(limit=4)
+    assert [item["user"] for item in page["items"]] == ["how do I install eCOMET", "question 4", "question 3", "question 2"]
+    rest = b.query_logs(cursor=page["next_cursor"], limit=4)
+    assert [item["user"] for item in rest["items"]] == ["question 1", "question 0"]
+    assert rest["next_cursor"] is None
+
+    assert [item["user"] for item in b.query_logs(search="install")["items"]] == ["how do I install eCOMET"]
+    since = datetime.fromtimestamp(now + 2.5)
+    assert len(b.query_logs(since=since)["items"]) == 3
+
+
+def test_response_store_is_shared(worker):
+    a, b = worker(), worker()
+    a.responses.clear(keep_version="v1")
+    a.responses.save("v1", CacheEntry("what is ecomet", "an R package", 1.0, 0.5))
+    a.responses.flush()
+    assert b.responses.get("what is ecomet", "v1").answer == "an R package"
+    assert [entry.key for entry in b.responses.load("v1")] == ["what is ecomet"]
+    assert b.responses.get("what is ecomet", "v2") is None
+
+    # A worker on the new version drops the old entries for everyone
+    b.responses.clear(keep_version="v2")
+    b.responses.flush()
+    assert a.responses.load("v1") == []
+
+
+def test_response_cache_misses_fall_through_to_the_store(worker):
+    a, b = worker(), worker()
+    ResponseCache(store=a.responses).put("What is eCOMET?", "v1", "an R package", 1.0)
+    a.responses.flush()
+    other = ResponseCache(store=b.responses)
+    assert other.get("what is ecomet", "v1") == "an R package"
+    assert other.stats()["hits"] == 1
+
+
+def test_reads_do_not_wait_behind_a_blocked_write(sqlite_state):
+    sqlite_state.set_config("system_prompt", "hello")
+    # Another worker holds the file's write lock, so this worker's next write waits on it
+    holder = sqlite3.connect(sqlite_state.path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    writer = threading.Thread(target=sqlite_state.take, args=("client:a", 1.0, 10))
+    writer.start()
+    time.sleep(0.1)
+
+    start = time.perf_counter()
+    assert sqlite_state.get_config("system_prompt") == "hello"
+    assert sqlite_state.get_session("missing", 60) is None
+    assert sqlite_state.count_sessions(60) == 0
+    assert time.perf_counter() - start < 0.5
+
+    holder.execute("COMMIT")
+    writer.join()
@@ -0,0 +1,75 @@
+import pytest
+
+from signatures import SignatureIndex
+
+RECORDS = [
+    {
+        "kind": "reference",
+        "title": "GetDAMs",
+        "usage": "GetDAMs(mmo, group, p_value = 0.05)",
+        "arguments": "- mmo The mmo object\n- group Metadata column to compare",
+        "examples": "dams <- GetDAMs(mmo, 'Treatment')",
+        "description": "Find differentially accumulated metabolites.",
+        "source_url": "https://example.org/reference/GetDAMs.html",
+    },
+    {
+        "kind": "reference",
+        "title": "PCAplot",
+        "usage": "PCAplot(mmo, color)",
+        "arguments": "- mmo The mmo object\n- color Metadata column for colors",
+        "examples": "",
+        "description": "",
+        "source_url": "https://example.org/reference/PCAplot.html",
+    },
+    {
+        "kind": "source",
+        "title": "LoadMMO",
+        "usage": "LoadMMO <- function(path) {",
+        "arguments": "",
+        "examples": "",
+        "description": "",
+        "source_url": "https://github.com/Phytoecia/eCOMET/blob/main/R/io.R",
+    },
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return SignatureIndex.from_records(RECORDS)
+
+
+@pytest.mark.parametrize("message, name", [
+    ("arguments of GetDAMs", "GetDAMs"),
+    ("What are the arguments of GetDAMs?", "GetDAMs"),
+    ("what are the arguments of getdam", "GetDAMs"),
+    ("GetDAMs arguments", "GetDAMs"),
+    ("What arguments does GetDAMs take?", "GetDAMs"),
+    ("show me the usage for `PCAplot()`", "PCAplot"),
+    ("usage and arguments of PCAplot", "PCAplot"),
+    ("how to call LoadMMO", "LoadMMO"),
+    ("How do I use PCAplot?", "PCAplot"),
+])
+def test_plain_lookups_match(index, message, name):
+    assert index.match(message).name == name
+
+
+@pytest.mark.parametrize("message", [
+    "Why does GetDAMs fail with an argument error?",
+    "GetDAMs says argument 'group' is missing, what's wrong?",
+    "How do I use GetDAMs to compare my three treatment groups and plot it?",
+    "my PCAplot usage gives Error in eval: object not found",
+    "What are the arguments of GetDAMs and how do I plot the result?",
+    "I passed the usage from the docs to LoadMMO but it errors",
+    "how do I run a PERMANOVA",
+    "what are the arguments",
+    "arguments of UnknownFunction",
+])
+def test_anything_more_than_a_lookup_goes_to_the_model(index, message):
+    assert index.match(message) is None
+
+
+def test_render_uses_the_record(index):
+    answer = index.get("GetDAMs").render()
+    assert "GetDAMs(mmo, group, p_value = 0.05)" in answer
+    assert "- `group`: Metadata column to compare" in answer
+    assert "LoadMMO(path)" in index.get("loadmmo").render()